@@ -1,13 +1,51 @@
+import asyncio
 import os
+import re
+from contextlib import aclosing
 from datetime import datetime
-from fastapi import APIRouter, HTTPException
-from typing import List
+from email.utils import formatdate, parsedate_to_datetime
+from fastapi import APIRouter, HTTPException, Query, Request, Response, WebSocket, WebSocketDisconnect
+from fastapi.responses import FileResponse
+from app import listing
+from app.follow import follow_file
+from app.lineindex import read_lines
 from app.models import FileInfo
+from app.responses import dumps
+from app.search import collect_files, compile_pattern, search_files
+from app.streaming import ClosingStreamingResponse, send_event, sse_event, sse_response
 from pathlib import Path
 
 router = APIRouter()
 base_path = Path.cwd() / "output"
 
+# 按行读取时每页的最大行数
+MAX_LINES_PER_PAGE = 5000
+# 目录列表每页的最大条目数
+MAX_LIST_PAGE_SIZE = 1000
+# 搜索结果数量的上限
+MAX_SEARCH_RESULTS = 10000
+# 服务器不支持 pathsend 时每次读取发送的字节数
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
+class DownloadResponse(FileResponse):
+    """文件下载响应，Range / If-Range 由 FileResponse 处理。
+
+    ASGI 服务器声明 http.response.pathsend 扩展时整个文件交给服务器发送（可使用 sendfile），
+    否则在线程中按 DOWNLOAD_CHUNK_SIZE 分块读取。
+    """
+    chunk_size = DOWNLOAD_CHUNK_SIZE
+
+def resolve_path(path: str) -> Path:
+    """转换为基础目录下的绝对路径，超出基础目录时抛出 403"""
+    root = base_path.resolve()
+    target_path = (root / path).resolve()
+    if target_path != root and root not in target_path.parents:
+        raise HTTPException(
+            status_code=403,
+            detail="Access to parent directory is not allowed"
+        )
+    return target_path
+
 def get_file_info(path: Path) -> FileInfo:
     """获取文件或目录的信息"""
     stat = path.stat()
@@ -28,19 +66,19 @@ def is_text_file(file_path: str) -> bool:
     }
     return Path(file_path).suffix.lower() in text_extensions
 
-@router.get("/list/{path:path}", response_model=List[FileInfo])
-async def list_directory(path: str = ""):
-    """列出指定目录下的文件和子目录"""
+@router.get("/list/{path:path}")
+async def list_directory(
+    path: str = "",
+    page: int = Query(1, ge=1),
+    limit: int = Query(200, ge=1, le=MAX_LIST_PAGE_SIZE),
+    sort: str = Query("name", pattern="^(name|size|mtime)$", description="排序字段：name / size / mtime"),
+    order: str = Query("asc", pattern="^(asc|desc)$"),
+    name: str | None = Query(None, description="按名称过滤，不区分大小写，支持 * ? 通配符")
+):
+    """分页列出指定目录下的文件和子目录，文件夹始终排在文件前面"""
     try:
         # 转换为绝对路径并进行安全检查
-        target_path = (base_path / path).resolve()
-        
-        # 确保路径不会超出基础目录
-        if not str(target_path).startswith(str(base_path)):
-            raise HTTPException(
-                status_code=403,
-                detail="Access to parent directory is not allowed"
-            )
+        target_path = resolve_path(path)
         
         if not target_path.exists():
             raise HTTPException(
@@ -54,20 +92,30 @@ async def list_directory(path: str = ""):
                 detail="Path is not a directory"
             )
         
-        # 获取目录内容
-        items = []
-        for item in target_path.iterdir():
-            # 跳过隐藏文件
-            if item.name.startswith('.'):
-                continue
-            items.append(get_file_info(item))
-        
-        # 按照文件夹在前，文件在后，然后按名称排序
-        return sorted(
-            items,
-            key=lambda x: (not x.is_dir, x.name.lower())
+        # 扫描和排序在工作线程中完成，结果按目录修改时间缓存
+        entries, total = await listing.list_directory(
+            target_path, sort, order == "desc", name, (page - 1) * limit, limit
         )
-            
+        items = [
+            FileInfo(
+                name=entry.name,
+                path=str(target_path / entry.name),
+                is_dir=entry.is_dir,
+                size=entry.size,
+                modified_time=datetime.fromtimestamp(entry.mtime)
+            )
+            for entry in entries
+        ]
+
+        return {
+            "total": total,
+            "page": page,
+            "limit": limit,
+            "items": items
+        }
+
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -136,6 +184,208 @@ async def read_file(path: str):
             detail=f"Failed to read file: {str(e)}"
         )
 
+@router.get("/lines/{path:path}")
+async def read_file_lines(
+    path: str,
+    start: int = Query(1, alias="from", ge=1, description="起始行号，从 1 开始"),
+    count: int = Query(1000, ge=1, le=MAX_LINES_PER_PAGE, description="读取的行数")
+):
+    """按行分页读取文本文件，适用于很大的日志文件；文件增长后 total_lines 会随之更新"""
+    file_path = resolve_path(path)
+
+    if not file_path.exists():
+        raise HTTPException(
+            status_code=404,
+            detail="File not found"
+        )
+
+    if not file_path.is_file():
+        raise HTTPException(
+            status_code=400,
+            detail="Path is not a file"
+        )
+
+    if not is_text_file(str(file_path)):
+        raise HTTPException(
+            status_code=400,
+            detail="File type not supported"
+        )
+
+    try:
+        page = await asyncio.to_thread(read_lines, file_path, start - 1, count)
+    except OSError as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to read file: {str(e)}"
+        )
+
+    return {
+        "code": 0,
+        "from": start,
+        "count": len(page["lines"]),
+        **page
+    }
+
+def file_etag(stat: os.stat_result) -> str:
+    """由 inode、大小和纳秒级修改时间生成的强 ETag"""
+    return f'"{stat.st_ino:x}-{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+
+def is_not_modified(request: Request, etag: str, stat: os.stat_result) -> bool:
+    """检查条件请求头，有 If-None-Match 时忽略 If-Modified-Since"""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        return "*" in tags or etag in tags
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return int(stat.st_mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+@router.api_route("/download/{path:path}", methods=["GET", "HEAD"])
+async def download_file(path: str, request: Request):
+    """下载任意文件，支持断点续传（Range / If-Range）和缓存校验（ETag / Last-Modified）"""
+    file_path = resolve_path(path)
+
+    try:
+        stat = await asyncio.to_thread(os.stat, file_path)
+    except FileNotFoundError:
+        raise HTTPException(
+            status_code=404,
+            detail="File not found"
+        )
+
+    if not file_path.is_file():
+        raise HTTPException(
+            status_code=400,
+            detail="Path is not a file"
+        )
+
+    etag = file_etag(stat)
+    headers = {
+        "etag": etag,
+        "last-modified": formatdate(stat.st_mtime, usegmt=True),
+        # 产物可能被脚本重新生成，每次使用前都要校验
+        "cache-control": "no-cache",
+    }
+    if is_not_modified(request, etag, stat):
+        return Response(status_code=304, headers=headers)
+
+    return DownloadResponse(
+        file_path,
+        headers=headers,
+        filename=file_path.name,
+        stat_result=stat
+    )
+
+@router.get("/search")
+async def search(
+    q: str = Query(..., min_length=1, description="搜索内容"),
+    regex: bool = Query(False, description="按正则表达式搜索"),
+    ignore_case: bool = Query(False),
+    path: str = Query("", description="只搜索该目录下的文件"),
+    name: str | None = Query(None, description="按文件名过滤，支持 * ? 通配符"),
+    context: int = Query(2, ge=0, le=20, description="匹配行前后各返回的行数"),
+    max_results: int = Query(1000, ge=1, le=MAX_SEARCH_RESULTS)
+):
+    """在文本文件中搜索，以 NDJSON 逐条返回匹配（path、line、text、before、after），最后一行是 summary"""
+    root = resolve_path(path)
+    if not root.is_dir():
+        raise HTTPException(
+            status_code=404,
+            detail="Directory not found"
+        )
+
+    try:
+        pattern, literal = compile_pattern(q, regex, ignore_case)
+    except re.error as e:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid regular expression: {str(e)}"
+        )
+
+    files = await asyncio.to_thread(collect_files, root, is_text_file, name, base_path)
+
+    async def generate():
+        async with aclosing(search_files(root, files, pattern, literal, context, max_results)) as results:
+            async for item in results:
+                yield dumps(item) + b"\n"
+
+    # 客户端断开时立即关闭生成器，取消进程池中排队的分段
+    return ClosingStreamingResponse(
+        generate(),
+        media_type="application/x-ndjson",
+        headers={"X-Accel-Buffering": "no"}
+    )
+
+def resolve_followed_file(path: str) -> Path:
+    """检查要跟踪的文件，不合法时抛出 HTTPException"""
+    file_path = resolve_path(path)
+
+    if not file_path.exists():
+        raise HTTPException(
+            status_code=404,
+            detail="File not found"
+        )
+
+    if not file_path.is_file():
+        raise HTTPException(
+            status_code=400,
+            detail="Path is not a file"
+        )
+
+    if not is_text_file(str(file_path)):
+        raise HTTPException(
+            status_code=400,
+            detail="File type not supported"
+        )
+
+    return file_path
+
+async def follow_sse(events):
+    async for event, data in events:
+        if event == "ping":
+            yield b": ping\n\n"
+        else:
+            yield sse_event(event, data)
+
+@router.get("/follow/{path:path}")
+async def follow(
+    path: str,
+    offset: int | None = Query(None, ge=0, description="起始字节位置，默认从当前末尾开始"),
+    mode: str = Query("lines", pattern="^(lines|bytes)$", description="按完整的行或按文本块推送")
+):
+    """以 Server-Sent Events 推送文件新增的内容（tail -f），事件中的 offset 可用于断线重连"""
+    file_path = resolve_followed_file(path)
+    return sse_response(follow_sse(follow_file(file_path, offset, mode == "lines")))
+
+@router.websocket("/follow/{path:path}")
+async def follow_ws(
+    websocket: WebSocket,
+    path: str,
+    offset: int | None = Query(None, ge=0),
+    mode: str = Query("lines", pattern="^(lines|bytes)$")
+):
+    """通过 WebSocket 推送文件新增的内容，参数与 SSE 接口相同"""
+    await websocket.accept()
+    try:
+        file_path = resolve_followed_file(path)
+    except HTTPException as e:
+        await send_event(websocket, "error", {"detail": e.detail})
+        await websocket.close(code=1008)
+        return
+
+    events = follow_file(file_path, offset, mode == "lines")
+    try:
+        async for event, data in events:
+            await send_event(websocket, event, data)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        await events.aclose()
+
 @router.get("/info/{path:path}", response_model=FileInfo)
 async def get_path_info(path: str):
     """获取文件或目录的详细信息"""
@@ -190,6 +440,7 @@ async def delete_file(path: str):
         
         # 删除文件
         file_path.unlink()
+        listing.invalidate(file_path.parent)
         
         return {
             "code": 0,
@@ -1,90 +1,475 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, WebSocket
 import aiosqlite
-from app.database import get_db
-from app.models import Log
+import csv
+import io
+import re
+from contextlib import nullcontext
+from pydantic import ValidationError
+from app import database
+from app.database import get_db, db_connection
+from app.partitions import PARTITION_SCHEMA, partition_enabled, overlapping_partitions, attach_partition
+from app.fingerprint import log_fingerprint
+from app.ingest import iter_json_array, iter_ndjson
+from app.pagination import resolve_keyset, page_cursors
+from app.responses import FastJSONResponse, dumps, rows_to_dicts
+from app.counts import count_cache, get_total
+from app.writebehind import get_writer
+from app.retention import get_retention
+from app.pubsub import broker
+from app.streaming import ClosingStreamingResponse, sse_response, subscription_events, subscription_websocket
+from app.models import Log, LogRequest
 from typing import List, Optional
 from datetime import datetime, time
 
 router = APIRouter()
 
+# 批量写入配置
+BATCH_CHUNK_SIZE = 500
+BATCH_MAX_ROWS = 50000
+# 导出时每页的行数，每页单独借用一次连接
+EXPORT_PAGE_SIZE = 2000
+
+INSERT_LOG_SQL = """
+    INSERT INTO logs (
+        app_id, package, role_name, device,
+        log_message, log_time, log_type, log_stack, create_at,
+        fingerprint
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+# 与 INSERT_LOG_SQL 参数顺序一致的列名，用于构造推送消息
+LOG_COLUMNS = (
+    "app_id", "package", "role_name", "device",
+    "log_message", "log_time", "log_type", "log_stack", "create_at",
+    "fingerprint"
+)
+
+def build_fts_query(search: str) -> str:
+    """把用户输入转换为安全的 FTS5 查询。
+
+    双引号括起的部分作为短语精确匹配，其余词按前缀匹配，多个条件之间为 AND。
+    输入中没有可搜索的词时返回空字符串，调用方应改用 LIKE 搜索而不是返回全部日志。
+    """
+    terms = []
+    for phrase, word in re.findall(r'"([^"]*)"|(\S+)', search):
+        if phrase.strip():
+            terms.append('"' + phrase.strip() + '"')
+        else:
+            word = word.strip('"').rstrip('*')
+            if word:
+                terms.append('"' + word.replace('"', '""') + '"*')
+    return " ".join(terms)
+
+def build_log_query(
+    search: Optional[str],
+    fts_query: str,
+    start: Optional[int] = None,
+    end: Optional[int] = None,
+    schema: Optional[str] = None
+) -> tuple[str, str, list]:
+    """按搜索条件和时间范围构建日志查询和计数查询，返回 (query, count_query, params)。
+
+    schema 为已 ATTACH 的分区别名时查询该分区，否则查询主库（热分区）。
+    """
+    logs_table = f"{schema}.logs AS logs" if schema else "logs"
+    fts_table = f"{schema}.logs_fts AS logs_fts" if schema else "logs_fts"
+    ranged = start is not None or end is not None
+
+    if fts_query:
+        # 使用全文索引搜索 role_name、log_message 和 log_stack
+        query = f"""
+            SELECT logs.* FROM {fts_table}
+            JOIN {logs_table} ON logs.id = logs_fts.rowid
+            WHERE logs_fts MATCH ?
+        """
+        if ranged:
+            count_query = f"""
+                SELECT COUNT(*) as total FROM {fts_table}
+                JOIN {logs_table} ON logs.id = logs_fts.rowid
+                WHERE logs_fts MATCH ?
+            """
+        else:
+            count_query = f"SELECT COUNT(*) as total FROM {fts_table} WHERE logs_fts MATCH ?"
+        params = [fts_query]
+    else:
+        query = f"SELECT * FROM {logs_table} WHERE 1=1"
+        count_query = f"SELECT COUNT(*) as total FROM {logs_table} WHERE 1=1"
+        params = []
+
+    # 全文索引不可用，或输入只有引号、* 等无法构成 FTS 查询时，退回到 LIKE 搜索
+    if search and not fts_query:
+        search_term = f"%{search}%"
+        query += """ AND (
+            role_name LIKE ? OR 
+            log_message LIKE ?
+        )"""
+        count_query += """ AND (
+            role_name LIKE ? OR 
+            log_message LIKE ?
+        )"""
+        params.extend([search_term, search_term])
+
+    # 按入库时间过滤
+    if start is not None:
+        query += " AND logs.create_at >= ?"
+        count_query += " AND logs.create_at >= ?"
+        params.append(start)
+    if end is not None:
+        query += " AND logs.create_at < ?"
+        count_query += " AND logs.create_at < ?"
+        params.append(end)
+
+    return query, count_query, params
+
+def partition_total(
+    partition: dict,
+    search: Optional[str],
+    start: Optional[int],
+    end: Optional[int],
+    count_key: tuple,
+    exact_count: bool
+) -> tuple[Optional[int], bool]:
+    """不 ATTACH 分区得到其中匹配的总数，返回 (总数, 是否为估算值)，无法得到时总数为 None。
+
+    没有搜索条件且时间范围覆盖整个分区时直接使用分区目录中的行数，否则查短期缓存。
+    """
+    if not search and (start is None or start <= partition["start"]) and (end is None or end >= partition["end"]):
+        return partition["rows"], False
+    if not exact_count:
+        cached = count_cache.get(count_key)
+        if cached is not None:
+            return cached, True
+    return None, False
+
+def page_overlaps(
+    partition: Optional[dict],
+    count: Optional[int],
+    direction: Optional[str],
+    keyset_id: Optional[int],
+    offset: int
+) -> bool:
+    """当前页是否可能包含该分区的行；count 为 None 表示总数未知"""
+    if count == 0:
+        return False
+    if direction is None:
+        return count is None or offset < count
+    if partition is None:
+        return True
+    # 按分区目录中的 id 范围判断，旧目录没有 id 范围时不能跳过
+    if direction == "before":
+        return partition["min_id"] is None or partition["min_id"] < keyset_id
+    return partition["max_id"] is None or partition["max_id"] > keyset_id
+
+async def fetch_partitioned_logs(
+    db: aiosqlite.Connection,
+    partitions: list[dict],
+    search: Optional[str],
+    fts_query: str,
+    start: Optional[int],
+    end: Optional[int],
+    direction: Optional[str],
+    keyset_id: Optional[int],
+    limit: int,
+    offset: int,
+    exact_count: bool
+) -> tuple[list, int, bool]:
+    """依次查询热分区和覆盖时间范围的归档分区，按 id 顺序拼接结果。
+
+    各分区的时间段互不重叠，id 随时间递增，因此按分区顺序拼接即为全局 id 顺序。
+    各分区的总数来自计数表、分区目录或短期缓存，只有总数未知或当前页落在其中的分区才会被 ATTACH。
+    返回 (最多 limit + 1 行, 所有分区中匹配的总数, 总数是否为估算值)。
+    """
+    filtered = bool(search) or start is not None or end is not None
+    sources = [None] + partitions
+    if direction == "after":
+        sources.reverse()
+
+    rows = []
+    total = 0
+    estimated = False
+    need = limit + 1
+    for partition in sources:
+        schema = None if partition is None else PARTITION_SCHEMA
+        query, count_query, params = build_log_query(search, fts_query, start, end, schema)
+        if partition is None:
+            count_key = None
+            count, cached = await get_total(db, "logs", count_query, params, filtered, exact_count)
+        else:
+            count_key = (partition["name"], count_query, tuple(params))
+            count, cached = partition_total(partition, search, start, end, count_key, exact_count)
+        wanted = need > 0 and page_overlaps(partition, count, direction, keyset_id, offset)
+
+        if not wanted and count is not None:
+            total += count
+            estimated = estimated or cached
+            if need > 0 and direction is None:
+                # 整个分区都在当前页之前，直接跳过
+                offset -= count
+            continue
+
+        context = nullcontext(None) if partition is None else attach_partition(db, partition["name"])
+        async with context as attached:
+            if partition is not None and attached is None:
+                continue
+            if count is None:
+                async with db.execute(count_query, params) as cursor:
+                    count = (await cursor.fetchone())["total"]
+                count_cache.set(count_key, count)
+                wanted = need > 0 and page_overlaps(partition, count, direction, keyset_id, offset)
+            total += count
+            estimated = estimated or cached
+
+            if not wanted:
+                if need > 0 and direction is None:
+                    offset -= count
+                continue
+
+            if direction is not None:
+                query += " AND logs.id < ?" if direction == "before" else " AND logs.id > ?"
+                params.append(keyset_id)
+            query += " ORDER BY logs.id ASC" if direction == "after" else " ORDER BY logs.id DESC"
+            query += " LIMIT ? OFFSET ?"
+            params.extend([need, offset if direction is None else 0])
+            async with db.execute(query, params) as cursor:
+                found = await cursor.fetchall()
+            rows.extend(found)
+            need -= len(found)
+            offset = 0
+
+    return rows, total, estimated
+
+async def fetch_logs(
+    db: aiosqlite.Connection,
+    search: Optional[str],
+    fts_query: str,
+    start: Optional[int],
+    end: Optional[int],
+    direction: Optional[str],
+    keyset_id: Optional[int],
+    by_rank: bool,
+    limit: int,
+    offset: int,
+    exact_count: bool
+) -> tuple[list, int, bool]:
+    """只查询主库（热分区），返回 (最多 limit + 1 行, 总数, 总数是否为估算值)"""
+    query, count_query, params = build_log_query(search, fts_query, start, end)
+
+    # 获取总记录数：无过滤时读计数表，有过滤时使用短期缓存
+    filtered = bool(search) or start is not None or end is not None
+    total, estimated = await get_total(db, "logs", count_query, params, filtered, exact_count)
+
+    # 游标分页：按 id 范围定位，不需要跳过前面的行
+    if direction is not None:
+        query += " AND logs.id < ?" if direction == "before" else " AND logs.id > ?"
+        params.append(keyset_id)
+
+    # 添加排序和分页，多取一条用于判断是否还有更多
+    if by_rank:
+        query += " ORDER BY logs_fts.rank LIMIT ? OFFSET ?"
+    elif direction == "after":
+        query += " ORDER BY logs.id ASC LIMIT ? OFFSET ?"
+    else:
+        query += " ORDER BY logs.id DESC LIMIT ? OFFSET ?"
+    params.extend([limit + 1, 0 if direction is not None else offset])
+
+    async with db.execute(query, params) as cursor:
+        rows = await cursor.fetchall()
+    return rows, total, estimated
+
 @router.get("/", response_model=dict)
 async def get_logs(
     page: int = Query(1, ge=1),
     limit: int = Query(20, ge=1, le=100),
     search: Optional[str] = None,
+    order: Optional[str] = Query(None, pattern="^(id|rank)$", description="排序方式，搜索时默认按相关度 rank"),
+    before_id: Optional[int] = Query(None, description="游标分页：返回 id 小于该值的记录"),
+    after_id: Optional[int] = Query(None, description="游标分页：返回 id 大于该值的记录"),
+    page_cursor: Optional[str] = Query(None, alias="cursor", description="上一次响应中的 next_cursor / prev_cursor"),
+    exact_count: bool = Query(False, description="忽略缓存，重新精确统计总数"),
+    start: Optional[int] = Query(None, description="起始时间（毫秒时间戳，按 create_at 过滤，包含）"),
+    end: Optional[int] = Query(None, description="结束时间（毫秒时间戳，按 create_at 过滤，不包含）"),
     db: aiosqlite.Connection = Depends(get_db)
 ):
-    """获取错误日志列表，支持分页和搜索"""
+    """获取错误日志列表，支持分页、搜索和时间范围；传入 before_id / after_id / cursor 时使用游标分页"""
     try:
-        # 构建基础查询
-        query = "SELECT * FROM logs WHERE 1=1"
-        count_query = "SELECT COUNT(*) as total FROM logs WHERE 1=1"
-        params = []
+        direction, keyset_id = resolve_keyset(before_id, after_id, page_cursor)
+        fts_query = build_fts_query(search) if search and database.fts_enabled else ""
+        # 游标分页只能按 id 排序
+        by_rank = bool(fts_query) and order != "id" and direction is None
 
-        # 添加搜索条件
-        if search:
-            search_term = f"%{search}%"
-            query += """ AND (
-                role_name LIKE ? OR 
-                log_message LIKE ?
-            )"""
-            count_query += """ AND (
-                role_name LIKE ? OR 
-                log_message LIKE ?
-            )"""
-            params.extend([search_term, search_term])
-
-        # 获取总记录数
-        async with db.execute(count_query, params) as cursor:
-            total = (await cursor.fetchone())['total']
-
-        # 计算分页
+        # 开启分区时查询覆盖时间范围的归档分区
+        partitions = await overlapping_partitions(db, start, end) if partition_enabled() else []
         offset = (page - 1) * limit
-        total_pages = (total + limit - 1) // limit
-
-        # 添加分页
-        query += " ORDER BY id DESC LIMIT ? OFFSET ?"
-        params.extend([limit, offset])
+        if partitions:
+            # 不同分区的相关度不可比较，跨分区时只按 id 排序
+            by_rank = False
+            rows, total, estimated = await fetch_partitioned_logs(
+                db, partitions, search, fts_query, start, end, direction, keyset_id, limit, offset, exact_count
+            )
+        else:
+            rows, total, estimated = await fetch_logs(
+                db, search, fts_query, start, end, direction, keyset_id, by_rank, limit, offset, exact_count
+            )
+        logs = rows_to_dicts(rows[:limit])
 
-        # 执行查询
-        async with db.execute(query, params) as cursor:
-            rows = await cursor.fetchall()
-            logs = [dict(row) for row in rows]
+        has_more = len(rows) > limit
+        if direction == "after":
+            logs.reverse()
+        if by_rank:
+            next_cursor, prev_cursor = None, None
+        else:
+            next_cursor, prev_cursor = page_cursors(logs, direction, has_more, page)
 
-        return {
+        return FastJSONResponse({
             "total": total,
             "page": page,
             "limit": limit,
+            "estimated": estimated,
             # "total_pages": total_pages,
             "logs": logs,
+            "next_cursor": next_cursor,
+            "prev_cursor": prev_cursor,
             # "has_next": page < total_pages,
             # "has_prev": page > 1
-        }
+        })
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=500,
             detail=f"Failed to fetch logs: {str(e)}"
         )
 
+@router.get("/export")
+async def export_logs(
+    search: Optional[str] = None,
+    start: Optional[int] = Query(None, description="起始时间（毫秒时间戳，按 create_at 过滤，包含）"),
+    end: Optional[int] = Query(None, description="结束时间（毫秒时间戳，按 create_at 过滤，不包含）"),
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$", description="导出格式"),
+):
+    """流式导出日志，支持与列表相同的搜索条件和时间范围，按 id 升序输出"""
+    fts_query = build_fts_query(search) if search and database.fts_enabled else ""
+
+    async def export_page(partition: Optional[dict], after_id: int) -> Optional[tuple[list, list]]:
+        """读取 id 大于 after_id 的一页，返回 (列名, 行)；分区文件不存在时返回 None。
+
+        每页单独借用连接并在读完后立即归还，导出期间不会一直占着连接和读事务，
+        WAL 检查点可以正常推进。
+        """
+        async with db_connection() as db:
+            context = nullcontext(None) if partition is None else attach_partition(db, partition["name"])
+            async with context as schema:
+                if partition is not None and schema is None:
+                    return None
+                query, _, params = build_log_query(search, fts_query, start, end, schema)
+                # 全文搜索时按 FTS 表的 rowid 分页，FTS5 可以直接从 after_id 开始按顺序返回，不需要每页重新排序
+                key = "logs_fts.rowid" if fts_query else "logs.id"
+                query += f" AND {key} > ? ORDER BY {key} ASC LIMIT ?"
+                params.extend([after_id, EXPORT_PAGE_SIZE])
+                async with db.execute(query, params) as cursor:
+                    columns = [column[0] for column in cursor.description]
+                    rows = await cursor.fetchall()
+        return columns, rows
+
+    # 响应开始后依赖项可能已经释放，导出过程中自行从连接池借用连接
+    async def generate():
+        async with db_connection() as db:
+            partitions = await overlapping_partitions(db, start, end) if partition_enabled() else []
+        header_written = False
+        # 先导出归档分区（从旧到新），最后是热分区；每个分区内按 id 游标分页
+        for partition in [*reversed(partitions), None]:
+            after_id = 0
+            while True:
+                page = await export_page(partition, after_id)
+                if page is None:
+                    break
+                columns, rows = page
+                # 没有数据时 CSV 也会带上表头
+                if format == "csv" and not header_written:
+                    yield csv_rows([columns])
+                    header_written = True
+                if not rows:
+                    break
+                if format == "csv":
+                    yield csv_rows(rows)
+                else:
+                    yield b"".join(dumps(dict(zip(columns, row))) + b"\n" for row in rows)
+                if len(rows) < EXPORT_PAGE_SIZE:
+                    break
+                after_id = rows[-1]["id"]
+
+    filename = f"logs-{datetime.now().strftime('%Y%m%d%H%M%S')}.{format}"
+    return ClosingStreamingResponse(
+        generate(),
+        media_type="text/csv; charset=utf-8" if format == "csv" else "application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+def csv_rows(rows) -> bytes:
+    """把若干行编码为 CSV 文本"""
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    return buffer.getvalue().encode("utf-8")
+
+def log_matcher(app_id: Optional[str], log_type: Optional[str], search: Optional[str]):
+    """实时推送的过滤条件：app_id、log_type 精确匹配，search 在角色名、消息和堆栈中不区分大小写查找"""
+    term = search.lower() if search else None
+
+    def match(log: dict) -> bool:
+        if app_id is not None and str(log.get("app_id")) != app_id:
+            return False
+        if log_type is not None and log.get("log_type") != log_type:
+            return False
+        if term and not any(
+            term in (log.get(field) or "").lower()
+            for field in ("role_name", "log_message", "log_stack")
+        ):
+            return False
+        return True
+
+    return match
+
+@router.get("/tail")
+async def tail_logs(
+    app_id: Optional[str] = None,
+    log_type: Optional[str] = None,
+    search: Optional[str] = None
+):
+    """通过 Server-Sent Events 实时推送新写入的日志"""
+    subscription = broker.subscribe("logs", log_matcher(app_id, log_type, search))
+    return sse_response(subscription_events(subscription, "log"))
+
+@router.websocket("/tail/ws")
+async def tail_logs_ws(
+    websocket: WebSocket,
+    app_id: Optional[str] = None,
+    log_type: Optional[str] = None,
+    search: Optional[str] = None
+):
+    """通过 WebSocket 实时推送新写入的日志"""
+    subscription = broker.subscribe("logs", log_matcher(app_id, log_type, search))
+    await subscription_websocket(websocket, subscription, "log")
+
 @router.post("/", response_model=Log)
 async def create_log(log: Log, db: aiosqlite.Connection = Depends(get_db)):
     """创建新的日志记录"""
     try:
-        async with db.execute(
-            """
-            INSERT INTO logs (
-                app_id, package, role_name, device,
-                log_message, log_time, log_type, log_stack, create_at
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-            RETURNING *
-            """,
-            (log.app_id, log.package, log.role_name, log.device,
-             log.log_message, log.log_time, log.log_type, log.log_stack,
-             int(datetime.now().timestamp() * 1000))
-        ) as cursor:
+        create_at = int(datetime.now().timestamp() * 1000)
+        params = (log.app_id, log.package, log.role_name, log.device,
+                  log.log_message, log.log_time, log.log_type, log.log_stack,
+                  create_at, log_fingerprint(log.log_message, log.log_stack))
+
+        # 写后模式：放入队列，由后台任务分组提交
+        writer = get_writer()
+        if writer is not None:
+            log_id = await writer.submit(INSERT_LOG_SQL, params)
+            broker.publish("logs", {"id": log_id, **dict(zip(LOG_COLUMNS, params))})
+            return {**log.model_dump(), "id": log_id, "create_at": create_at, "fingerprint": params[-1]}
+
+        async with db.execute(INSERT_LOG_SQL + " RETURNING *", params) as cursor:
             row = await cursor.fetchone()
             await db.commit()
+            broker.publish("logs", dict(row))
             return dict(row)
 
     except Exception as e:
@@ -93,12 +478,240 @@ async def create_log(log: Log, db: aiosqlite.Connection = Depends(get_db)):
             detail=f"Failed to create log: {str(e)}"
         )
 
+async def _insert_log_chunk(db: aiosqlite.Connection, chunk: list, results: list,
+                            published: Optional[list] = None):
+    """用 executemany 写入一批日志，并回填每条记录的 id；published 不为 None 时收集待推送的日志"""
+    await db.executemany(INSERT_LOG_SQL, [params for _, params in chunk])
+    async with db.execute("SELECT last_insert_rowid() AS last_id") as cursor:
+        last_id = (await cursor.fetchone())['last_id']
+
+    # 同一事务内 AUTOINCREMENT 分配的 id 是连续的
+    first_id = last_id - len(chunk) + 1
+    for offset, (index, params) in enumerate(chunk):
+        results[index] = {"index": index, "status": "ok", "id": first_id + offset}
+        if published is not None:
+            published.append({"id": first_id + offset, **dict(zip(LOG_COLUMNS, params))})
+    chunk.clear()
+
+def _format_validation_error(e: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(loc) for loc in err['loc']) or 'body'}: {err['msg']}"
+        for err in e.errors()
+    )
+
+@router.post("/batch", response_model=dict)
+async def create_logs_batch(request: Request, db: aiosqlite.Connection = Depends(get_db)):
+    """批量创建日志记录，请求体为 JSON 数组或 NDJSON，所有记录在同一个事务中写入。
+
+    先读完并校验整个请求体（最多 BATCH_MAX_ROWS 行）再开始写入，
+    慢速客户端上传期间不会持有数据库写锁。
+    """
+    content_type = request.headers.get("content-type", "")
+    if "ndjson" in content_type or "jsonlines" in content_type:
+        items = iter_ndjson(request.stream())
+    else:
+        items = iter_json_array(request.stream())
+
+    results = []
+    rows = []
+    failed = 0
+    # 没有实时订阅者时不构造推送消息
+    published = [] if broker.has_subscribers("logs") else None
+    try:
+        index = 0
+        async for item in items:
+            if index >= BATCH_MAX_ROWS:
+                raise HTTPException(
+                    status_code=413,
+                    detail=f"Too many logs in one batch, the limit is {BATCH_MAX_ROWS}"
+                )
+
+            try:
+                log = LogRequest.model_validate(item)
+            except ValidationError as e:
+                results.append({
+                    "index": index,
+                    "status": "error",
+                    "error": _format_validation_error(e)
+                })
+                failed += 1
+            else:
+                results.append(None)
+                rows.append((index, (
+                    log.app_id, log.package, log.role_name, log.device,
+                    log.log_message, log.log_time, log.log_type, log.log_stack,
+                    int(datetime.now().timestamp() * 1000),
+                    log_fingerprint(log.log_message, log.log_stack)
+                )))
+            index += 1
+
+        # 请求体已全部读完，写入事务只包含 executemany 本身
+        for offset in range(0, len(rows), BATCH_CHUNK_SIZE):
+            await _insert_log_chunk(db, rows[offset:offset + BATCH_CHUNK_SIZE], results, published)
+        await db.commit()
+
+        # 提交后再推送给实时订阅者
+        for row in published or ():
+            broker.publish("logs", row)
+
+        return {
+            "code": 0,
+            "message": "Logs created successfully",
+            "inserted": len(results) - failed,
+            "failed": failed,
+            "results": results
+        }
+
+    except HTTPException:
+        await db.rollback()
+        raise
+    except ValueError as e:
+        # json.JSONDecodeError 也是 ValueError 的子类
+        await db.rollback()
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid batch body: {str(e)}"
+        )
+    except Exception as e:
+        await db.rollback()
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to create logs: {str(e)}"
+        )
+
+@router.get("/issues", response_model=dict)
+async def get_issues(
+    page: int = Query(1, ge=1),
+    limit: int = Query(20, ge=1, le=100),
+    hours: Optional[int] = Query(None, ge=1, le=24 * 90, description="只统计最近若干小时内的出现次数"),
+    app_id: Optional[str] = None,
+    sort: str = Query("count", pattern="^(count|last_seen)$"),
+    db: aiosqlite.Connection = Depends(get_db)
+):
+    """获取按指纹聚合的错误列表，例如最近 24 小时的高频错误"""
+    try:
+        params = []
+        if hours:
+            # 从小时聚合表统计时间窗口内的次数，不需要扫描日志表
+            since_hour = int(datetime.now().timestamp() * 1000) // 3600000 - hours + 1
+            query = """
+                SELECT issues.*, recent.window_count
+                FROM (
+                    SELECT fingerprint, SUM(count) AS window_count
+                    FROM issue_hourly
+                    WHERE hour >= ?
+                    GROUP BY fingerprint
+                ) AS recent
+                JOIN issues ON issues.fingerprint = recent.fingerprint
+                WHERE 1=1
+            """
+            params.append(since_hour)
+            count_column = "recent.window_count"
+        else:
+            query = "SELECT issues.* FROM issues WHERE 1=1"
+            count_column = "issues.count"
+
+        if app_id:
+            query += """ AND EXISTS (
+                SELECT 1 FROM issue_apps
+                WHERE issue_apps.fingerprint = issues.fingerprint AND issue_apps.app_id = ?
+            )"""
+            params.append(app_id)
+
+        async with db.execute(f"SELECT COUNT(*) as total FROM ({query})", params) as cursor:
+            total = (await cursor.fetchone())['total']
+
+        order_column = count_column if sort == "count" else "issues.last_seen"
+        query += f" ORDER BY {order_column} DESC LIMIT ? OFFSET ?"
+        params.extend([limit, (page - 1) * limit])
+
+        async with db.execute(query, params) as cursor:
+            issues = [dict(row) for row in await cursor.fetchall()]
+
+        return FastJSONResponse({
+            "total": total,
+            "page": page,
+            "limit": limit,
+            "issues": issues
+        })
+
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to fetch issues: {str(e)}"
+        )
+
+@router.get("/issues/{fingerprint}", response_model=dict)
+async def get_issue(
+    fingerprint: str,
+    limit: int = Query(20, ge=1, le=100, description="返回最近的日志条数"),
+    hours: int = Query(24, ge=1, le=24 * 90, description="按小时统计的时间范围"),
+    db: aiosqlite.Connection = Depends(get_db)
+):
+    """获取单个错误的详情：受影响的设备和应用、按小时的出现次数以及最近的日志"""
+    try:
+        async with db.execute(
+            "SELECT * FROM issues WHERE fingerprint = ?",
+            (fingerprint,)
+        ) as cursor:
+            issue = await cursor.fetchone()
+            if not issue:
+                raise HTTPException(
+                    status_code=404,
+                    detail=f"Issue {fingerprint} not found"
+                )
+
+        async with db.execute(
+            "SELECT device FROM issue_devices WHERE fingerprint = ? LIMIT 1000",
+            (fingerprint,)
+        ) as cursor:
+            devices = [row['device'] for row in await cursor.fetchall()]
+
+        async with db.execute(
+            "SELECT app_id FROM issue_apps WHERE fingerprint = ?",
+            (fingerprint,)
+        ) as cursor:
+            apps = [row['app_id'] for row in await cursor.fetchall()]
+
+        since_hour = int(datetime.now().timestamp() * 1000) // 3600000 - hours + 1
+        async with db.execute(
+            """
+            SELECT hour * 3600000 AS time, count FROM issue_hourly
+            WHERE hour >= ? AND fingerprint = ?
+            ORDER BY hour
+            """,
+            (since_hour, fingerprint)
+        ) as cursor:
+            hourly = [dict(row) for row in await cursor.fetchall()]
+
+        async with db.execute(
+            "SELECT * FROM logs WHERE fingerprint = ? ORDER BY id DESC LIMIT ?",
+            (fingerprint, limit)
+        ) as cursor:
+            logs = [dict(row) for row in await cursor.fetchall()]
+
+        return FastJSONResponse({
+            "code": 0,
+            "issue": dict(issue),
+            "devices": devices,
+            "apps": apps,
+            "hourly": hourly,
+            "logs": logs
+        })
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to fetch issue: {str(e)}"
+        )
+
 @router.delete("/before")
 async def delete_logs_by_date(
-    date: str = Query(..., description="删除此日期23:59:59之前的所有日志 (格式: YYYY-MM-DD)"),
-    db: aiosqlite.Connection = Depends(get_db)
+    date: str = Query(..., description="删除此日期23:59:59之前的所有日志 (格式: YYYY-MM-DD)")
 ):
-    """删除指定日期之前的所有日志"""
+    """删除指定日期之前的所有日志，删除在后台分批进行，可通过返回的 job_id 查询进度"""
     try:
         # 解析日期并设置为当天的23:59:59
         try:
@@ -111,20 +724,14 @@ async def delete_logs_by_date(
                 detail="Invalid date format. Please use YYYY-MM-DD"
             )
 
-        # 执行删除操作
-        async with db.execute(
-            "DELETE FROM logs WHERE create_at <= ?",
-            (cutoff_time,)
-        ) as cursor:
-            deleted_count = cursor.rowcount
-            await db.commit()
-            
-            return {
-                "code": 0,
-                "message": f"Successfully deleted logs before {date} 23:59:59",
-                "deleted_count": deleted_count,
-                "cutoff_time": cutoff_time
-            }
+        # 在后台分批删除，避免长时间占用写锁
+        job = get_retention().submit("logs", cutoff_time + 1)
+        return {
+            "code": 0,
+            "message": f"Deleting logs before {date} 23:59:59 in background",
+            "job_id": job.id,
+            "cutoff_time": cutoff_time
+        }
 
     except HTTPException:
         raise
@@ -155,20 +762,19 @@ async def delete_log(log_id: int, db: aiosqlite.Connection = Depends(get_db)):
         )
 
 @router.delete("/clear/{days}")
-async def clear_old_logs(days: int, db: aiosqlite.Connection = Depends(get_db)):
+async def clear_old_logs(days: int):
     """清理指定天数之前的日志"""
     try:
         cutoff_time = int((datetime.now().timestamp() - days * 86400) * 1000)
-        
-        async with db.execute(
-            "DELETE FROM logs WHERE create_at < ?",
-            (cutoff_time,)
-        ):
-            await db.commit()
-            return {
-                "code": 0,
-                "message": f"Logs older than {days} days cleared successfully"
-            }
+
+        # 在后台分批删除，避免长时间占用写锁
+        job = get_retention().submit("logs", cutoff_time)
+        return {
+            "code": 0,
+            "message": f"Clearing logs older than {days} days in background",
+            "job_id": job.id,
+            "cutoff_time": cutoff_time
+        }
 
     except Exception as e:
         raise HTTPException(
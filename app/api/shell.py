@@ -1,47 +1,54 @@
 import asyncio
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Query, WebSocket, WebSocketDisconnect
+from pydantic import ValidationError
+from app.jobs import get_jobs
 from app.models import ShellCommand, ShellResponse, ScriptParams
+from app.processes import stream_shell_command
+from app.streaming import sse_event, sse_response, send_event
 import os
-from typing import List
+from typing import AsyncIterator, List
 from pathlib import Path
 
 router = APIRouter()
 
 scripts_dir = Path.cwd() / "sh"
 
+# 非流式模式下保留的最大输出字节数，超出部分丢弃
+SHELL_MAX_OUTPUT = int(os.environ.get("SHELL_MAX_OUTPUT", str(10 * 1024 * 1024)))
+# 增量读取任务输出时每次返回的最大字节数
+JOB_OUTPUT_PAGE_SIZE = 1024 * 1024
+
 async def run_shell_command(
     command: str,
     working_dir: str | None = None,
     env: dict | None = None
 ) -> ShellResponse:
-    """执行shell命令，支持环境变量"""
+    """执行shell命令，支持环境变量；输出超过 SHELL_MAX_OUTPUT 时截断"""
     try:
-        # 合并环境变量
-        process_env = os.environ.copy()
-        if env:
-            process_env.update(env)
-
-        # 创建子进程
-        process = await asyncio.create_subprocess_shell(
-            command,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE,
-            cwd=working_dir,
-            env=process_env
-        )
-        
-        # 等待命令执行完成并获取输出
-        stdout, stderr = await process.communicate()
-        
+        output = {"stdout": [], "stderr": []}
+        size = 0
+        truncated = False
+        exit_code = -1
+        async for name, line in stream_shell_command(command, working_dir, env):
+            if name == "exit":
+                exit_code = line
+            elif not truncated and size + len(line) < SHELL_MAX_OUTPUT:
+                output[name].append(line)
+                size += len(line) + 1
+            else:
+                truncated = True
+
         # 解码输出
-        output = stdout.decode().strip()
-        error = stderr.decode().strip() if stderr else None
-        
+        stdout = "\n".join(output["stdout"]).strip()
+        if truncated:
+            stdout += "\n... output truncated, use stream mode for the full output"
+        error = "\n".join(output["stderr"]).strip() or None
+
         return ShellResponse(
-            success=process.returncode == 0,
-            output=output,
+            success=exit_code == 0,
+            output=stdout,
             error=error,
-            exit_code=process.returncode
+            exit_code=exit_code
         )
     except Exception as e:
         return ShellResponse(
@@ -51,9 +58,41 @@ async def run_shell_command(
             exit_code=-1
         )
 
-@router.post("/execute", response_model=ShellResponse)
-async def execute_command(command: ShellCommand):
-    """执行普通命令"""
+async def shell_events(
+    command: str,
+    working_dir: str | None = None,
+    env: dict | None = None,
+    info: dict | None = None
+) -> AsyncIterator[tuple[str, object]]:
+    """流式模式的事件：可选的 info，逐行的 stdout / stderr，最后是 exit"""
+    if info is not None:
+        yield "info", info
+    try:
+        async for name, line in stream_shell_command(command, working_dir, env):
+            if name == "exit":
+                yield "exit", {"success": line == 0, "exit_code": line}
+            else:
+                yield name, line
+    except Exception as e:
+        yield "exit", {"success": False, "exit_code": -1, "error": str(e)}
+
+async def shell_sse(events: AsyncIterator[tuple[str, object]]) -> AsyncIterator[bytes]:
+    async for event, data in events:
+        yield sse_event(event, data)
+
+async def shell_websocket(websocket: WebSocket, events: AsyncIterator[tuple[str, object]]):
+    """通过 WebSocket 推送命令输出，客户端断开时结束子进程"""
+    try:
+        async for event, data in events:
+            await send_event(websocket, event, data)
+        await websocket.close()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        await events.aclose()
+
+def check_command(command: ShellCommand):
+    """检查命令和工作目录，不合法时抛出 HTTPException"""
     # 安全检查：禁止执行某些危险命令
     forbidden_commands = ["rm -rf", "mkfs", "dd", ":(){ :|:& };:"]
     if any(cmd in command.command.lower() for cmd in forbidden_commands):
@@ -68,7 +107,18 @@ async def execute_command(command: ShellCommand):
             status_code=400,
             detail="Working directory does not exist"
         )
-    
+
+@router.post("/execute", response_model=ShellResponse)
+async def execute_command(
+    command: ShellCommand,
+    stream: bool = Query(False, description="以 Server-Sent Events 逐行返回输出")
+):
+    """执行普通命令"""
+    check_command(command)
+
+    if stream:
+        return sse_response(shell_sse(shell_events(command.command, command.working_dir)))
+
     # 执行命令
     result = await run_shell_command(command.command, command.working_dir)
     
@@ -93,12 +143,24 @@ async def list_scripts():
     
     return scripts
 
-@router.post("/scripts/{script_name}", response_model=ShellResponse)
-async def execute_script(
-    script_name: str,
-    params: ScriptParams
-):
-    """执行指定的脚本文件，支持参数和环境变量"""
+@router.websocket("/execute/ws")
+async def execute_command_ws(websocket: WebSocket):
+    """通过 WebSocket 执行命令，连接后先发送 ShellCommand JSON，随后逐行接收输出"""
+    await websocket.accept()
+    try:
+        command = ShellCommand.model_validate(await websocket.receive_json())
+        check_command(command)
+    except (ValidationError, ValueError, HTTPException) as e:
+        detail = e.detail if isinstance(e, HTTPException) else str(e)
+        await send_event(websocket, "exit", {"success": False, "exit_code": -1, "error": detail})
+        await websocket.close(code=1008)
+        return
+    except WebSocketDisconnect:
+        return
+    await shell_websocket(websocket, shell_events(command.command, command.working_dir))
+
+def build_script_command(script_name: str, params: ScriptParams) -> tuple[str, dict, dict]:
+    """构建脚本的执行命令，返回 (command, env, execution_info)"""
     script_path = scripts_dir / script_name
     
     if not script_path.exists():
@@ -139,15 +201,27 @@ async def execute_script(
             detail="Unsupported script type"
         )
     
-    # 执行脚本
-    result = await run_shell_command(command, scripts_dir, env)
-
-    # 添加执行信息到输出
     execution_info = {
         "script": script_name,
         "command": command,
         "parameters": params.dict()
     }
+    return command, env, execution_info
+
+@router.post("/scripts/{script_name}", response_model=ShellResponse)
+async def execute_script(
+    script_name: str,
+    params: ScriptParams,
+    stream: bool = Query(False, description="以 Server-Sent Events 逐行返回输出")
+):
+    """执行指定的脚本文件，支持参数和环境变量"""
+    command, env, execution_info = build_script_command(script_name, params)
+
+    if stream:
+        return sse_response(shell_sse(shell_events(command, scripts_dir, env, execution_info)))
+
+    # 执行脚本
+    result = await run_shell_command(command, scripts_dir, env)
 
     if result.success:
         return ShellResponse(
@@ -163,4 +237,119 @@ async def execute_script(
                 "execution_info": execution_info,
                 "error": result.error or "Script execution failed"
             }
-        ) 
\ No newline at end of file
+        )
+
+@router.websocket("/scripts/{script_name}/ws")
+async def execute_script_ws(websocket: WebSocket, script_name: str):
+    """通过 WebSocket 执行脚本，连接后先发送 ScriptParams JSON，随后逐行接收输出"""
+    await websocket.accept()
+    try:
+        params = ScriptParams.model_validate(await websocket.receive_json())
+        command, env, execution_info = build_script_command(script_name, params)
+    except (ValidationError, ValueError, HTTPException) as e:
+        detail = e.detail if isinstance(e, HTTPException) else str(e)
+        await send_event(websocket, "exit", {"success": False, "exit_code": -1, "error": detail})
+        await websocket.close(code=1008)
+        return
+    except WebSocketDisconnect:
+        return
+    await shell_websocket(websocket, shell_events(command, scripts_dir, env, execution_info))
+
+@router.post("/scripts/{script_name}/jobs")
+async def submit_script_job(
+    script_name: str,
+    params: ScriptParams,
+    timeout: int | None = Query(None, ge=0, description="超时时间（秒），0 表示不限制，默认使用 SCRIPT_JOB_TIMEOUT")
+):
+    """在后台执行脚本，立即返回任务 id，可通过 /jobs/{job_id} 轮询状态"""
+    command, env, execution_info = build_script_command(script_name, params)
+    job = await get_jobs().submit(
+        script_name, command, env, str(scripts_dir), execution_info["parameters"], timeout
+    )
+    return {
+        "code": 0,
+        "message": "Script job queued",
+        **job.to_dict()
+    }
+
+@router.get("/jobs")
+async def list_script_jobs(
+    script: str | None = None,
+    status: str | None = None,
+    page: int = Query(1, ge=1),
+    limit: int = Query(20, ge=1, le=200)
+):
+    """获取脚本任务的历史记录"""
+    jobs, total = await get_jobs().history(script, status, limit, (page - 1) * limit)
+    return {
+        "code": 0,
+        "jobs": jobs,
+        "total": total,
+        **get_jobs().metrics()
+    }
+
+async def get_script_job_or_404(job_id: int) -> dict:
+    job = await get_jobs().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Script job {job_id} not found")
+    return job
+
+@router.get("/jobs/{job_id}")
+async def get_script_job(job_id: int):
+    """获取脚本任务的状态和退出码"""
+    return {
+        "code": 0,
+        **await get_script_job_or_404(job_id)
+    }
+
+def read_output(path: str, offset: int, size: int) -> tuple[bytes, int]:
+    """从 offset 开始读取最多 size 字节，返回 (内容, 文件当前大小)"""
+    try:
+        with open(path, "rb") as f:
+            f.seek(offset)
+            data = f.read(size)
+            return data, os.fstat(f.fileno()).st_size
+    except FileNotFoundError:
+        return b"", 0
+
+def utf8_boundary(data: bytes) -> int:
+    """去掉末尾不完整的 UTF-8 字符后的长度，未完整的部分留到下次读取"""
+    end = len(data)
+    start = max(end - 3, 0)
+    for i in range(end - 1, start - 1, -1):
+        byte = data[i]
+        if byte & 0xC0 != 0x80:
+            # 首字节：按高位判断该字符需要的字节数
+            need = 4 if byte >= 0xF0 else 3 if byte >= 0xE0 else 2 if byte >= 0xC0 else 1
+            return i if end - i < need else end
+    return end
+
+@router.get("/jobs/{job_id}/output")
+async def get_script_job_output(
+    job_id: int,
+    offset: int = Query(0, ge=0, description="从该字节位置开始读取，首次传 0，之后传上次返回的 next_offset"),
+    limit: int = Query(JOB_OUTPUT_PAGE_SIZE, ge=1, le=JOB_OUTPUT_PAGE_SIZE)
+):
+    """增量读取任务输出；任务已结束且 next_offset 等于 size 时表示已经读完"""
+    job = await get_script_job_or_404(job_id)
+    data, size = await asyncio.to_thread(read_output, job["output_path"], offset, limit)
+    end = utf8_boundary(data) or len(data)
+    return {
+        "code": 0,
+        "status": job["status"],
+        "exit_code": job["exit_code"],
+        "output": data[:end].decode("utf-8", errors="replace"),
+        "offset": offset,
+        "next_offset": offset + end,
+        "size": size
+    }
+
+@router.post("/jobs/{job_id}/cancel")
+async def cancel_script_job(job_id: int):
+    """取消排队中或运行中的脚本任务"""
+    if not get_jobs().cancel(job_id):
+        raise HTTPException(status_code=404, detail=f"Script job {job_id} not found or already finished")
+    return {
+        "code": 0,
+        "message": f"Script job {job_id} cancelled"
+    }
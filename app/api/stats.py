@@ -1,27 +1,202 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, WebSocket
+from fastapi.exceptions import RequestValidationError
 import aiosqlite
-from app.database import get_db
+import json
+from pydantic import ValidationError
+from app.database import get_db, STATS_METRICS, STATS_INFO_COLUMNS, ROLLUP_RESOLUTIONS, rollup_p95_sql
 from app.models import StatsRecord, StatsInfo, StatsRecordDB, StatsRecordAPI, StatsInfoDB, StatsInfoAPI, StatsRequest
 from typing import List, Optional
 from datetime import datetime, time
-import base64
-from pathlib import Path
-import aiofiles
+import asyncio
+from app.downsample import lttb_indices_multi
+from app.responses import FastJSONResponse, field_aliases, rows_to_dicts
+from app.writebehind import get_writer
+from app.retention import get_retention
+from app.pubsub import broker
+from app.streaming import sse_response, subscription_events, subscription_websocket
+from app.screenshots import (
+    REGISTER_SCREENSHOT_SQL, ScreenshotUpload, store_screenshot, release_screenshot, collect_screenshots
+)
+from app.ingest import iter_multipart
+from app.pagination import resolve_keyset, page_cursors
+from app.counts import get_total
 
 router = APIRouter()
 
-# 创建上传目录
-UPLOAD_DIR = Path("public/uploads")
-if not UPLOAD_DIR.exists():
-    UPLOAD_DIR.mkdir(parents=True)
+INSERT_STATS_INFO_SQL = """
+    INSERT INTO stats_infos (
+        login_id, fps, total_mem, used_mem, mono_used_mem,
+        mono_heap_mem, texture, mesh, animation, audio,
+        font, text_asset, shader, pic, process, stat_time,
+        created_at
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+# multipart 请求中非图片字段的总大小上限（字节）
+MAX_FORM_FIELDS_SIZE = 1024 * 1024
+
+# create_stats 直接读取请求体，需要手动声明两种请求格式
+CREATE_STATS_OPENAPI = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "application/json": {"schema": StatsRequest.model_json_schema()},
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "properties": {
+                        "stats": {"type": "string", "description": "StatsRequest JSON (without pic)"},
+                        "pic": {"type": "string", "format": "binary"}
+                    }
+                }
+            }
+        }
+    }
+}
+
+# 写后模式下无法先查询再决定插入或更新，改用 UPSERT（依赖 login_id 唯一索引）
+UPSERT_STATS_RECORD_SQL = """
+    INSERT INTO stats_records (
+        login_id, app_id, package, product_name, role_name,
+        device, cpu, gpu, memory, gpu_memory, stat_time,
+        created_at
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(login_id) DO UPDATE SET
+        role_name = excluded.role_name,
+        stat_time = excluded.stat_time
+"""
+
+# 数据库列名到对外字段名（别名）的映射，与模型输出保持一致
+STATS_RECORD_ALIASES = field_aliases(StatsRecord)
+STATS_INFO_ALIASES = field_aliases(StatsInfo)
+
+def publish_stats_info(info_id: Optional[int], params: tuple):
+    """把新写入的 stats_infos 行推送给实时订阅者，字段名与 /details 一致"""
+    if broker.has_subscribers("stats"):
+        row = zip(STATS_INFO_COLUMNS, (info_id, *params))
+        broker.publish("stats", {STATS_INFO_ALIASES.get(key, key): value for key, value in row})
+
+# 详情接口最多返回的点数，超过时改用聚合数据
+MAX_DETAIL_POINTS = 1000
+# resolution=raw 时每页最多返回的行数
+MAX_RAW_PAGE_SIZE = 10000
+
+def choose_resolution(span: int, count: int) -> str:
+    """根据时间跨度和原始数据量选择聚合粒度：数据量不超过上限时返回原始数据"""
+    if count <= MAX_DETAIL_POINTS:
+        return "raw"
+    for name, resolution in ROLLUP_RESOLUTIONS.items():
+        if span // resolution + 1 <= MAX_DETAIL_POINTS:
+            return name
+    return list(ROLLUP_RESOLUTIONS)[-1]
+
+def rollup_point(row: aiosqlite.Row) -> dict:
+    """把聚合桶转换为与原始数据相同形状的点，指标值取平均值"""
+    row = dict(row)
+    count = row["count"]
+    point = {"login_id": row["login_id"], "mtime": row["bucket"], "count": count}
+    for metric in STATS_METRICS:
+        point[metric] = round(row[f"{metric}_sum"] / count) if count else None
+        point[f"{metric}_min"] = row[f"{metric}_min"]
+        point[f"{metric}_max"] = row[f"{metric}_max"]
+        point[f"{metric}_p95"] = row[f"{metric}_p95"]
+    # 聚合点没有截图和执行统计，与前端的空状态保持一致
+    point["pic"] = ""
+    point["process"] = "{}"
+    return point
+
+def rows_to_columns(names: list, rows: list) -> dict:
+    """把查询结果按列转换为 {列名: [值, ...]}，不构造逐行对象"""
+    if not rows:
+        return {name: [] for name in names}
+    return {name: list(values) for name, values in zip(names, zip(*rows))}
+
+def rollup_columns(names: list, rows: list) -> dict:
+    """把聚合桶按列输出，指标值取平均值，另附 _min / _max / _p95 列"""
+    raw = rows_to_columns(names, rows)
+    counts = raw["count"]
+    columns = {"login_id": raw["login_id"], "stat_time": raw["bucket"], "count": counts}
+    for metric in STATS_METRICS:
+        columns[metric] = [
+            round(total / count) if count else None
+            for total, count in zip(raw[f"{metric}_sum"], counts)
+        ]
+        columns[f"{metric}_min"] = raw[f"{metric}_min"]
+        columns[f"{metric}_max"] = raw[f"{metric}_max"]
+        columns[f"{metric}_p95"] = raw[f"{metric}_p95"]
+    return columns
+
+async def fetch_downsampled_infos(
+    db: aiosqlite.Connection,
+    login_id: int,
+    start: Optional[int],
+    end: Optional[int],
+    points: int
+) -> list:
+    """对所有指标一起做 LTTB 降采样，返回选中的 points 条原始数据。
+
+    扫描时只读取 id、时间和各指标，选定后才按 id 读取这些行的完整数据。
+    """
+    query = f"""
+        SELECT id, stat_time, {", ".join(f"coalesce({m}, 0)" for m in STATS_METRICS)}
+        FROM stats_infos
+        WHERE login_id = ? AND stat_time IS NOT NULL
+    """
+    params = [login_id]
+    if start is not None:
+        query += " AND stat_time >= ?"
+        params.append(start)
+    if end is not None:
+        query += " AND stat_time <= ?"
+        params.append(end)
+    query += " ORDER BY stat_time, id"
+
+    # 按列累积，只读取降采样需要的字段
+    columns = [[] for _ in range(len(STATS_METRICS) + 2)]
+    async with db.execute(query, params) as cursor:
+        while True:
+            rows = await cursor.fetchmany(5000)
+            if not rows:
+                break
+            for column, values in zip(columns, zip(*rows)):
+                column.extend(values)
+
+    ids, stat_times, metrics = columns[0], columns[1], columns[2:]
+
+    def select_ids() -> list[int]:
+        return [ids[i] for i in lttb_indices_multi(stat_times, metrics, points)]
+
+    # 计算密集，放到线程中执行，避免阻塞事件循环
+    selected_ids = await asyncio.to_thread(select_ids)
+
+    rows = []
+    for offset in range(0, len(selected_ids), 500):
+        chunk = selected_ids[offset:offset + 500]
+        async with db.execute(
+            f"SELECT * FROM stats_infos WHERE id IN ({', '.join('?' * len(chunk))})",
+            chunk
+        ) as cursor:
+            rows.extend(await cursor.fetchall())
+    rows.sort(key=lambda row: (row["stat_time"], row["id"]), reverse=True)
+    return rows
 
 # 1. 首先是所有具体的路径
 @router.get("/details")
 async def get_stats_details(
     login_id: int = Query(..., description="登录ID"),
+    start: Optional[int] = Query(None, description="开始时间（毫秒，按 stat_time）"),
+    end: Optional[int] = Query(None, description="结束时间（毫秒，按 stat_time）"),
+    resolution: str = Query("auto", pattern="^(auto|raw|10s|1m|1h)$", description="数据粒度，auto 按时间范围自动选择"),
+    points: Optional[int] = Query(None, ge=3, le=20000, description="LTTB 降采样后的点数（所有指标共用），指定时忽略 resolution"),
+    format: str = Query("rows", pattern="^(rows|columnar)$", description="columnar 时 statsInfo 按列返回"),
+    limit: int = Query(MAX_DETAIL_POINTS, ge=1, le=MAX_RAW_PAGE_SIZE, description="原始数据每页的行数"),
+    page_cursor: Optional[str] = Query(None, alias="cursor", description="原始数据翻页：上一次响应中的 next_cursor / prev_cursor"),
     db: aiosqlite.Connection = Depends(get_db)
 ):
-    """获取指定 login_id 的完整统计信息，包括基础记录和详细信息（限制1000条）"""
+    """获取指定 login_id 的完整统计信息，包括基础记录和详细信息；数据量大时按时间范围自动使用聚合数据或 LTTB 降采样。
+
+    原始数据按 id 倒序分页返回，has_more 为 true 时用 next_cursor 继续读取更早的数据。
+    """
     try:
         # 获取基础统计记录
         async with db.execute(
@@ -35,37 +210,114 @@ async def get_stats_details(
                     detail=f"Stats record not found for login_id: {login_id}"
                 )
             
-            # 转换为 API 模型
-            # db_record = StatsRecordDB(**dict(record_row))
-            # record = StatsRecordAPI.from_db(db_record)
-            record = StatsRecord(**dict(record_row))
-
-        # 获取详细统计信息（限制1000条）
-        async with db.execute(
-            """
-            SELECT * FROM stats_infos 
-            WHERE login_id = ? 
-            ORDER BY created_at DESC 
-            LIMIT 1000
-            """,
-            (login_id,)
-        ) as cursor:
-            info_rows = await cursor.fetchall()
-            
-            # 转换为 API 模型
-            infos = []
-            for row in info_rows:
-                # db_info = StatsInfoDB(**dict(row))
-                # info = StatsInfoAPI.from_db(db_info)
-                info = StatsInfo(**dict(row))
-                infos.append(info)
-
-        # 返回组合的结果
-        return {
+            # 直接按别名输出，不构造模型
+            # record = StatsRecord(**dict(record_row))
+            record = rows_to_dicts([record_row], STATS_RECORD_ALIASES)[0]
+
+        direction, keyset_id = resolve_keyset(None, None, page_cursor)
+        if points is not None:
+            resolution = "lttb"
+        elif resolution == "auto" and direction is not None:
+            # 带游标时是在翻原始数据的页
+            resolution = "raw"
+        elif resolution == "auto":
+            # 用分钟聚合估算范围内的原始数据量和时间跨度，不扫描原始数据
+            async with db.execute(
+                """
+                SELECT SUM(count) AS total, MIN(bucket) AS first, MAX(bucket) AS last
+                FROM stats_rollups
+                WHERE login_id = ? AND resolution = ? AND bucket >= ? AND bucket <= ?
+                """,
+                (login_id, ROLLUP_RESOLUTIONS["1m"],
+                 start - start % ROLLUP_RESOLUTIONS["1m"] if start is not None else -2**62,
+                 end if end is not None else 2**62)
+            ) as cursor:
+                summary = await cursor.fetchone()
+            total = summary["total"] or 0
+            first = start if start is not None else (summary["first"] or 0)
+            last = end if end is not None else (summary["last"] or 0) + ROLLUP_RESOLUTIONS["1m"]
+            resolution = choose_resolution(last - first, total)
+
+        time_filter = ""
+        params = [login_id]
+        if start is not None:
+            time_filter += " AND {column} >= ?"
+            params.append(start)
+        if end is not None:
+            time_filter += " AND {column} <= ?"
+            params.append(end)
+
+        columnar = format == "columnar"
+        page = {}
+        if resolution in ("lttb", "raw"):
+            if resolution == "lttb":
+                info_rows = await fetch_downsampled_infos(db, login_id, start, end, points)
+                names = info_rows[0].keys() if info_rows else STATS_INFO_COLUMNS
+            else:
+                # 原始数据按 id 游标分页（id 与写入时间同序），多取一条用于判断是否还有更多
+                query = f"SELECT * FROM stats_infos WHERE login_id = ?{time_filter.format(column='stat_time')}"
+                if direction is not None:
+                    query += " AND id < ?" if direction == "before" else " AND id > ?"
+                    params.append(keyset_id)
+                query += " ORDER BY id ASC LIMIT ?" if direction == "after" else " ORDER BY id DESC LIMIT ?"
+                async with db.execute(query, params + [limit + 1]) as cursor:
+                    info_rows = await cursor.fetchall()
+                    names = [column[0] for column in cursor.description]
+
+                has_more = len(info_rows) > limit
+                info_rows = info_rows[:limit]
+                if direction == "after":
+                    info_rows.reverse()
+                next_cursor, prev_cursor = page_cursors(info_rows, direction, has_more)
+                page = {
+                    "limit": limit,
+                    # 是否还有更早的数据
+                    "has_more": next_cursor is not None,
+                    "next_cursor": next_cursor,
+                    "prev_cursor": prev_cursor
+                }
+
+            if columnar:
+                infos = rows_to_columns(names, info_rows)
+            else:
+                # 直接按别名输出，不构造模型
+                # infos = [StatsInfo(**dict(row)) for row in info_rows]
+                infos = rows_to_dicts(info_rows, STATS_INFO_ALIASES)
+        else:
+            # 未关闭的桶（通常是每个会话的最后一个）在读取时计算 p95
+            p95_columns = ", ".join(
+                f"CASE WHEN r.finalized THEN r.{m}_p95 ELSE {rollup_p95_sql(m, 'r')} END AS {m}_p95"
+                for m in STATS_METRICS
+            )
+            bucket_size = ROLLUP_RESOLUTIONS[resolution]
+            if start is not None:
+                # 包含 start 所在的桶
+                params[1] = start - start % bucket_size
+            async with db.execute(
+                f"""
+                SELECT r.login_id, r.bucket, r.count,
+                       {", ".join(f"r.{m}_min, r.{m}_max, r.{m}_sum" for m in STATS_METRICS)},
+                       {p95_columns}
+                FROM stats_rollups AS r
+                WHERE r.login_id = ?{time_filter.format(column="r.bucket")} AND r.resolution = ?
+                ORDER BY r.bucket DESC
+                """,
+                params + [bucket_size]
+            ) as cursor:
+                rows = await cursor.fetchall()
+                if columnar:
+                    infos = rollup_columns([column[0] for column in cursor.description], rows)
+                else:
+                    infos = [rollup_point(row) for row in rows]
+
+        # 返回组合的结果，内容均为基础类型，直接序列化
+        return FastJSONResponse({
             "code": 0,
+            "resolution": resolution,
             "statsRecord": record,
-            "statsInfo": infos
-        }
+            "statsInfo": infos,
+            **page
+        })
 
     except HTTPException:
         raise
@@ -78,6 +330,7 @@ async def get_stats_details(
 @router.get("/info/{login_id}", response_model=List[StatsInfoAPI])
 async def get_stats_info(
     login_id: int,
+    format: str = Query("rows", pattern="^(rows|columnar)$", description="columnar 时按列返回"),
     db: aiosqlite.Connection = Depends(get_db)
 ):
     """获取指定登录ID的统计信息，限制1000条"""
@@ -92,15 +345,15 @@ async def get_stats_info(
             (login_id,)
         ) as cursor:
             rows = await cursor.fetchall()
+
+            if format == "columnar":
+                return FastJSONResponse(
+                    rows_to_columns([column[0] for column in cursor.description], rows)
+                )
             
-            # 转换查询结果
-            stats_info = []
-            for row in rows:
-                db_model = StatsInfoDB(**dict(row))
-                api_model = StatsInfoAPI.from_db(db_model)
-                stats_info.append(api_model)
-            
-            return stats_info
+            # 直接按别名输出，与 StatsInfoAPI 的字段一致，不构造模型
+            # stats_info = [StatsInfoAPI.from_db(StatsInfoDB(**dict(row))) for row in rows]
+            return FastJSONResponse(rows_to_dicts(rows, STATS_INFO_ALIASES))
 
     except Exception as e:
         raise HTTPException(
@@ -108,12 +361,23 @@ async def get_stats_info(
             detail=f"Failed to fetch stats info: {str(e)}"
         )
 
+@router.get("/tail")
+async def tail_stats(login_id: int = Query(..., description="登录ID")):
+    """通过 Server-Sent Events 实时推送指定登录的新统计样本"""
+    subscription = broker.subscribe("stats", lambda info: info["login_id"] == login_id)
+    return sse_response(subscription_events(subscription, "stats"))
+
+@router.websocket("/tail/ws")
+async def tail_stats_ws(websocket: WebSocket, login_id: int):
+    """通过 WebSocket 实时推送指定登录的新统计样本"""
+    subscription = broker.subscribe("stats", lambda info: info["login_id"] == login_id)
+    await subscription_websocket(websocket, subscription, "stats")
+
 @router.delete("/before")
 async def delete_stats_by_date(
-    date: str = Query(..., description="删除此日期23:59:59之前的所有统计信息 (格式: YYYY-MM-DD)"),
-    db: aiosqlite.Connection = Depends(get_db)
+    date: str = Query(..., description="删除此日期23:59:59之前的所有统计信息 (格式: YYYY-MM-DD)")
 ):
-    """删除指定日期之前的所有统计信息"""
+    """删除指定日期之前的所有统计信息，删除在后台分批进行，可通过返回的 job_id 查询进度"""
     try:
         # 解析日期并设置为当天的23:59:59
         try:
@@ -126,28 +390,12 @@ async def delete_stats_by_date(
                 detail="Invalid date format. Please use YYYY-MM-DD"
             )
 
-        # 删除统计记录和信息
-        async with db.execute(
-            "DELETE FROM stats_records WHERE created_at <= ?",
-            (cutoff_time,)
-        ) as cursor:
-            records_deleted = cursor.rowcount
-
-        async with db.execute(
-            "DELETE FROM stats_infos WHERE created_at <= ?",
-            (cutoff_time,)
-        ) as cursor:
-            infos_deleted = cursor.rowcount
-
-        await db.commit()
-            
+        # 在后台分批删除，避免长时间占用写锁
+        job = get_retention().submit("stats", cutoff_time + 1)
         return {
             "code": 0,
-            "message": f"Successfully deleted stats before {date} 23:59:59",
-            "deleted_count": {
-                "records": records_deleted,
-                "infos": infos_deleted
-            },
+            "message": f"Deleting stats before {date} 23:59:59 in background",
+            "job_id": job.id,
             "cutoff_time": cutoff_time
         }
 
@@ -160,32 +408,18 @@ async def delete_stats_by_date(
         )
 
 @router.delete("/clear/{days}")
-async def clear_old_stats(days: int, db: aiosqlite.Connection = Depends(get_db)):
+async def clear_old_stats(days: int):
     """清理指定天数之前的统计信息"""
     try:
         cutoff_time = int((datetime.now().timestamp() - days * 86400) * 1000)
         
-        # 删除旧记录
-        async with db.execute(
-            "DELETE FROM stats_records WHERE created_at < ?",
-            (cutoff_time,)
-        ) as cursor:
-            records_deleted = cursor.rowcount
-
-        async with db.execute(
-            "DELETE FROM stats_infos WHERE created_at < ?",
-            (cutoff_time,)
-        ) as cursor:
-            infos_deleted = cursor.rowcount
-
-        await db.commit()
+        # 在后台分批删除，避免长时间占用写锁
+        job = get_retention().submit("stats", cutoff_time)
         return {
             "code": 0,
-            "message": f"Stats older than {days} days cleared successfully",
-            "deleted_count": {
-                "records": records_deleted,
-                "infos": infos_deleted
-            }
+            "message": f"Clearing stats older than {days} days in background",
+            "job_id": job.id,
+            "cutoff_time": cutoff_time
         }
 
     except Exception as e:
@@ -200,10 +434,16 @@ async def get_stats(
     page: int = Query(1, ge=1),
     limit: int = Query(20, ge=1, le=100),
     search: Optional[str] = None,
+    before_id: Optional[int] = Query(None, description="游标分页：返回 id 小于该值的记录"),
+    after_id: Optional[int] = Query(None, description="游标分页：返回 id 大于该值的记录"),
+    page_cursor: Optional[str] = Query(None, alias="cursor", description="上一次响应中的 next_cursor / prev_cursor"),
+    exact_count: bool = Query(False, description="忽略缓存，重新精确统计总数"),
     db: aiosqlite.Connection = Depends(get_db)
 ):
-    """获取统计记录列表，支持分页和搜索"""
+    """获取统计记录列表，支持分页和搜索；传入 before_id / after_id / cursor 时使用游标分页"""
     try:
+        direction, keyset_id = resolve_keyset(before_id, after_id, page_cursor)
+
         # 构建基础查询
         query = "SELECT * FROM stats_records WHERE 1=1"
         count_query = "SELECT COUNT(*) as total FROM stats_records WHERE 1=1"
@@ -224,51 +464,47 @@ async def get_stats(
             )"""
             params.extend([search_term, search_term, search_term])
 
-        # 获取总记录数
-        async with db.execute(count_query, params) as cursor:
-            total = (await cursor.fetchone())['total']
+        # 获取总记录数：无过滤时读计数表，有过滤时使用短期缓存
+        total, estimated = await get_total(db, "stats_records", count_query, params, bool(search), exact_count)
 
         # 计算分页
         offset = (page - 1) * limit
 
-        # 添加分页和排序
-        query += " ORDER BY id DESC LIMIT ? OFFSET ?"
-        params.extend([limit, offset])
+        # 游标分页：按 id 范围定位，不需要跳过前面的行
+        if direction is not None:
+            query += " AND id < ?" if direction == "before" else " AND id > ?"
+            params.append(keyset_id)
+
+        # 添加分页和排序，多取一条用于判断是否还有更多
+        query += " ORDER BY id ASC LIMIT ? OFFSET ?" if direction == "after" else " ORDER BY id DESC LIMIT ? OFFSET ?"
+        params.extend([limit + 1, 0 if direction is not None else offset])
 
         # 执行查询
         async with db.execute(query, params) as cursor:
             rows = await cursor.fetchall()
 
-        # 转换查询结果
-        stats = []
-        for row in rows:
-            # 使用原始字段名创建模型
-            stat = StatsRecord(**dict(row))
-            # row_dict = dict(row)
-            # stat = StatsRecord(
-            #     id=row_dict['id'],
-            #     login_id=row_dict['login_id'],
-            #     app_id=row_dict['app_id'],
-            #     package=row_dict['package'],
-            #     product_name=row_dict['product_name'],
-            #     role_name=row_dict['role_name'],
-            #     device=row_dict['device'],
-            #     cpu=row_dict['cpu'],
-            #     gpu=row_dict['gpu'],
-            #     memory=row_dict['memory'],
-            #     gpu_memory=row_dict['gpu_memory'],
-            #     stat_time=row_dict['stat_time'],
-            #     created_at=row_dict['created_at']
-            # )
-            stats.append(stat)
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        if direction == "after":
+            rows.reverse()
+        next_cursor, prev_cursor = page_cursors(rows, direction, has_more, page)
 
-        return {
+        # 直接按别名输出，不构造模型
+        # stats = [StatsRecord(**dict(row)) for row in rows]
+        stats = rows_to_dicts(rows, STATS_RECORD_ALIASES)
+
+        return FastJSONResponse({
             "total": total,
             "page": page,
             "limit": limit,
-            "stats": stats
-        }
+            "estimated": estimated,
+            "stats": stats,
+            "next_cursor": next_cursor,
+            "prev_cursor": prev_cursor
+        })
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -279,18 +515,24 @@ async def get_stats(
 async def create_stats_record(record: StatsRecord, db: aiosqlite.Connection = Depends(get_db)):
     """创建新的统计记录"""
     try:
-        async with db.execute(
-            """
+        sql = """
             INSERT INTO stats_records (
                 login_id, app_id, package, product_name, role_name,
                 device, cpu, gpu, memory, gpu_memory, created_at
             ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            RETURNING *
-            """,
-            (record.login_id, record.app_id, record.package, record.product_name,
-             record.role_name, record.device, record.cpu, record.gpu,
-             record.memory, record.gpu_memory, int(datetime.now().timestamp() * 1000))
-        ) as cursor:
+            """
+        created_at = int(datetime.now().timestamp() * 1000)
+        params = (record.login_id, record.app_id, record.package, record.product_name,
+                  record.role_name, record.device, record.cpu, record.gpu,
+                  record.memory, record.gpu_memory, created_at)
+
+        # 写后模式：放入队列，由后台任务分组提交
+        writer = get_writer()
+        if writer is not None:
+            record_id = await writer.submit(sql, params)
+            return {**record.model_dump(), "id": record_id, "created_at": created_at}
+
+        async with db.execute(sql + " RETURNING *", params) as cursor:
             row = await cursor.fetchone()
             await db.commit()
             return dict(row)
@@ -305,23 +547,25 @@ async def create_stats_record(record: StatsRecord, db: aiosqlite.Connection = De
 async def create_stats_info(info: StatsInfoDB, db: aiosqlite.Connection = Depends(get_db)):
     """创建新的统计信息"""
     try:
-        async with db.execute(
-            """
-            INSERT INTO stats_infos (
-                login_id, fps, total_mem, used_mem, mono_used_mem,
-                mono_heap_mem, texture, mesh, animation, audio,
-                font, text_asset, shader, pic, process, stat_time,
-                created_at
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            RETURNING *
-            """,
-            (info.login_id, info.fps, info.total_mem, info.used_mem,
-             info.mono_used_mem, info.mono_heap_mem, info.texture,
-             info.mesh, info.animation, info.audio, info.font,
-             info.text_asset, info.shader, info.pic, info.process,
-             info.stat_time, int(datetime.now().timestamp() * 1000))
-        ) as cursor:
+        created_at = int(datetime.now().timestamp() * 1000)
+        params = (info.login_id, info.fps, info.total_mem, info.used_mem,
+                  info.mono_used_mem, info.mono_heap_mem, info.texture,
+                  info.mesh, info.animation, info.audio, info.font,
+                  info.text_asset, info.shader, info.pic, info.process,
+                  info.stat_time, created_at)
+
+        # 写后模式：放入队列，由后台任务分组提交
+        writer = get_writer()
+        if writer is not None:
+            info_id = await writer.submit(INSERT_STATS_INFO_SQL, params)
+            publish_stats_info(info_id, params)
+            db_model = StatsInfoDB(**{**info.model_dump(), "id": 0, "created_at": created_at})
+            return StatsInfoAPI.from_db(db_model).model_copy(update={"id": info_id})
+
+        async with db.execute(INSERT_STATS_INFO_SQL + " RETURNING *", params) as cursor:
             row = await cursor.fetchone()
+            await db.commit()
+            publish_stats_info(row["id"], params)
             # 转换为 API 响应模型
             db_model = StatsInfoDB(**dict(row))
             return StatsInfoAPI.from_db(db_model)
@@ -363,7 +607,14 @@ async def delete_stats(stats_id: int, db: aiosqlite.Connection = Depends(get_db)
         ):
             infos_deleted = cursor.rowcount
 
+        await db.execute(
+            "DELETE FROM stats_rollups WHERE login_id = ?",
+            (login_id,)
+        )
+
         await db.commit()
+        # 清理不再被引用的截图
+        await collect_screenshots(db)
         return {
             "code": 0,
             "message": f"Stats {stats_id} deleted successfully",
@@ -381,38 +632,174 @@ async def delete_stats(stats_id: int, db: aiosqlite.Connection = Depends(get_db)
             detail=f"Failed to delete stats: {str(e)}"
         )
 
-@router.post("/", response_model=dict)
+def body_validation_error(e: ValidationError) -> RequestValidationError:
+    """与 FastAPI 自动校验请求体时的错误格式保持一致"""
+    return RequestValidationError([
+        {**error, "loc": ("body", *error["loc"])} for error in e.errors()
+    ])
+
+
+async def receive_stats_multipart(request: Request, content_type: str) -> tuple[StatsRequest, Optional[tuple]]:
+    """解析 multipart 形式的统计数据。
+
+    指标可以放在名为 stats 的 JSON 部分中，也可以逐个作为表单字段；
+    图片放在名为 pic 的部分，边接收边写入磁盘，校验通过后才按内容哈希落盘。
+    """
+    fields = {}
+    upload = None
+    name = None
+    value = bytearray()
+    form_size = 0
+    try:
+        async for event, payload in iter_multipart(request.stream(), content_type):
+            if event == "part":
+                name = payload["name"]
+                if name == "pic":
+                    if upload is not None:
+                        raise HTTPException(status_code=400, detail="Only one pic part is allowed")
+                    upload = ScreenshotUpload()
+            elif event == "data":
+                if name == "pic":
+                    await upload.write(payload)
+                else:
+                    form_size += len(payload)
+                    if form_size > MAX_FORM_FIELDS_SIZE:
+                        raise HTTPException(
+                            status_code=413,
+                            detail=f"Form fields are larger than {MAX_FORM_FIELDS_SIZE} bytes"
+                        )
+                    value.extend(payload)
+            elif event == "end":
+                if name == "stats":
+                    data = json.loads(value)
+                    if not isinstance(data, dict):
+                        raise ValueError("stats part must be a JSON object")
+                    fields.update(data)
+                elif name != "pic":
+                    fields[name] = value.decode("utf-8")
+                value.clear()
+
+        fields["pic"] = ""
+        try:
+            stats = StatsRequest.model_validate(fields)
+        except ValidationError as e:
+            raise body_validation_error(e)
+
+        screenshot_params = None
+        if upload is not None and upload.size > 0:
+            stats.pic, screenshot_params = await upload.finish()
+            upload = None
+        return stats, screenshot_params
+    except ValueError as e:
+        raise HTTPException(
+            status_code=413 if upload is not None and upload.size > upload.max_size else 400,
+            detail=f"Invalid multipart body: {str(e)}"
+        )
+    finally:
+        if upload is not None:
+            await upload.abort()
+
+
+@router.post("/", response_model=dict, openapi_extra=CREATE_STATS_OPENAPI)
 async def create_stats(
-    stats: StatsRequest,
+    request: Request,
     db: aiosqlite.Connection = Depends(get_db)
 ):
-    """创建统计记录和详细信息"""
-    try:
-        # 1. 处理图片数据
+    """创建统计记录和详细信息。
+
+    请求体为 JSON（pic 为 base64 图片），或 multipart/form-data（pic 为图片文件部分）
+    """
+    screenshot_params = None
+    content_type = request.headers.get("content-type", "")
+    if content_type.startswith("multipart/form-data"):
+        # 1. multipart：图片已在接收时流式写入磁盘
+        stats, screenshot_params = await receive_stats_multipart(request, content_type)
+    else:
+        try:
+            stats = StatsRequest.model_validate_json(await request.body())
+        except ValidationError as e:
+            raise body_validation_error(e)
+
+        # 1. 处理图片数据：在线程池中解码，按内容哈希保存，相同图片只写一次
         if stats.pic:
             try:
-                # 解码 base64 数据
-                image_data = base64.b64decode(stats.pic)
-                
-                # 生成图片文件名
-                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
-                image_filename = f"screenshot_{timestamp}.jpg"
-                image_path = UPLOAD_DIR / image_filename
-                
-                # 异步写入图片文件
-                async with aiofiles.open(image_path, 'wb') as f:
-                    await f.write(image_data)
-                
-                # 更新图片路径
-                relative_path = f"uploads/{image_filename}"
-                stats.pic = relative_path
-                
+                stats.pic, screenshot_params = await store_screenshot(stats.pic)
             except Exception as e:
                 raise HTTPException(
                     status_code=400,
                     detail=f"Failed to process image: {str(e)}"
                 )
 
+    try:
+        created_at = int(datetime.now().timestamp() * 1000)
+        info_params = (
+            stats.login_id,
+            stats.fps,
+            stats.total_mem,
+            stats.used_mem,
+            stats.mono_used_mem,
+            stats.mono_heap_mem,
+            stats.texture,
+            stats.mesh,
+            stats.animation,
+            stats.audio,
+            stats.font,
+            stats.text_asset,
+            stats.shader,
+            stats.pic,
+            stats.process,
+            stats.stat_time,
+            created_at
+        )
+
+        # 写后模式：截图登记、记录和详细信息作为一项入队，在同一事务中提交
+        writer = get_writer()
+        if writer is not None:
+            statements = []
+            if screenshot_params:
+                statements.append((REGISTER_SCREENSHOT_SQL, screenshot_params))
+            statements.append((
+                UPSERT_STATS_RECORD_SQL,
+                (
+                    stats.login_id,
+                    stats.app_id,
+                    stats.package,
+                    stats.product_name,
+                    stats.role_name,
+                    stats.device,
+                    stats.cpu,
+                    stats.gpu,
+                    stats.memory,
+                    stats.gpu_memory,
+                    stats.stat_time,
+                    created_at
+                )
+            ))
+            statements.append((INSERT_STATS_INFO_SQL, info_params))
+            # 写入失败时仍登记截图，由回收任务删除无人引用的文件
+            fallback = [(REGISTER_SCREENSHOT_SQL, screenshot_params)] if screenshot_params else None
+            info_id = await writer.submit_many(statements, fallback)
+            publish_stats_info(info_id, info_params)
+            return {
+                "code": 0,
+                "message": "Stats queued successfully",
+                "data": {
+                    "statsRecord": stats.model_dump(include={
+                        "login_id", "app_id", "package", "product_name", "role_name",
+                        "device", "cpu", "gpu", "memory", "gpu_memory", "stat_time"
+                    }),
+                    "statsInfo": {
+                        "id": info_id,
+                        **stats.model_dump(include={
+                            "login_id", "fps", "total_mem", "used_mem", "mono_used_mem",
+                            "mono_heap_mem", "texture", "mesh", "animation", "audio",
+                            "font", "text_asset", "shader", "pic", "process", "stat_time"
+                        }),
+                        "created_at": created_at
+                    }
+                }
+            }
+
         # 2. 检查并处理 stats_records 数据
         async with db.execute(
             "SELECT id FROM stats_records WHERE login_id = ?",
@@ -467,41 +854,19 @@ async def create_stats(
                 record_row = await cursor.fetchone()
                 record = dict(record_row)
 
-        # 3. 插入 stats_infos 数据
+        # 3. 登记截图并插入 stats_infos 数据，触发器会增加截图的引用数
+        if screenshot_params:
+            await db.execute(REGISTER_SCREENSHOT_SQL, screenshot_params)
+
         async with db.execute(
-            """
-            INSERT INTO stats_infos (
-                login_id, fps, total_mem, used_mem, mono_used_mem,
-                mono_heap_mem, texture, mesh, animation, audio,
-                font, text_asset, shader, pic, process, stat_time,
-                created_at
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            RETURNING *
-            """,
-            (
-                stats.login_id,
-                stats.fps,
-                stats.total_mem,
-                stats.used_mem,
-                stats.mono_used_mem,
-                stats.mono_heap_mem,
-                stats.texture,
-                stats.mesh,
-                stats.animation,
-                stats.audio,
-                stats.font,
-                stats.text_asset,
-                stats.shader,
-                stats.pic,
-                stats.process,
-                stats.stat_time,
-                int(datetime.now().timestamp() * 1000)
-            )
+            INSERT_STATS_INFO_SQL + " RETURNING *",
+            info_params
         ) as cursor:
             info_row = await cursor.fetchone()
             info = dict(info_row)
 
         await db.commit()
+        publish_stats_info(info["id"], info_params)
 
         return {
             "code": 0,
@@ -515,6 +880,8 @@ async def create_stats(
     except HTTPException:
         raise
     except Exception as e:
+        if screenshot_params and get_writer() is None:
+            await release_screenshot(db, screenshot_params)
         raise HTTPException(
             status_code=500,
             detail=f"Failed to create stats: {str(e)}"
@@ -0,0 +1,146 @@
+from fastapi import APIRouter, Depends, HTTPException
+import aiosqlite
+from app import database
+from app.database import get_db
+from app.models import RetentionPolicy
+from app.follow import watcher_metrics
+from app.retention import get_retention
+from app.pubsub import broker
+from app.writebehind import get_writer
+
+router = APIRouter()
+
+@router.get("/db/pool")
+async def get_pool_metrics():
+    """获取数据库连接池的统计信息"""
+    if database.pool is None:
+        return {
+            "code": 0,
+            "enabled": False
+        }
+
+    return {
+        "code": 0,
+        "enabled": True,
+        **database.pool.metrics()
+    }
+
+@router.get("/db/writer")
+async def get_writer_metrics():
+    """获取写后队列的统计信息"""
+    writer = get_writer()
+    if writer is None:
+        return {
+            "code": 0,
+            "enabled": False
+        }
+
+    return {
+        "code": 0,
+        "enabled": True,
+        **writer.metrics()
+    }
+
+@router.post("/db/writer/flush")
+async def flush_writer():
+    """立即提交写后队列中已有的数据"""
+    writer = get_writer()
+    if writer is not None:
+        await writer.flush()
+    return {
+        "code": 0,
+        "message": "Write-behind queue flushed"
+    }
+
+@router.get("/tail")
+async def get_tail_metrics():
+    """获取实时推送的订阅者和丢弃统计，以及被跟踪的文件"""
+    return {
+        "code": 0,
+        **broker.metrics(),
+        **watcher_metrics()
+    }
+
+@router.get("/retention/policies")
+async def get_retention_policies(db: aiosqlite.Connection = Depends(get_db)):
+    """获取数据保留策略"""
+    async with db.execute(
+        "SELECT target, app_id, days FROM retention_policies ORDER BY target, app_id"
+    ) as cursor:
+        policies = [dict(row) for row in await cursor.fetchall()]
+    return {
+        "code": 0,
+        "policies": policies,
+        "interval": get_retention().interval
+    }
+
+@router.put("/retention/policies")
+async def put_retention_policy(policy: RetentionPolicy, db: aiosqlite.Connection = Depends(get_db)):
+    """新增或修改数据保留策略"""
+    await db.execute(
+        """
+        INSERT INTO retention_policies (target, app_id, days) VALUES (?, ?, ?)
+        ON CONFLICT(target, app_id) DO UPDATE SET days = excluded.days
+        """,
+        (policy.target, policy.app_id, policy.days)
+    )
+    await db.commit()
+    return {
+        "code": 0,
+        "message": "Retention policy saved",
+        "policy": policy.model_dump()
+    }
+
+@router.delete("/retention/policies/{target}")
+async def delete_retention_policy(target: str, app_id: str = "", db: aiosqlite.Connection = Depends(get_db)):
+    """删除数据保留策略"""
+    async with db.execute(
+        "DELETE FROM retention_policies WHERE target = ? AND app_id = ?",
+        (target, app_id)
+    ) as cursor:
+        deleted = cursor.rowcount
+    await db.commit()
+    if not deleted:
+        raise HTTPException(status_code=404, detail="Retention policy not found")
+    return {
+        "code": 0,
+        "message": "Retention policy deleted"
+    }
+
+@router.post("/retention/run")
+async def run_retention_policies():
+    """立即按保留策略提交清理任务"""
+    jobs = await get_retention().run_policies()
+    return {
+        "code": 0,
+        "jobs": [job.to_dict() for job in jobs]
+    }
+
+@router.get("/retention/jobs")
+async def get_retention_jobs():
+    """获取最近的清理任务"""
+    return {
+        "code": 0,
+        "jobs": [job.to_dict() for job in reversed(get_retention().jobs.values())]
+    }
+
+@router.get("/retention/jobs/{job_id}")
+async def get_retention_job(job_id: int):
+    """获取清理任务的进度"""
+    job = get_retention().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Retention job {job_id} not found")
+    return {
+        "code": 0,
+        **job.to_dict()
+    }
+
+@router.post("/retention/jobs/{job_id}/cancel")
+async def cancel_retention_job(job_id: int):
+    """取消尚未完成的清理任务，已删除的批次不会恢复"""
+    if not get_retention().cancel(job_id):
+        raise HTTPException(status_code=404, detail=f"Retention job {job_id} not found or already finished")
+    return {
+        "code": 0,
+        "message": f"Retention job {job_id} cancelled"
+    }
@@ -0,0 +1,284 @@
+"""请求体解压与响应压缩中间件（gzip，安装 zstandard 后支持 zstd）"""
+
+import asyncio
+import json
+import os
+import zlib
+from collections import deque
+
+from fastapi import HTTPException
+
+try:
+    import zstandard
+except ImportError:  # zstandard 为可选依赖，未安装时只支持 gzip
+    zstandard = None
+
+# 接受压缩请求体的接口（前缀匹配）
+DECOMPRESS_PATHS = ("/api/logs", "/api/stats")
+# 解压后请求体的大小上限（字节），防止压缩炸弹
+MAX_DECOMPRESSED_SIZE = int(os.environ.get("MAX_DECOMPRESSED_SIZE", str(64 * 1024 * 1024)))
+# 单次解压输出的最大长度
+DECOMPRESS_CHUNK_SIZE = 256 * 1024
+
+# 启用响应压缩的 GET 接口（前缀匹配）
+COMPRESS_PATHS = ("/api/stats/details", "/api/logs")
+# 小于该大小的响应不压缩
+COMPRESS_MIN_SIZE = 1024
+# 超过该大小的响应放到线程中压缩，避免阻塞事件循环
+COMPRESS_THREAD_SIZE = 256 * 1024
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 3
+
+
+def supported_encodings() -> tuple[str, ...]:
+    if zstandard is not None:
+        return ("zstd", "gzip")
+    return ("gzip",)
+
+
+def _match(path: str, prefixes: tuple[str, ...]) -> bool:
+    return any(path == prefix or path.startswith(prefix + "/") for prefix in prefixes)
+
+
+def _header(scope, name: bytes) -> str:
+    for key, value in scope["headers"]:
+        if key == name:
+            return value.decode("latin-1")
+    return ""
+
+
+def _too_large() -> HTTPException:
+    return HTTPException(
+        status_code=413,
+        detail=f"Decompressed body is larger than {MAX_DECOMPRESSED_SIZE} bytes"
+    )
+
+
+class _Decompressor:
+    """增量解压，每次输出不超过 DECOMPRESS_CHUNK_SIZE，累计超过 MAX_DECOMPRESSED_SIZE 时抛出 413"""
+
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        self.size = 0
+        if encoding == "zstd":
+            # zstandard 的 decompressobj 不能限制输出长度，一小段输入就可能解压出上 GB 的数据；
+            # stream_writer 按 write_size 分段把输出写给 self.write，超出上限时立即中止
+            self._output = []
+            self._obj = zstandard.ZstdDecompressor().stream_writer(
+                self, write_size=DECOMPRESS_CHUNK_SIZE, closefd=False
+            )
+        else:
+            self._obj = zlib.decompressobj(16 + zlib.MAX_WBITS)
+
+    def write(self, data) -> int:
+        """stream_writer 的输出目标"""
+        self._count(len(data))
+        self._output.append(bytes(data))
+        return len(data)
+
+    def _count(self, length: int):
+        self.size += length
+        if self.size > MAX_DECOMPRESSED_SIZE:
+            raise _too_large()
+
+    def feed(self, data: bytes):
+        if self.encoding == "zstd":
+            if data:
+                self._obj.write(data)
+            output, self._output = self._output, []
+            yield from output
+            return
+        output = self._obj.decompress(data, DECOMPRESS_CHUNK_SIZE)
+        while output:
+            self._count(len(output))
+            yield output
+            output = self._obj.decompress(self._obj.unconsumed_tail, DECOMPRESS_CHUNK_SIZE)
+
+    def finish(self):
+        if self.encoding != "zstd" and not self._obj.eof:
+            raise zlib.error("incomplete gzip stream")
+
+
+class RequestDecompressionMiddleware:
+    """按 Content-Encoding 流式解压请求体，接口拿到的仍是原始内容。
+
+    解压后的数据超过 MAX_DECOMPRESSED_SIZE 时返回 413，数据损坏时返回 400。
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not _match(scope["path"], DECOMPRESS_PATHS):
+            await self.app(scope, receive, send)
+            return
+
+        encoding = _header(scope, b"content-encoding").strip().lower()
+        if encoding in ("", "identity"):
+            await self.app(scope, receive, send)
+            return
+        if encoding == "x-gzip":
+            encoding = "gzip"
+        if encoding not in supported_encodings():
+            await self._reject(send, 415, f"Unsupported Content-Encoding: {encoding}")
+            return
+
+        # 去掉压缩相关的请求头，后续读取到的是解压后的内容
+        scope = dict(scope)
+        scope["headers"] = [
+            (key, value) for key, value in scope["headers"]
+            if key not in (b"content-encoding", b"content-length")
+        ]
+
+        decompressor = _Decompressor(encoding)
+        pending = deque()
+        state = {"done": False}
+
+        async def receive_decompressed():
+            while not pending:
+                if state["done"]:
+                    return {"type": "http.request", "body": b"", "more_body": False}
+                message = await receive()
+                if message["type"] != "http.request":
+                    return message
+                try:
+                    pending.extend(decompressor.feed(message.get("body", b"")))
+                    if not message.get("more_body", False):
+                        decompressor.finish()
+                        state["done"] = True
+                except HTTPException:
+                    raise
+                except Exception as e:
+                    raise HTTPException(
+                        status_code=400,
+                        detail=f"Failed to decompress request body: {str(e)}"
+                    )
+            return {"type": "http.request", "body": pending.popleft(), "more_body": True}
+
+        await self.app(scope, receive_decompressed, send)
+
+    @staticmethod
+    async def _reject(send, status: int, detail: str):
+        body = json.dumps({"detail": detail}).encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode("latin-1")),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+
+def negotiate_encoding(accept_encoding: str) -> str | None:
+    """根据 Accept-Encoding 选择压缩算法，q 值相同时优先 zstd"""
+    weights = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        name = name.strip().lower()
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        if name:
+            weights[name] = quality
+
+    best, best_quality = None, 0.0
+    for encoding in supported_encodings():
+        quality = weights.get(encoding, weights.get("*", 0.0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+class _Compressor:
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        if encoding == "zstd":
+            self._obj = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compressobj()
+        else:
+            self._obj = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes, final: bool) -> bytes:
+        """压缩一段数据；非最后一段时立即刷新，保证流式响应能及时送达"""
+        output = self._obj.compress(data)
+        if final:
+            return output + self._obj.flush()
+        if self.encoding == "zstd":
+            return output + self._obj.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+        return output + self._obj.flush(zlib.Z_SYNC_FLUSH)
+
+
+class ResponseCompressionMiddleware:
+    """按 Accept-Encoding 压缩大的 JSON 读接口响应，同时支持普通响应和流式响应"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope["type"] != "http"
+            or scope["method"] != "GET"
+            or not _match(scope["path"], COMPRESS_PATHS)
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        encoding = negotiate_encoding(_header(scope, b"accept-encoding"))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        state = {"start": None, "compressor": None, "passthrough": False}
+
+        async def send_compressed(message):
+            if message["type"] == "http.response.start":
+                state["start"] = message
+                return
+            if message["type"] != "http.response.body" or state["passthrough"]:
+                await send(message)
+                return
+
+            start = state["start"]
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+
+            if state["compressor"] is None:
+                headers = [(key.lower(), value) for key, value in start["headers"]]
+                content_type = dict(headers).get(b"content-type", b"")
+                if (
+                    b"content-encoding" in dict(headers)
+                    or content_type.startswith(b"text/event-stream")
+                    or (not more_body and len(body) < COMPRESS_MIN_SIZE)
+                ):
+                    state["passthrough"] = True
+                    await send(start)
+                    await send(message)
+                    return
+
+                state["compressor"] = _Compressor(encoding)
+                if len(body) >= COMPRESS_THREAD_SIZE:
+                    body = await asyncio.to_thread(state["compressor"].compress, body, not more_body)
+                else:
+                    body = state["compressor"].compress(body, not more_body)
+
+                headers = [
+                    (key, value) for key, value in headers
+                    if key != b"content-length"
+                ]
+                headers.append((b"content-encoding", encoding.encode("latin-1")))
+                headers.append((b"vary", b"Accept-Encoding"))
+                if not more_body:
+                    headers.append((b"content-length", str(len(body)).encode("latin-1")))
+                await send({**start, "headers": headers})
+                await send({"type": "http.response.body", "body": body, "more_body": more_body})
+                return
+
+            body = state["compressor"].compress(body, not more_body)
+            await send({"type": "http.response.body", "body": body, "more_body": more_body})
+
+        await self.app(scope, receive, send_compressed)
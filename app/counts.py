@@ -0,0 +1,75 @@
+import os
+import time
+from collections import OrderedDict
+
+import aiosqlite
+
+# 带搜索条件的总数缓存时间（秒）和最大条目数
+COUNT_CACHE_TTL = float(os.environ.get("COUNT_CACHE_TTL", "10"))
+COUNT_CACHE_SIZE = int(os.environ.get("COUNT_CACHE_SIZE", "1024"))
+
+
+class CountCache:
+    """带过期时间的 LRU 缓存，保存带过滤条件的 COUNT 结果"""
+
+    def __init__(self, ttl: float = COUNT_CACHE_TTL, maxsize: int = COUNT_CACHE_SIZE):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._items: OrderedDict = OrderedDict()
+
+    def get(self, key) -> int | None:
+        item = self._items.get(key)
+        if item is None:
+            return None
+        expires_at, value = item
+        if expires_at < time.monotonic():
+            del self._items[key]
+            return None
+        self._items.move_to_end(key)
+        return value
+
+    def set(self, key, value: int):
+        self._items[key] = (time.monotonic() + self.ttl, value)
+        self._items.move_to_end(key)
+        while len(self._items) > self.maxsize:
+            self._items.popitem(last=False)
+
+    def clear(self):
+        self._items.clear()
+
+
+count_cache = CountCache()
+
+
+async def get_total(
+    db: aiosqlite.Connection,
+    table: str,
+    count_query: str,
+    params: list,
+    filtered: bool = False,
+    exact: bool = False
+) -> tuple[int, bool]:
+    """获取列表总数，返回 (总数, 是否为估算值)。
+
+    无过滤条件时直接读取触发器维护的计数表；有过滤条件时优先使用短期缓存，
+    缓存命中的结果可能略有滞后，因此标记为估算值。
+    """
+    if not filtered:
+        async with db.execute(
+            "SELECT total FROM table_counts WHERE name = ?", (table,)
+        ) as cursor:
+            row = await cursor.fetchone()
+        if row is not None:
+            return row["total"], False
+
+    key = (table, count_query, tuple(params))
+    if filtered and not exact:
+        cached = count_cache.get(key)
+        if cached is not None:
+            return cached, True
+
+    async with db.execute(count_query, params) as cursor:
+        total = (await cursor.fetchone())["total"]
+    if filtered:
+        count_cache.set(key, total)
+    return total, False
@@ -1,14 +1,536 @@
-import aiosqlite
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager
 from pathlib import Path
 
+import aiosqlite
+import anyio
+
+from app.fingerprint import log_fingerprint
+
 DB_PATH = Path("db/logs.db")
 
+# 连接池配置，可通过环境变量覆盖
+POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", "4"))
+POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", "30"))
+MMAP_SIZE = int(os.environ.get("DB_MMAP_SIZE", str(256 * 1024 * 1024)))
+CACHE_SIZE = int(os.environ.get("DB_CACHE_SIZE", "-65536"))  # 负数表示 KiB，即 64MB
+BUSY_TIMEOUT = int(os.environ.get("DB_BUSY_TIMEOUT", "5000"))  # 毫秒
+
+
+async def configure_connection(db: aiosqlite.Connection):
+    """为新连接设置 PRAGMA"""
+    db.row_factory = aiosqlite.Row
+    await db.execute("PRAGMA journal_mode=WAL")
+    await db.execute("PRAGMA synchronous=NORMAL")
+    await db.execute(f"PRAGMA mmap_size={MMAP_SIZE}")
+    await db.execute(f"PRAGMA cache_size={CACHE_SIZE}")
+    await db.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT}")
+    await db.execute("PRAGMA temp_store=MEMORY")
+
+
+class ConnectionPool:
+    """常驻的 SQLite 连接池，连接在启动时预热，请求之间复用"""
+
+    def __init__(self, path: Path = DB_PATH, size: int = POOL_SIZE, timeout: float = POOL_TIMEOUT):
+        self.path = path
+        self.size = size
+        self.timeout = timeout
+        self._idle: asyncio.Queue[aiosqlite.Connection] = asyncio.Queue()
+        self._connections: list[aiosqlite.Connection] = []
+        self._closed = True
+        # 统计指标
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    async def open(self):
+        """创建并预热所有连接"""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        for _ in range(self.size):
+            db = await aiosqlite.connect(self.path)
+            await configure_connection(db)
+            self._connections.append(db)
+            self._idle.put_nowait(db)
+        self._closed = False
+
+    async def close(self):
+        """关闭所有连接"""
+        self._closed = True
+        for db in self._connections:
+            await db.close()
+        self._connections.clear()
+        self._idle = asyncio.Queue()
+
+    @asynccontextmanager
+    async def acquire(self):
+        """借出一个连接，用完后归还；未提交的事务会被回滚"""
+        if self._closed:
+            raise RuntimeError("Connection pool is closed")
+
+        start = time.perf_counter()
+        try:
+            db = await asyncio.wait_for(self._idle.get(), self.timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise
+        waited = time.perf_counter() - start
+        self.checkouts += 1
+        self.wait_total += waited
+        self.wait_max = max(self.wait_max, waited)
+
+        try:
+            yield db
+        finally:
+            # 流式响应被取消时同样要回滚并归还连接，否则连接池会少一个连接
+            with anyio.CancelScope(shield=True):
+                if db.in_transaction:
+                    await db.rollback()
+                if self._closed:
+                    await db.close()
+                else:
+                    self._idle.put_nowait(db)
+
+    def metrics(self) -> dict:
+        """连接池统计信息"""
+        return {
+            "size": self.size,
+            "idle": self._idle.qsize(),
+            "in_use": self.size - self._idle.qsize() if not self._closed else 0,
+            "checkouts": self.checkouts,
+            "timeouts": self.timeouts,
+            "wait_avg_ms": (self.wait_total / self.checkouts * 1000) if self.checkouts else 0.0,
+            "wait_max_ms": self.wait_max * 1000,
+        }
+
+
+pool: ConnectionPool | None = None
+
+# 日志全文索引是否可用，由 init_db 检测
+fts_enabled = False
+
+# 由计数表维护总行数的表
+COUNTED_TABLES = ("logs", "stats_records")
+
+# stats_infos 中需要聚合的指标列
+STATS_METRICS = (
+    "fps", "total_mem", "used_mem", "mono_used_mem", "mono_heap_mem",
+    "texture", "mesh", "animation", "audio", "font", "text_asset", "shader",
+)
+
+# stats_infos 的全部列，按建表顺序
+STATS_INFO_COLUMNS = (
+    "id", "login_id", *STATS_METRICS, "pic", "process", "stat_time", "created_at",
+)
+
+# 聚合粒度（毫秒）
+ROLLUP_RESOLUTIONS = {"10s": 10_000, "1m": 60_000, "1h": 3_600_000}
+
+
+async def open_pool() -> ConnectionPool:
+    global pool
+    pool = ConnectionPool()
+    await pool.open()
+    return pool
+
+
+async def close_pool():
+    global pool
+    if pool is not None:
+        await pool.close()
+        pool = None
+
+
 async def get_db():
-    async with aiosqlite.connect(DB_PATH) as db:
-        db.row_factory = aiosqlite.Row
+    # 连接池未启用时（例如脚本直接调用）退回到一次性连接
+    if pool is None:
+        async with aiosqlite.connect(DB_PATH) as db:
+            db.row_factory = aiosqlite.Row
+            yield db
+        return
+
+    async with pool.acquire() as db:
         yield db
 
+
+# 在请求之外（后台任务、流式响应）借用连接：async with db_connection() as db
+db_connection = asynccontextmanager(get_db)
+
+async def init_logs_fts(db: aiosqlite.Connection):
+    """创建日志的 FTS5 全文索引及同步触发器，首次创建时回填已有数据"""
+    global fts_enabled
+    async with db.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'logs_fts'"
+    ) as cursor:
+        exists = await cursor.fetchone() is not None
+
+    try:
+        await db.execute("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS logs_fts USING fts5(
+                role_name,
+                log_message,
+                log_stack,
+                content='logs',
+                content_rowid='id',
+                prefix='2 3'
+            )
+        """)
+    except aiosqlite.OperationalError:
+        # SQLite 未编译 FTS5 时退回到 LIKE 搜索
+        fts_enabled = False
+        return
+
+    await db.execute("""
+        CREATE TRIGGER IF NOT EXISTS logs_fts_insert AFTER INSERT ON logs BEGIN
+            INSERT INTO logs_fts(rowid, role_name, log_message, log_stack)
+            VALUES (new.id, new.role_name, new.log_message, new.log_stack);
+        END
+    """)
+    await db.execute("""
+        CREATE TRIGGER IF NOT EXISTS logs_fts_delete AFTER DELETE ON logs BEGIN
+            INSERT INTO logs_fts(logs_fts, rowid, role_name, log_message, log_stack)
+            VALUES ('delete', old.id, old.role_name, old.log_message, old.log_stack);
+        END
+    """)
+    # 只在索引列变化时更新全文索引，回填 fingerprint 等其他列的 UPDATE 不需要重建索引；
+    # 旧版本的触发器没有列限制，每次启动时重新创建
+    await db.execute("DROP TRIGGER IF EXISTS logs_fts_update")
+    await db.execute("""
+        CREATE TRIGGER logs_fts_update AFTER UPDATE OF role_name, log_message, log_stack ON logs BEGIN
+            INSERT INTO logs_fts(logs_fts, rowid, role_name, log_message, log_stack)
+            VALUES ('delete', old.id, old.role_name, old.log_message, old.log_stack);
+            INSERT INTO logs_fts(rowid, role_name, log_message, log_stack)
+            VALUES (new.id, new.role_name, new.log_message, new.log_stack);
+        END
+    """)
+
+    if not exists:
+        # 回填已有日志
+        await db.execute("INSERT INTO logs_fts(logs_fts) VALUES ('rebuild')")
+    fts_enabled = True
+
+async def init_issues(db: aiosqlite.Connection):
+    """创建按指纹聚合的错误表及维护触发器；旧库会先补上 fingerprint 列并回填"""
+    async with db.execute("PRAGMA table_info(logs)") as cursor:
+        columns = [row[1] for row in await cursor.fetchall()]
+    migrate = "fingerprint" not in columns
+    if migrate:
+        await db.execute("ALTER TABLE logs ADD COLUMN fingerprint TEXT")
+
+    await db.execute("""
+        CREATE INDEX IF NOT EXISTS idx_logs_fingerprint ON logs(fingerprint)
+    """)
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS issues (
+            fingerprint TEXT PRIMARY KEY,
+            app_id TEXT,
+            log_type TEXT,
+            log_message TEXT,
+            log_stack TEXT,
+            first_seen INTEGER,
+            last_seen INTEGER,
+            count INTEGER NOT NULL DEFAULT 0,
+            devices INTEGER NOT NULL DEFAULT 0,
+            apps INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    await db.execute("""
+        CREATE INDEX IF NOT EXISTS idx_issues_last_seen ON issues(last_seen)
+    """)
+    await db.execute("""
+        CREATE INDEX IF NOT EXISTS idx_issues_count ON issues(count)
+    """)
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS issue_devices (
+            fingerprint TEXT,
+            device TEXT,
+            PRIMARY KEY (fingerprint, device)
+        ) WITHOUT ROWID
+    """)
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS issue_apps (
+            fingerprint TEXT,
+            app_id TEXT,
+            PRIMARY KEY (fingerprint, app_id)
+        ) WITHOUT ROWID
+    """)
+    # 每小时的出现次数，用于统计最近一段时间的高频错误
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS issue_hourly (
+            hour INTEGER,
+            fingerprint TEXT,
+            count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (hour, fingerprint)
+        ) WITHOUT ROWID
+    """)
+
+    await db.execute("""
+        CREATE TRIGGER IF NOT EXISTS logs_issue_insert AFTER INSERT ON logs
+        WHEN new.fingerprint IS NOT NULL BEGIN
+            INSERT INTO issues (
+                fingerprint, app_id, log_type, log_message, log_stack,
+                first_seen, last_seen, count
+            ) VALUES (
+                new.fingerprint, new.app_id, new.log_type, new.log_message, new.log_stack,
+                new.create_at, new.create_at, 1
+            )
+            ON CONFLICT(fingerprint) DO UPDATE SET
+                last_seen = max(last_seen, excluded.last_seen),
+                count = count + 1;
+
+            UPDATE issues SET devices = devices + 1
+            WHERE fingerprint = new.fingerprint AND NOT EXISTS (
+                SELECT 1 FROM issue_devices
+                WHERE fingerprint = new.fingerprint AND device = coalesce(new.device, '')
+            );
+            INSERT OR IGNORE INTO issue_devices (fingerprint, device)
+            VALUES (new.fingerprint, coalesce(new.device, ''));
+
+            UPDATE issues SET apps = apps + 1
+            WHERE fingerprint = new.fingerprint AND NOT EXISTS (
+                SELECT 1 FROM issue_apps
+                WHERE fingerprint = new.fingerprint AND app_id = coalesce(new.app_id, '')
+            );
+            INSERT OR IGNORE INTO issue_apps (fingerprint, app_id)
+            VALUES (new.fingerprint, coalesce(new.app_id, ''));
+
+            INSERT INTO issue_hourly (hour, fingerprint, count)
+            VALUES (new.create_at / 3600000, new.fingerprint, 1)
+            ON CONFLICT(hour, fingerprint) DO UPDATE SET count = count + 1;
+        END
+    """)
+
+    # 归档搬迁日志时置为 1（只在搬迁的事务内可见），此时删除触发器不减少计数
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS log_archiving (
+            active INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    await db.execute("INSERT INTO log_archiving (active) SELECT 0 WHERE NOT EXISTS (SELECT 1 FROM log_archiving)")
+    await db.execute("""
+        CREATE TRIGGER IF NOT EXISTS logs_issue_delete AFTER DELETE ON logs
+        WHEN old.fingerprint IS NOT NULL AND NOT coalesce((SELECT active FROM log_archiving), 0) BEGIN
+            UPDATE issues SET count = count - 1 WHERE fingerprint = old.fingerprint;
+            UPDATE issue_hourly SET count = count - 1
+            WHERE hour = old.create_at / 3600000 AND fingerprint = old.fingerprint;
+            DELETE FROM issue_hourly
+            WHERE hour = old.create_at / 3600000 AND fingerprint = old.fingerprint AND count <= 0;
+
+            DELETE FROM issue_devices WHERE fingerprint = old.fingerprint
+              AND (SELECT count FROM issues WHERE fingerprint = old.fingerprint) <= 0;
+            DELETE FROM issue_apps WHERE fingerprint = old.fingerprint
+              AND (SELECT count FROM issues WHERE fingerprint = old.fingerprint) <= 0;
+            DELETE FROM issues WHERE fingerprint = old.fingerprint AND count <= 0;
+        END
+    """)
+
+    if migrate:
+        await backfill_issues(db)
+
+async def backfill_issues(db: aiosqlite.Connection):
+    """为已有日志计算指纹并重建聚合表"""
+    await db.create_function("log_fingerprint", 2, log_fingerprint, deterministic=True)
+    await db.execute("""
+        UPDATE logs SET fingerprint = log_fingerprint(log_message, log_stack)
+        WHERE fingerprint IS NULL
+    """)
+    await db.execute("""
+        INSERT OR REPLACE INTO issues (
+            fingerprint, app_id, log_type, log_message, log_stack,
+            first_seen, last_seen, count, devices, apps
+        )
+        SELECT fingerprint, app_id, log_type, log_message, log_stack,
+               MIN(create_at), MAX(create_at), COUNT(*),
+               COUNT(DISTINCT coalesce(device, '')), COUNT(DISTINCT coalesce(app_id, ''))
+        FROM logs GROUP BY fingerprint
+    """)
+    await db.execute("""
+        INSERT OR IGNORE INTO issue_devices (fingerprint, device)
+        SELECT DISTINCT fingerprint, coalesce(device, '') FROM logs
+    """)
+    await db.execute("""
+        INSERT OR IGNORE INTO issue_apps (fingerprint, app_id)
+        SELECT DISTINCT fingerprint, coalesce(app_id, '') FROM logs
+    """)
+    await db.execute("""
+        INSERT OR REPLACE INTO issue_hourly (hour, fingerprint, count)
+        SELECT create_at / 3600000, fingerprint, COUNT(*)
+        FROM logs GROUP BY create_at / 3600000, fingerprint
+    """)
+
+def rollup_p95_sql(metric: str, alias: str = "stats_rollups") -> str:
+    """计算某个聚合桶内指标 p95（最近秩法）的相关子查询"""
+    return f"""(
+        SELECT value FROM (
+            SELECT {metric} AS value,
+                   ROW_NUMBER() OVER (ORDER BY {metric}) AS rank,
+                   COUNT(*) OVER () AS total
+            FROM stats_infos
+            WHERE stats_infos.login_id = {alias}.login_id
+              AND stats_infos.stat_time >= {alias}.bucket
+              AND stats_infos.stat_time < {alias}.bucket + {alias}.resolution
+        )
+        WHERE rank = (total * 95 + 99) / 100
+    )"""
+
+async def init_stats_rollups(db: aiosqlite.Connection):
+    """创建 stats_infos 的多粒度聚合表，由触发器在插入时增量维护。
+
+    每个桶保存 count 以及各指标的 min / max / sum；桶关闭（同一 login_id 出现更晚的桶）
+    时再从原始数据计算一次 p95 并标记 finalized。迟到的数据落入已关闭的桶时重新计算该桶的 p95。
+    """
+    async with db.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'stats_rollups'"
+    ) as cursor:
+        exists = await cursor.fetchone() is not None
+
+    metric_columns = ",\n".join(
+        f"{m}_min INTEGER, {m}_max INTEGER, {m}_sum INTEGER, {m}_p95 INTEGER"
+        for m in STATS_METRICS
+    )
+    await db.execute(f"""
+        CREATE TABLE IF NOT EXISTS stats_rollups (
+            login_id INTEGER,
+            resolution INTEGER,
+            bucket INTEGER,
+            count INTEGER NOT NULL,
+            finalized INTEGER NOT NULL DEFAULT 0,
+            {metric_columns},
+            PRIMARY KEY (login_id, resolution, bucket)
+        ) WITHOUT ROWID
+    """)
+    await db.execute("""
+        CREATE INDEX IF NOT EXISTS idx_stats_rollups_open
+        ON stats_rollups(login_id) WHERE finalized = 0
+    """)
+    # 保留策略按桶的时间分批删除过期的桶
+    await db.execute("""
+        CREATE INDEX IF NOT EXISTS idx_stats_rollups_bucket
+        ON stats_rollups(bucket, resolution)
+    """)
+
+    resolutions = " UNION ALL ".join(
+        f"SELECT {resolution} AS resolution" for resolution in ROLLUP_RESOLUTIONS.values()
+    )
+    insert_columns = ", ".join(f"{m}_min, {m}_max, {m}_sum" for m in STATS_METRICS)
+    finalize = ", ".join(f"{m}_p95 = {rollup_p95_sql(m)}" for m in STATS_METRICS)
+
+    # 旧版本的触发器不会为迟到的数据重新计算 p95，每次启动时重新创建
+    await db.execute("DROP TRIGGER IF EXISTS stats_infos_rollup")
+    await db.execute(f"""
+        CREATE TRIGGER stats_infos_rollup AFTER INSERT ON stats_infos
+        WHEN new.stat_time IS NOT NULL BEGIN
+            INSERT INTO stats_rollups (login_id, resolution, bucket, count, {insert_columns})
+            SELECT new.login_id, r.resolution, new.stat_time - new.stat_time % r.resolution, 1,
+                   {", ".join(f"new.{m}, new.{m}, new.{m}" for m in STATS_METRICS)}
+            FROM ({resolutions}) AS r
+            WHERE true
+            ON CONFLICT(login_id, resolution, bucket) DO UPDATE SET
+                count = count + 1,
+                {", ".join(
+                    f"{m}_min = min({m}_min, excluded.{m}_min), "
+                    f"{m}_max = max({m}_max, excluded.{m}_max), "
+                    f"{m}_sum = {m}_sum + excluded.{m}_sum"
+                    for m in STATS_METRICS
+                )};
+
+            UPDATE stats_rollups SET finalized = 1, {finalize}
+            WHERE login_id = new.login_id AND finalized = 0
+              AND bucket + resolution <= new.stat_time;
+
+            -- 迟到的数据：所在的桶已经关闭，按主键定位后重新计算 p95
+            UPDATE stats_rollups SET {finalize}
+            WHERE login_id = new.login_id AND finalized = 1
+              AND (resolution, bucket) IN (
+                  SELECT r.resolution, new.stat_time - new.stat_time % r.resolution
+                  FROM ({resolutions}) AS r
+              );
+        END
+    """)
+
+    if not exists:
+        # 回填已有数据
+        aggregates = ", ".join(f"MIN({m}), MAX({m}), SUM({m})" for m in STATS_METRICS)
+        for resolution in ROLLUP_RESOLUTIONS.values():
+            await db.execute(f"""
+                INSERT INTO stats_rollups (login_id, resolution, bucket, count, {insert_columns})
+                SELECT login_id, {resolution}, stat_time - stat_time % {resolution}, COUNT(*), {aggregates}
+                FROM stats_infos
+                WHERE stat_time IS NOT NULL
+                GROUP BY login_id, stat_time - stat_time % {resolution}
+            """)
+        # 除每个会话的最后一个桶外都已关闭，计算 p95
+        await db.execute(f"""
+            UPDATE stats_rollups SET finalized = 1, {finalize}
+            WHERE bucket + resolution <= (
+                SELECT MAX(stat_time) FROM stats_infos
+                WHERE stats_infos.login_id = stats_rollups.login_id
+            )
+        """)
+
+async def init_screenshots(db: aiosqlite.Connection):
+    """创建截图引用计数表，由 stats_infos 上的触发器维护引用数"""
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS screenshots (
+            path TEXT PRIMARY KEY,
+            hash TEXT NOT NULL,
+            size INTEGER,
+            refs INTEGER NOT NULL DEFAULT 0,
+            created_at INTEGER
+        )
+    """)
+    await db.execute("""
+        CREATE INDEX IF NOT EXISTS idx_screenshots_unreferenced
+        ON screenshots(created_at) WHERE refs <= 0
+    """)
+    await db.execute("""
+        CREATE TRIGGER IF NOT EXISTS stats_infos_screenshot_insert AFTER INSERT ON stats_infos
+        WHEN new.pic IS NOT NULL AND new.pic != '' BEGIN
+            UPDATE screenshots SET refs = refs + 1 WHERE path = new.pic;
+        END
+    """)
+    await db.execute("""
+        CREATE TRIGGER IF NOT EXISTS stats_infos_screenshot_delete AFTER DELETE ON stats_infos
+        WHEN old.pic IS NOT NULL AND old.pic != '' BEGIN
+            UPDATE screenshots SET refs = refs - 1 WHERE path = old.pic;
+        END
+    """)
+    await db.execute("""
+        CREATE TRIGGER IF NOT EXISTS stats_infos_screenshot_update AFTER UPDATE OF pic ON stats_infos
+        WHEN old.pic IS NOT new.pic BEGIN
+            UPDATE screenshots SET refs = refs - 1 WHERE path = old.pic;
+            UPDATE screenshots SET refs = refs + 1 WHERE path = new.pic;
+        END
+    """)
+
+async def init_table_counts(db: aiosqlite.Connection):
+    """创建计数表，由触发器在插入和删除时维护各表的总行数"""
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS table_counts (
+            name TEXT PRIMARY KEY,
+            total INTEGER NOT NULL
+        )
+    """)
+    for table in COUNTED_TABLES:
+        # 首次创建时回填已有行数
+        await db.execute(
+            f"INSERT OR IGNORE INTO table_counts (name, total) SELECT '{table}', COUNT(*) FROM {table}"
+        )
+        await db.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {table}_count_insert AFTER INSERT ON {table} BEGIN
+                UPDATE table_counts SET total = total + 1 WHERE name = '{table}';
+            END
+        """)
+        await db.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {table}_count_delete AFTER DELETE ON {table} BEGIN
+                UPDATE table_counts SET total = total - 1 WHERE name = '{table}';
+            END
+        """)
+
 async def init_db():
+    DB_PATH.parent.mkdir(parents=True, exist_ok=True)
     async with aiosqlite.connect(DB_PATH) as db:
         # 创建日志表
         await db.execute("""
@@ -22,7 +544,8 @@ async def init_db():
                 log_time INTEGER,
                 log_type TEXT,
                 log_stack TEXT,
-                create_at INTEGER
+                create_at INTEGER,
+                fingerprint TEXT
             )
         """)
         
@@ -37,6 +560,12 @@ async def init_db():
             CREATE INDEX IF NOT EXISTS idx_role_name_message ON logs(role_name, log_message)
         """)
 
+        # 创建日志全文索引
+        await init_logs_fts(db)
+
+        # 创建错误聚合表
+        await init_issues(db)
+
         # 创建统计记录表
         await db.execute("""
             CREATE TABLE IF NOT EXISTS stats_records (
@@ -99,5 +628,66 @@ async def init_db():
             CREATE INDEX IF NOT EXISTS idx_stats_infos_created_at 
             ON stats_infos(created_at)
         """)
+        await db.execute("""
+            CREATE INDEX IF NOT EXISTS idx_stats_infos_login_id_stat_time
+            ON stats_infos(login_id, stat_time)
+        """)
+
+        # 创建统计信息聚合表
+        await init_stats_rollups(db)
+
+        # 创建截图引用计数表
+        await init_screenshots(db)
         
-        await db.commit() 
\ No newline at end of file
+        # 创建计数表
+        await init_table_counts(db)
+
+        # 日志分区目录，记录已归档到独立文件的时间段
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS log_partitions (
+                name TEXT PRIMARY KEY,
+                start INTEGER NOT NULL,
+                end INTEGER NOT NULL,
+                rows INTEGER NOT NULL DEFAULT 0,
+                min_id INTEGER,
+                max_id INTEGER
+            )
+        """)
+        async with db.execute("PRAGMA table_info(log_partitions)") as cursor:
+            columns = [row[1] for row in await cursor.fetchall()]
+        if "min_id" not in columns:
+            # id 范围用于游标分页时跳过整个分区，旧分区在下次归档或清理时补上
+            await db.execute("ALTER TABLE log_partitions ADD COLUMN min_id INTEGER")
+            await db.execute("ALTER TABLE log_partitions ADD COLUMN max_id INTEGER")
+
+        # 创建数据保留策略表，app_id 为空字符串表示适用于所有应用
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS retention_policies (
+                target TEXT NOT NULL,
+                app_id TEXT NOT NULL DEFAULT '',
+                days INTEGER NOT NULL,
+                PRIMARY KEY (target, app_id)
+            )
+        """)
+
+        # 后台脚本任务的历史记录，输出保存在 output_path 指向的文件中
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS script_jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                script TEXT NOT NULL,
+                command TEXT NOT NULL,
+                parameters TEXT,
+                status TEXT NOT NULL,
+                exit_code INTEGER,
+                error TEXT,
+                timeout INTEGER,
+                output_path TEXT,
+                created_at INTEGER NOT NULL,
+                started_at INTEGER,
+                finished_at INTEGER
+            )
+        """)
+        await db.execute("CREATE INDEX IF NOT EXISTS idx_script_jobs_script ON script_jobs(script, id)")
+        await db.execute("CREATE INDEX IF NOT EXISTS idx_script_jobs_status ON script_jobs(status)")
+
+        await db.commit()
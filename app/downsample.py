@@ -0,0 +1,101 @@
+"""Largest-Triangle-Three-Buckets 降采样，用于图表数据"""
+
+try:
+    import numpy as np
+except ImportError:  # numpy 为可选依赖，未安装时使用纯 Python 实现
+    np = None
+
+
+def lttb_indices(x, y, threshold: int) -> list[int]:
+    """返回 LTTB 选中的点的下标（升序，包含首尾两点）。
+
+    x 需按升序排列；threshold 小于 3 或不小于点数时返回全部下标。
+    """
+    return lttb_indices_multi(x, [y], threshold)
+
+
+def lttb_indices_multi(x, series: list, threshold: int) -> list[int]:
+    """对共用 x 的多条曲线一起做 LTTB，只选出 threshold 个点。
+
+    每个桶选择各曲线三角形面积之和最大的点；各曲线先按自身的取值范围归一化，
+    避免数值大的指标（如内存）压过数值小的指标（如帧率）。
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return list(range(n))
+    if np is not None:
+        return _lttb_numpy(np.asarray(x, dtype=np.float64), np.asarray(series, dtype=np.float64), threshold)
+    return _lttb_python(x, [_normalize(y) for y in series], threshold)
+
+
+def _normalize(y) -> list[float]:
+    low, high = min(y), max(y)
+    if high == low:
+        return [0.0] * len(y)
+    return [(value - low) / (high - low) for value in y]
+
+
+def _lttb_numpy(x, ys, threshold: int) -> list[int]:
+    n = len(x)
+    low = ys.min(axis=1, keepdims=True)
+    spread = ys.max(axis=1, keepdims=True) - low
+    ys = np.divide(ys - low, spread, out=np.zeros_like(ys), where=spread > 0)
+
+    every = (n - 2) / (threshold - 2)
+    # 每个桶的边界及下一个桶的平均点可以一次性算出
+    edges = (np.arange(threshold - 1) * every).astype(np.int64) + 1
+    edges[-1] = n - 1
+    sums_x = np.concatenate(([0.0], np.cumsum(x)))
+    sums_y = np.concatenate((np.zeros((len(ys), 1)), np.cumsum(ys, axis=1)), axis=1)
+    next_start = edges[1:]
+    next_end = np.append(edges[2:], n)
+    counts = next_end - next_start
+    avg_x = (sums_x[next_end] - sums_x[next_start]) / counts
+    avg_y = (sums_y[:, next_end] - sums_y[:, next_start]) / counts
+
+    selected = [0]
+    a = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        ay = ys[:, a:a + 1]
+        area = np.abs(
+            (x[a] - avg_x[i]) * (ys[:, start:end] - ay)
+            - (x[a] - x[start:end]) * (avg_y[:, i:i + 1] - ay)
+        ).sum(axis=0)
+        a = int(start + np.argmax(area))
+        selected.append(a)
+    selected.append(n - 1)
+    return selected
+
+
+def _lttb_python(x, ys, threshold: int) -> list[int]:
+    n = len(x)
+    every = (n - 2) / (threshold - 2)
+    selected = [0]
+    a = 0
+    for i in range(threshold - 2):
+        # 下一个桶的平均点
+        next_start = int((i + 1) * every) + 1
+        next_end = min(int((i + 2) * every) + 1, n)
+        if i == threshold - 3:
+            next_start, next_end = n - 1, n
+        count = next_end - next_start
+        avg_x = sum(x[next_start:next_end]) / count
+        avg_ys = [sum(y[next_start:next_end]) / count for y in ys]
+
+        # 当前桶中与上一个选中点、下一个桶平均点构成最大三角形的点
+        start = int(i * every) + 1
+        end = int((i + 1) * every) + 1 if i < threshold - 3 else n - 1
+        ax = x[a]
+        best, best_area = start, -1.0
+        for j in range(start, end):
+            area = 0.0
+            for y, avg_y in zip(ys, avg_ys):
+                ay = y[a]
+                area += abs((ax - avg_x) * (y[j] - ay) - (ax - x[j]) * (avg_y - ay))
+            if area > best_area:
+                best, best_area = j, area
+        a = best
+        selected.append(a)
+    selected.append(n - 1)
+    return selected
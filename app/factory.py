@@ -2,12 +2,32 @@ from fastapi import FastAPI
 from fastapi.staticfiles import StaticFiles
 from contextlib import asynccontextmanager
 import sys, os
+from app.database import init_db, open_pool, close_pool
+from app.writebehind import start_writer, stop_writer
+from app.retention import start_retention, stop_retention
+from app.partitions import start_partitions, stop_partitions
+from app.jobs import start_jobs, stop_jobs
+from app.search import stop_search
+from app.responses import FastJSONResponse
+from app.compression import RequestDecompressionMiddleware, ResponseCompressionMiddleware
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # 启动时的初始化操作
+    await init_db()
+    await open_pool()
+    await start_writer()
+    await start_retention()
+    await start_partitions()
+    await start_jobs()
     yield
-    # 关闭时的清理操作
+    # 关闭时的清理操作，先停止后台任务，再把写后队列中的数据落盘
+    await stop_jobs()
+    await stop_search()
+    await stop_partitions()
+    await stop_retention()
+    await stop_writer()
+    await close_pool()
 
 def get_static_path():
     """获取静态文件目录"""
@@ -16,17 +36,22 @@ def get_static_path():
     return 'public'
 
 def create_app() -> FastAPI:
-    app = FastAPI(lifespan=lifespan)
+    app = FastAPI(lifespan=lifespan, default_response_class=FastJSONResponse)
+
+    # 压缩的请求体在进入接口前解压，大的读接口响应按 Accept-Encoding 压缩
+    app.add_middleware(RequestDecompressionMiddleware)
+    app.add_middleware(ResponseCompressionMiddleware)
     
     # 挂载静态文件目录
     app.mount("/static", StaticFiles(directory=get_static_path()), name="static")
     
     # 导入和注册路由
-    from app.api import stats, logs, shell, files
+    from app.api import stats, logs, shell, files, system
     
     app.include_router(stats.router, prefix="/api/stats", tags=["stats"])
     app.include_router(logs.router, prefix="/api/logs", tags=["logs"])
     app.include_router(shell.router, prefix="/api/shell", tags=["shell"])
     app.include_router(files.router, prefix="/api/files", tags=["files"])
+    app.include_router(system.router, prefix="/api/system", tags=["system"])
     
     return app
@@ -0,0 +1,31 @@
+import hashlib
+import re
+
+# 归一化规则：去掉每次出现都会变化的部分，使同一个错误得到相同的指纹
+_NORMALIZE_RULES = [
+    # 内存地址、十六进制偏移，例如 0x7f3a2c10、+0x1a
+    (re.compile(r"0x[0-9a-fA-F]+"), "0x?"),
+    # GUID
+    (re.compile(r"\b[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}\b"), "<guid>"),
+    # 较长的十六进制串（哈希、IL 偏移等）
+    (re.compile(r"\b[0-9a-fA-F]{8,}\b"), "<hex>"),
+    # 其余数字：行号、偏移、计数、时间等
+    (re.compile(r"\d+"), "0"),
+    # 空白
+    (re.compile(r"\s+"), " "),
+]
+
+
+def normalize(text: str | None) -> str:
+    """归一化日志文本"""
+    if not text:
+        return ""
+    for pattern, replacement in _NORMALIZE_RULES:
+        text = pattern.sub(replacement, text)
+    return text.strip()
+
+
+def log_fingerprint(log_message: str | None, log_stack: str | None) -> str:
+    """根据归一化后的消息和堆栈计算日志指纹"""
+    key = normalize(log_message) + "\n" + normalize(log_stack)
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()
@@ -0,0 +1,335 @@
+"""跟踪文件的追加内容（tail -f）。
+
+同一个文件只有一个 FileWatcher，由所有查看者共享：Linux 上通过 inotify 等待修改事件，
+其他平台定期 stat。监视器只维护文件的当前大小并在变化时唤醒查看者，
+每个查看者按自己的进度从文件中读取新增内容（通常来自页缓存），
+消费慢的查看者不会拖慢其他人，也不需要缓存已经读过的数据。
+"""
+
+import asyncio
+import codecs
+import ctypes
+import ctypes.util
+import logging
+import os
+import struct
+from pathlib import Path
+from typing import AsyncIterator, Callable
+
+from app.streaming import HEARTBEAT_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+# 不支持 inotify 时轮询文件大小的间隔（秒）
+FOLLOW_POLL_INTERVAL = float(os.environ.get("FOLLOW_POLL_INTERVAL", "0.5"))
+# 使用 inotify 时仍然定期 stat 的间隔（秒），网络文件系统上可能收不到事件
+FOLLOW_RECHECK_INTERVAL = 5.0
+# 收到事件后等待的时间（秒），合并连续的小块写入
+FOLLOW_COALESCE_DELAY = 0.05
+# 每次读取并推送的最大字节数
+FOLLOW_CHUNK_SIZE = 256 * 1024
+# 按行推送时单行的最大长度，超过时直接推送
+FOLLOW_LINE_LIMIT = 64 * 1024
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+_EVENT_HEADER = struct.Struct("iIII")
+
+try:
+    _libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+    _libc.inotify_init1
+    _libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+except (OSError, AttributeError, TypeError):  # 非 Linux 平台没有 inotify，退回到轮询
+    _libc = None
+
+
+class Inotify:
+    """进程内共享的 inotify 实例，事件按 watch descriptor 分发给回调"""
+
+    MASK = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_DELETE_SELF | IN_MOVE_SELF
+
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        fd = _libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.fd = fd
+        self.loop = loop
+        self._callbacks: dict[int, set[Callable[[], None]]] = {}
+        loop.add_reader(fd, self._read)
+
+    def add(self, path: Path, callback: Callable[[], None]) -> int:
+        wd = _libc.inotify_add_watch(self.fd, os.fsencode(path), self.MASK)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), f"inotify_add_watch failed for {path}")
+        self._callbacks.setdefault(wd, set()).add(callback)
+        return wd
+
+    def remove(self, wd: int, callback: Callable[[], None]):
+        callbacks = self._callbacks.get(wd)
+        if callbacks is None:
+            return
+        callbacks.discard(callback)
+        if not callbacks:
+            del self._callbacks[wd]
+            # 文件已删除时 watch 已被内核移除，这里返回错误可以忽略
+            _libc.inotify_rm_watch(self.fd, wd)
+
+    def close(self):
+        self.loop.remove_reader(self.fd)
+        os.close(self.fd)
+
+    def _read(self):
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except (BlockingIOError, InterruptedError):
+            return
+        woken = set()
+        position = 0
+        while position + _EVENT_HEADER.size <= len(data):
+            wd, _, _, length = _EVENT_HEADER.unpack_from(data, position)
+            position += _EVENT_HEADER.size + length
+            if wd not in woken:
+                woken.add(wd)
+                for callback in list(self._callbacks.get(wd, ())):
+                    callback()
+
+
+_inotify: Inotify | None = None
+
+
+def get_inotify() -> Inotify | None:
+    """当前事件循环上的 inotify 实例，不可用时返回 None"""
+    global _inotify
+    if _libc is None:
+        return None
+    loop = asyncio.get_running_loop()
+    if _inotify is not None and _inotify.loop is not loop:
+        if not _inotify.loop.is_closed():
+            _inotify.close()
+        _inotify = None
+    if _inotify is None:
+        try:
+            _inotify = Inotify(loop)
+        except OSError as e:
+            logger.warning("inotify is not available, falling back to polling: %s", e)
+            return None
+    return _inotify
+
+
+class FileWatcher:
+    """监视单个文件的大小变化并唤醒所有等待的查看者"""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.size = 0
+        self.inode = None
+        # 文件被截断或替换时递增，查看者据此从头读取
+        self.generation = 0
+        self.exists = True
+        self.followers = 0
+        self.changed = asyncio.Event()
+        # 第一次 stat 完成后才能确定起始位置
+        self.ready = asyncio.Event()
+        self._wakeup = asyncio.Event()
+        self._inotify: Inotify | None = None
+        self._wd: int | None = None
+        self._watched_inode = None
+        self._task: asyncio.Task | None = None
+        self._closed = False
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    def close(self):
+        """同步停止监视，不包含 await。
+
+        查看者断开时清理代码运行在 anyio 的取消范围内，每次 await 都会再次被取消，
+        所以这里只取消监视任务而不等待它结束，并立即移除 inotify watch。
+        """
+        self._closed = True
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        self._unwatch()
+
+    @property
+    def mode(self) -> str:
+        return "inotify" if self._wd is not None else "polling"
+
+    def _notify(self):
+        changed, self.changed = self.changed, asyncio.Event()
+        changed.set()
+
+    def _watch(self):
+        """按当前 inode 注册 inotify，文件被替换后需要重新注册"""
+        if self._closed or (self.inode == self._watched_inode and self._wd is not None):
+            return
+        self._unwatch()
+        self._inotify = get_inotify()
+        if self._inotify is None or not self.exists:
+            return
+        try:
+            self._wd = self._inotify.add(self.path, self._wakeup.set)
+            self._watched_inode = self.inode
+        except OSError as e:
+            logger.warning("Failed to watch %s, polling instead: %s", self.path, e)
+
+    def _unwatch(self):
+        if self._inotify is not None and self._wd is not None:
+            self._inotify.remove(self._wd, self._wakeup.set)
+        self._wd = None
+        self._watched_inode = None
+
+    async def _check(self):
+        try:
+            stat = await asyncio.to_thread(os.stat, self.path)
+        except FileNotFoundError:
+            if self.exists:
+                self.exists = False
+                self._unwatch()
+                self._notify()
+            return
+        replaced = self.inode is not None and stat.st_ino != self.inode
+        if replaced or stat.st_size < self.size or not self.exists:
+            self.generation += 1
+            self.exists = True
+            self.inode = stat.st_ino
+            self.size = stat.st_size
+            self._notify()
+        elif stat.st_size != self.size:
+            self.size = stat.st_size
+            self._notify()
+        self.inode = stat.st_ino
+        self._watch()
+
+    async def _run(self):
+        try:
+            await self._check()
+        finally:
+            self.ready.set()
+        while True:
+            interval = FOLLOW_RECHECK_INTERVAL if self._wd is not None else FOLLOW_POLL_INTERVAL
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), interval)
+                await asyncio.sleep(FOLLOW_COALESCE_DELAY)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self._check()
+            except Exception:
+                logger.exception("Failed to check followed file %s", self.path)
+
+
+_watchers: dict[Path, FileWatcher] = {}
+
+
+def acquire_watcher(path: Path) -> FileWatcher:
+    """获取文件的共享监视器，第一个查看者负责启动；使用前需等待 ready"""
+    watcher = _watchers.get(path)
+    if watcher is None:
+        watcher = _watchers[path] = FileWatcher(path)
+        watcher.start()
+    watcher.followers += 1
+    return watcher
+
+
+def release_watcher(watcher: FileWatcher):
+    """最后一个查看者离开时停止监视"""
+    watcher.followers -= 1
+    if watcher.followers > 0:
+        return
+    if _watchers.get(watcher.path) is watcher:
+        del _watchers[watcher.path]
+    watcher.close()
+
+
+def watcher_metrics() -> dict:
+    return {
+        "watchers": {
+            str(path): {"followers": w.followers, "size": w.size, "mode": w.mode}
+            for path, w in _watchers.items()
+        }
+    }
+
+
+def _read_chunk(path: Path, offset: int, size: int) -> bytes:
+    try:
+        with open(path, "rb") as f:
+            f.seek(offset)
+            return f.read(size)
+    except FileNotFoundError:
+        return b""
+
+
+async def follow_file(path: Path, offset: int | None = None,
+                      lines: bool = True) -> AsyncIterator[tuple[str, object]]:
+    """产生文件从 offset（字节，默认为当前末尾）开始追加的内容。
+
+    事件依次为 info，之后是 lines（按行模式，只包含完整的行）或 data（字节模式，文本块），
+    文件被截断或替换时发送 truncated 并从头读取，文件被删除时发送 deleted，没有变化时定期发送 ping。
+    每个内容事件都带有读取后的 offset，客户端可以从该位置重新连接。
+    """
+    watcher = acquire_watcher(path)
+    try:
+        await watcher.ready.wait()
+        position = watcher.size if offset is None else min(offset, watcher.size)
+        generation = watcher.generation
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        partial = b""
+        exists = watcher.exists
+        yield "info", {"offset": position, "size": watcher.size, "mode": watcher.mode}
+
+        while True:
+            changed = watcher.changed
+            if watcher.generation != generation:
+                generation = watcher.generation
+                position = 0
+                partial = b""
+                decoder.reset()
+                yield "truncated", {"offset": 0}
+            if watcher.exists != exists:
+                exists = watcher.exists
+                if not exists:
+                    yield "deleted", {"offset": position}
+
+            while position < watcher.size:
+                data = await asyncio.to_thread(
+                    _read_chunk, path, position, min(FOLLOW_CHUNK_SIZE, watcher.size - position)
+                )
+                if not data:
+                    break
+                position += len(data)
+                if not lines:
+                    text = decoder.decode(data)
+                    # 解码器暂存的不完整字符尚未发送，重连时需要从这些字节开始
+                    yield "data", {"offset": position - len(decoder.getstate()[0]), "data": text}
+                    continue
+                partial += data
+                if b"\n" in partial:
+                    complete, _, partial = partial.rpartition(b"\n")
+                    batch = complete.split(b"\n")
+                else:
+                    batch = []
+                # 过长的未完成行直接推送，避免无限缓存
+                if len(partial) > FOLLOW_LINE_LIMIT:
+                    batch.append(partial)
+                    partial = b""
+                if not batch:
+                    continue
+                yield "lines", {
+                    "offset": position - len(partial),
+                    "lines": [line.rstrip(b"\r").decode("utf-8", errors="replace") for line in batch],
+                }
+
+            try:
+                await asyncio.wait_for(changed.wait(), HEARTBEAT_INTERVAL)
+            except asyncio.TimeoutError:
+                yield "ping", None
+    finally:
+        release_watcher(watcher)
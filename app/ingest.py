@@ -0,0 +1,191 @@
+import codecs
+import json
+from typing import AsyncIterator
+
+try:
+    from python_multipart.multipart import MultipartParser, parse_options_header
+except ImportError:  # python-multipart < 0.0.13
+    from multipart.multipart import MultipartParser, parse_options_header
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = " \t\r\n"
+_DELIMITERS = _WHITESPACE + ",]"
+
+
+async def _iter_text(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    """把字节流按 UTF-8 增量解码为文本"""
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    async for chunk in chunks:
+        text = decoder.decode(chunk)
+        if text:
+            yield text
+    text = decoder.decode(b"", final=True)
+    if text:
+        yield text
+
+
+async def iter_ndjson(chunks: AsyncIterator[bytes]) -> AsyncIterator[object]:
+    """逐行解析 NDJSON 请求体，空行会被跳过"""
+    buffer = ""
+    async for text in _iter_text(chunks):
+        buffer += text
+        *lines, buffer = buffer.split("\n")
+        for line in lines:
+            if line.strip():
+                yield json.loads(line)
+    if buffer.strip():
+        yield json.loads(buffer)
+
+
+async def iter_json_array(chunks: AsyncIterator[bytes]) -> AsyncIterator[object]:
+    """增量解析顶层 JSON 数组，每解析出一个元素就立即返回，不缓存整个请求体"""
+    buffer = ""
+    pos = 0
+    started = False
+    finished = False
+    expect_value = True
+    count = 0
+    eof = False
+    stream = _iter_text(chunks)
+
+    while not finished:
+        # 跳过空白
+        while pos < len(buffer) and buffer[pos] in _WHITESPACE:
+            pos += 1
+
+        if pos >= len(buffer):
+            if eof:
+                raise ValueError("Unexpected end of JSON array")
+            buffer = buffer[pos:]
+            pos = 0
+            try:
+                buffer += await stream.__anext__()
+            except StopAsyncIteration:
+                eof = True
+            continue
+
+        char = buffer[pos]
+        if not started:
+            if char != "[":
+                raise ValueError("Request body must be a JSON array")
+            started = True
+            pos += 1
+        elif char == "]" and (not expect_value or count == 0):
+            finished = True
+            pos += 1
+        elif char == "," and not expect_value:
+            expect_value = True
+            pos += 1
+        elif expect_value:
+            try:
+                item, end = _decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                end = None
+            # 元素后面没有出现分隔符时（例如数字被截断）可能尚未完整，需要更多数据
+            incomplete = end is None or (
+                not eof and (end >= len(buffer) or buffer[end] not in _DELIMITERS)
+            )
+            if incomplete:
+                buffer = buffer[pos:]
+                pos = 0
+                try:
+                    buffer += await stream.__anext__()
+                except StopAsyncIteration:
+                    eof = True
+                continue
+            pos = end
+            expect_value = False
+            count += 1
+            yield item
+        else:
+            raise ValueError(f"Unexpected character {char!r} in JSON array")
+
+        # 定期丢弃已消费的内容
+        if pos > 65536:
+            buffer = buffer[pos:]
+            pos = 0
+
+    # 数组之后只允许空白
+    rest = buffer[pos:]
+    async for text in stream:
+        rest += text
+    if rest.strip():
+        raise ValueError("Unexpected data after JSON array")
+
+
+async def iter_multipart(
+    chunks: AsyncIterator[bytes],
+    content_type: str
+) -> AsyncIterator[tuple[str, object]]:
+    """流式解析 multipart/form-data 请求体。
+
+    依次产生事件：("part", {"name", "filename", "content_type"}) 表示新部分开始，
+    ("data", bytes) 为该部分的一段内容，("end", None) 表示该部分结束。
+    每次只缓存当前网络块解析出的数据，调用方可以把文件部分边收边写入磁盘。
+    """
+    _, options = parse_options_header(content_type)
+    boundary = options.get(b"boundary")
+    if not boundary:
+        raise ValueError("Missing boundary in multipart Content-Type")
+
+    events = []
+    finished = []
+    headers = {}
+    header_field = bytearray()
+    header_value = bytearray()
+
+    def on_part_begin():
+        headers.clear()
+
+    def on_header_field(data, start, end):
+        header_field.extend(data[start:end])
+
+    def on_header_value(data, start, end):
+        header_value.extend(data[start:end])
+
+    def on_header_end():
+        headers[bytes(header_field).lower()] = bytes(header_value)
+        header_field.clear()
+        header_value.clear()
+
+    def on_headers_finished():
+        _, disposition = parse_options_header(headers.get(b"content-disposition"))
+        filename = disposition.get(b"filename")
+        events.append(("part", {
+            "name": disposition.get(b"name", b"").decode("latin-1"),
+            "filename": filename.decode("utf-8", "replace") if filename is not None else None,
+            "content_type": headers.get(b"content-type", b"").decode("latin-1") or None
+        }))
+
+    def on_part_data(data, start, end):
+        events.append(("data", bytes(data[start:end])))
+
+    def on_part_end():
+        events.append(("end", None))
+
+    def on_end():
+        finished.append(True)
+
+    parser = MultipartParser(boundary, {
+        "on_part_begin": on_part_begin,
+        "on_header_field": on_header_field,
+        "on_header_value": on_header_value,
+        "on_header_end": on_header_end,
+        "on_headers_finished": on_headers_finished,
+        "on_part_data": on_part_data,
+        "on_part_end": on_part_end,
+        "on_end": on_end,
+    })
+
+    async for chunk in chunks:
+        parser.write(chunk)
+        for event in events:
+            yield event
+        events.clear()
+    parser.finalize()
+    for event in events:
+        yield event
+    if not finished:
+        raise ValueError("Unexpected end of multipart body")
@@ -0,0 +1,287 @@
+"""后台脚本任务。
+
+提交后立即返回任务 id，任务按并发上限排队执行，同一个脚本同一时间只运行一个实例。
+输出逐行写入 output/jobs/<id>.log，状态和退出码保存在 script_jobs 表中以便轮询和查看历史。
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+from pathlib import Path
+
+from app.database import db_connection
+from app.processes import stream_shell_command
+
+logger = logging.getLogger(__name__)
+
+# 同时运行的任务数量上限
+SCRIPT_JOB_CONCURRENCY = int(os.environ.get("SCRIPT_JOB_CONCURRENCY", "2"))
+# 默认的任务超时时间（秒），0 表示不限制
+SCRIPT_JOB_TIMEOUT = int(os.environ.get("SCRIPT_JOB_TIMEOUT", "3600"))
+JOB_OUTPUT_DIR = Path("output") / "jobs"
+# 输出缓冲的最大行数和最长时间（秒），达到其一时写入文件
+JOB_FLUSH_LINES = 200
+JOB_FLUSH_INTERVAL = 0.5
+
+JOB_COLUMNS = (
+    "id, script, command, parameters, status, exit_code, error, timeout, "
+    "output_path, created_at, started_at, finished_at"
+)
+
+
+def _now() -> int:
+    return int(time.time() * 1000)
+
+
+class ScriptJob:
+    """一次脚本执行；状态依次为 queued、running，最后是 succeeded / failed / timeout / cancelled"""
+
+    def __init__(self, job_id: int, script: str, command: str, env: dict | None,
+                 working_dir: str | None, parameters: dict | None, timeout: int, created_at: int):
+        self.id = job_id
+        self.script = script
+        self.command = command
+        self.env = env
+        self.working_dir = working_dir
+        self.parameters = parameters or {}
+        self.timeout = timeout
+        self.status = "queued"
+        self.exit_code = None
+        self.error = None
+        self.output_path = str(JOB_OUTPUT_DIR / f"{job_id}.log")
+        self.created_at = created_at
+        self.started_at = None
+        self.finished_at = None
+        self.task: asyncio.Task | None = None
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "script": self.script,
+            "command": self.command,
+            "parameters": self.parameters,
+            "status": self.status,
+            "exit_code": self.exit_code,
+            "error": self.error,
+            "timeout": self.timeout,
+            "output_path": self.output_path,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+def _row_to_dict(row) -> dict:
+    job = dict(row)
+    job["parameters"] = json.loads(job["parameters"]) if job["parameters"] else {}
+    return job
+
+
+class ScriptJobRunner:
+    """脚本任务的排队和执行。
+
+    任务先获取脚本自己的锁，再占用全局的并发名额，
+    等待同一脚本的任务不会占着名额阻塞其他脚本。
+    """
+
+    def __init__(self, concurrency: int = SCRIPT_JOB_CONCURRENCY, timeout: int = SCRIPT_JOB_TIMEOUT):
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.active: dict[int, ScriptJob] = {}
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._script_locks: dict[str, asyncio.Lock] = {}
+
+    async def start(self):
+        """上次退出时未结束的任务已经没有对应的进程，标记为失败"""
+        async with db_connection() as db:
+            await db.execute(
+                """
+                UPDATE script_jobs SET status = 'failed', error = 'Interrupted by server restart',
+                    finished_at = ?
+                WHERE status IN ('queued', 'running')
+                """,
+                (_now(),)
+            )
+            await db.commit()
+
+    async def stop(self):
+        tasks = [job.task for job in self.active.values() if job.task is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def submit(self, script: str, command: str, env: dict | None = None,
+                     working_dir: str | None = None, parameters: dict | None = None,
+                     timeout: int | None = None) -> ScriptJob:
+        """记录任务并放入后台排队，立即返回"""
+        timeout = self.timeout if timeout is None else timeout
+        created_at = _now()
+        async with db_connection() as db:
+            async with db.execute(
+                """
+                INSERT INTO script_jobs (script, command, parameters, status, timeout, created_at)
+                VALUES (?, ?, ?, 'queued', ?, ?)
+                """,
+                (script, command, json.dumps(parameters or {}), timeout, created_at)
+            ) as cursor:
+                job_id = cursor.lastrowid
+            job = ScriptJob(job_id, script, command, env, working_dir, parameters, timeout, created_at)
+            await db.execute("UPDATE script_jobs SET output_path = ? WHERE id = ?", (job.output_path, job.id))
+            await db.commit()
+
+        self.active[job.id] = job
+        job.task = asyncio.create_task(self._run(job))
+        return job
+
+    async def get(self, job_id: int) -> dict | None:
+        job = self.active.get(job_id)
+        if job is not None:
+            return job.to_dict()
+        async with db_connection() as db:
+            async with db.execute(f"SELECT {JOB_COLUMNS} FROM script_jobs WHERE id = ?", (job_id,)) as cursor:
+                row = await cursor.fetchone()
+        return _row_to_dict(row) if row else None
+
+    async def history(self, script: str | None = None, status: str | None = None,
+                      limit: int = 50, offset: int = 0) -> tuple[list[dict], int]:
+        """按提交时间倒序返回任务记录和总数；未结束任务的状态以内存中的为准"""
+        conditions = []
+        params = []
+        if script:
+            conditions.append("script = ?")
+            params.append(script)
+        if status:
+            conditions.append("status = ?")
+            params.append(status)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+        async with db_connection() as db:
+            async with db.execute(f"SELECT COUNT(*) FROM script_jobs {where}", params) as cursor:
+                total = (await cursor.fetchone())[0]
+            async with db.execute(
+                f"SELECT {JOB_COLUMNS} FROM script_jobs {where} ORDER BY id DESC LIMIT ? OFFSET ?",
+                (*params, limit, offset)
+            ) as cursor:
+                rows = await cursor.fetchall()
+
+        jobs = []
+        for row in rows:
+            job = self.active.get(row["id"])
+            jobs.append(job.to_dict() if job is not None else _row_to_dict(row))
+        return jobs, total
+
+    def cancel(self, job_id: int) -> bool:
+        """取消排队中或运行中的任务，运行中的脚本连同其子进程一起结束"""
+        job = self.active.get(job_id)
+        if job is None or job.task is None or job.task.done():
+            return False
+        job.task.cancel()
+        return True
+
+    def metrics(self) -> dict:
+        statuses = [job.status for job in self.active.values()]
+        return {
+            "concurrency": self.concurrency,
+            "timeout": self.timeout,
+            "running": statuses.count("running"),
+            "queued": statuses.count("queued"),
+        }
+
+    def _lock_for(self, script: str) -> asyncio.Lock:
+        lock = self._script_locks.get(script)
+        if lock is None:
+            lock = self._script_locks[script] = asyncio.Lock()
+        return lock
+
+    async def _run(self, job: ScriptJob):
+        try:
+            async with self._lock_for(job.script), self._semaphore:
+                job.status = "running"
+                job.started_at = _now()
+                await self._save(job)
+                try:
+                    job.exit_code = await asyncio.wait_for(self._execute(job), job.timeout or None)
+                except asyncio.TimeoutError:
+                    job.status = "timeout"
+                    job.error = f"Job exceeded timeout of {job.timeout}s"
+                else:
+                    job.status = "succeeded" if job.exit_code == 0 else "failed"
+        except asyncio.CancelledError:
+            job.status = "cancelled"
+        except Exception as e:
+            logger.exception("Script job %d failed", job.id)
+            job.status = "failed"
+            job.error = str(e)
+        finally:
+            job.finished_at = _now()
+            self.active.pop(job.id, None)
+            try:
+                await self._save(job)
+            except Exception:
+                logger.exception("Failed to save script job %d", job.id)
+
+    async def _execute(self, job: ScriptJob) -> int:
+        """执行脚本并把 stdout / stderr 按行写入输出文件，返回退出码"""
+        path = Path(job.output_path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        output = await asyncio.to_thread(open, path, "w", encoding="utf-8")
+        buffer = []
+        flushed_at = time.monotonic()
+        exit_code = -1
+        try:
+            async for name, line in stream_shell_command(job.command, job.working_dir, job.env):
+                if name == "exit":
+                    exit_code = line
+                    continue
+                buffer.append(line + "\n")
+                if len(buffer) >= JOB_FLUSH_LINES or time.monotonic() - flushed_at >= JOB_FLUSH_INTERVAL:
+                    await asyncio.to_thread(self._write, output, buffer)
+                    buffer = []
+                    flushed_at = time.monotonic()
+        finally:
+            # 取消或超时时同样保留已经产生的输出
+            await asyncio.to_thread(self._write, output, buffer, True)
+        return exit_code
+
+    @staticmethod
+    def _write(output, lines: list[str], close: bool = False):
+        if lines:
+            output.writelines(lines)
+            output.flush()
+        if close:
+            output.close()
+
+    async def _save(self, job: ScriptJob):
+        async with db_connection() as db:
+            await db.execute(
+                """
+                UPDATE script_jobs SET status = ?, exit_code = ?, error = ?,
+                    started_at = ?, finished_at = ?
+                WHERE id = ?
+                """,
+                (job.status, job.exit_code, job.error, job.started_at, job.finished_at, job.id)
+            )
+            await db.commit()
+
+
+runner: ScriptJobRunner | None = None
+
+
+def get_jobs() -> ScriptJobRunner:
+    global runner
+    if runner is None:
+        runner = ScriptJobRunner()
+    return runner
+
+
+async def start_jobs():
+    await get_jobs().start()
+
+
+async def stop_jobs():
+    global runner
+    if runner is not None:
+        await runner.stop()
+        runner = None
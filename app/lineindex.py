@@ -0,0 +1,227 @@
+"""大文本文件的行偏移索引，用于按行号分页读取。
+
+索引是稀疏的：每扫描 LINE_INDEX_BLOCK 字节记录一次 (行号, 该行起始偏移)，
+定位任意一行只需二分查找检查点，再从检查点向后找不超过一个块的换行符。
+扫描和读取都在工作线程中用 mmap 完成，文件增长时只扫描新增的部分。
+索引保存在 db/line_index 下，服务重启后不需要重新扫描整个文件。
+"""
+
+import hashlib
+import mmap
+import os
+import struct
+import threading
+from array import array
+from bisect import bisect_right
+from collections import OrderedDict
+from pathlib import Path
+
+from app.database import DB_PATH
+
+LINE_INDEX_DIR = DB_PATH.parent / "line_index"
+# 检查点间隔（字节），越小定位越快，索引越大
+LINE_INDEX_BLOCK = 64 * 1024
+# 内存中缓存的索引数量
+LINE_INDEX_CACHE_SIZE = 64
+# 用于确认文件没有被截断重写的尾部字节数
+LINE_INDEX_TAIL = 64
+# 返回的单行最大字节数，超出部分截掉
+LINE_MAX_BYTES = 64 * 1024
+# 每页返回的最大字节数，达到后不再读取后面的行（至少返回一行）
+PAGE_MAX_BYTES = 4 * 1024 * 1024
+
+_MAGIC = b"WFLI"
+_VERSION = 1
+# magic, version, st_dev, st_ino, mtime_ns, size, indexed_size, line_count, 检查点数量, 尾部摘要
+_HEADER = struct.Struct("<4sIQQqQQQQ20s")
+
+
+class LineIndex:
+    """单个文件的索引。
+
+    indexed_size 之前都是以换行符结尾的完整行，共 line_count 行；
+    其后不以换行符结尾的部分是最后一个未完成的行，下次刷新时重新扫描。
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.dev = 0
+        self.inode = 0
+        self.mtime_ns = 0
+        self.size = 0
+        self.indexed_size = 0
+        self.line_count = 0
+        self.tail_digest = b"\0" * 20
+        self.lines = array("Q", [0])
+        self.offsets = array("Q", [0])
+        self.lock = threading.Lock()
+
+    @property
+    def total_lines(self) -> int:
+        return self.line_count + (1 if self.size > self.indexed_size else 0)
+
+    def reset(self):
+        self.indexed_size = 0
+        self.line_count = 0
+        self.tail_digest = b"\0" * 20
+        self.lines = array("Q", [0])
+        self.offsets = array("Q", [0])
+
+    def refresh(self, mm, stat: os.stat_result) -> bool:
+        """让索引覆盖文件的当前内容，返回是否需要重新保存。
+
+        保存的索引只要求 indexed_size 之前的内容不变，所以只在新增检查点或重建时保存，
+        持续增长的文件不会在每次读取时重写索引文件。
+        """
+        if (stat.st_dev, stat.st_ino, stat.st_mtime_ns, stat.st_size) == \
+                (self.dev, self.inode, self.mtime_ns, self.size):
+            return False
+        checkpoints = len(self.lines)
+        # 文件被替换、截断或重写时重新建立索引
+        if (
+            (stat.st_dev, stat.st_ino) != (self.dev, self.inode)
+            or stat.st_size < self.indexed_size
+            or _tail_digest(mm, self.indexed_size) != self.tail_digest
+        ):
+            self.reset()
+            checkpoints = 0
+
+        position = self.indexed_size
+        while position < stat.st_size:
+            end = min(position + LINE_INDEX_BLOCK, stat.st_size)
+            block = mm[position:end]
+            newlines = block.count(b"\n")
+            if newlines:
+                self.line_count += newlines
+                self.indexed_size = position + block.rfind(b"\n") + 1
+                self.lines.append(self.line_count)
+                self.offsets.append(self.indexed_size)
+            position = end
+
+        self.dev, self.inode = stat.st_dev, stat.st_ino
+        self.mtime_ns, self.size = stat.st_mtime_ns, stat.st_size
+        self.tail_digest = _tail_digest(mm, self.indexed_size)
+        return len(self.lines) != checkpoints
+
+    def locate(self, mm, line: int) -> int:
+        """返回第 line 行（从 0 开始）的起始偏移，超出范围时返回文件大小"""
+        if line >= self.total_lines:
+            return self.size
+        checkpoint = bisect_right(self.lines, line) - 1
+        offset = self.offsets[checkpoint]
+        for _ in range(line - self.lines[checkpoint]):
+            offset = mm.find(b"\n", offset, self.size) + 1
+        return offset
+
+    def save(self):
+        header = _HEADER.pack(
+            _MAGIC, _VERSION, self.dev, self.inode, self.mtime_ns, self.size,
+            self.indexed_size, self.line_count, len(self.lines), self.tail_digest
+        )
+        target = _index_path(self.path)
+        LINE_INDEX_DIR.mkdir(parents=True, exist_ok=True)
+        temp = target.with_suffix(".tmp")
+        with open(temp, "wb") as f:
+            f.write(header)
+            self.lines.tofile(f)
+            self.offsets.tofile(f)
+        os.replace(temp, target)
+
+    @classmethod
+    def load(cls, path: Path) -> "LineIndex":
+        """读取保存的索引，不存在或格式不对时返回空索引"""
+        index = cls(path)
+        try:
+            with open(_index_path(path), "rb") as f:
+                fields = _HEADER.unpack(f.read(_HEADER.size))
+                if fields[0] != _MAGIC or fields[1] != _VERSION:
+                    return index
+                count = fields[8]
+                lines, offsets = array("Q"), array("Q")
+                lines.fromfile(f, count)
+                offsets.fromfile(f, count)
+        except (OSError, EOFError, struct.error):
+            return index
+        (_, _, index.dev, index.inode, index.mtime_ns, index.size,
+         index.indexed_size, index.line_count, _, index.tail_digest) = fields
+        index.lines, index.offsets = lines, offsets
+        return index
+
+
+def _index_path(path: Path) -> Path:
+    return LINE_INDEX_DIR / f"{hashlib.sha1(str(path).encode('utf-8')).hexdigest()}.idx"
+
+
+def _tail_digest(mm, end: int) -> bytes:
+    return hashlib.sha1(mm[max(end - LINE_INDEX_TAIL, 0):end]).digest()
+
+
+_cache: OrderedDict[Path, LineIndex] = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def _get_index(path: Path) -> LineIndex:
+    with _cache_lock:
+        index = _cache.get(path)
+        if index is not None:
+            _cache.move_to_end(path)
+            return index
+    index = LineIndex.load(path)
+    with _cache_lock:
+        index = _cache.setdefault(path, index)
+        while len(_cache) > LINE_INDEX_CACHE_SIZE:
+            _cache.popitem(last=False)
+    return index
+
+
+def read_lines(path: Path, start: int, count: int) -> dict:
+    """读取从第 start 行（从 0 开始）起的最多 count 行，在工作线程中调用。
+
+    超过 LINE_MAX_BYTES 的行只返回开头部分，clipped 为被截断的行数；
+    累计超过 PAGE_MAX_BYTES 时提前结束，truncated 为 True，调用方按返回的行数继续翻页。
+    """
+    index = _get_index(path)
+    with open(path, "rb") as f:
+        stat = os.fstat(f.fileno())
+        if stat.st_size == 0:
+            with index.lock:
+                index.reset()
+                index.dev, index.inode = stat.st_dev, stat.st_ino
+                index.mtime_ns, index.size = stat.st_mtime_ns, 0
+            return {"lines": [], "total_lines": 0, "size": 0, "clipped": 0, "truncated": False}
+
+        with mmap.mmap(f.fileno(), stat.st_size, access=mmap.ACCESS_READ) as mm:
+            with index.lock:
+                if index.refresh(mm, stat):
+                    index.save()
+                begin = index.locate(mm, start)
+                total_lines = index.total_lines
+
+            lines = []
+            offset = begin
+            page_bytes = 0
+            clipped = 0
+            truncated = False
+            while len(lines) < count and offset < stat.st_size:
+                if lines and page_bytes >= PAGE_MAX_BYTES:
+                    truncated = True
+                    break
+                end = mm.find(b"\n", offset, stat.st_size)
+                if end < 0:
+                    end = stat.st_size
+                if end - offset > LINE_MAX_BYTES:
+                    line = mm[offset:offset + LINE_MAX_BYTES]
+                    clipped += 1
+                else:
+                    line = mm[offset:end].rstrip(b"\r")
+                page_bytes += len(line)
+                lines.append(line.decode("utf-8", errors="replace"))
+                offset = end + 1
+
+    return {
+        "lines": lines,
+        "total_lines": total_lines,
+        "size": stat.st_size,
+        "clipped": clipped,
+        "truncated": truncated
+    }
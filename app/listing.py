@@ -0,0 +1,126 @@
+"""目录列表：在工作线程中用 os.scandir 扫描，按目录修改时间缓存结果。
+
+目录的修改时间只在增删、重命名条目时变化，正在写入的文件大小和修改时间不会体现出来，
+所以缓存另外设置了最长有效期 LISTING_CACHE_TTL。
+"""
+
+import asyncio
+import fnmatch
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+# 缓存的目录数量
+LISTING_CACHE_SIZE = int(os.environ.get("LISTING_CACHE_SIZE", "128"))
+# 目录未变化时缓存的最长有效期（秒）
+LISTING_CACHE_TTL = float(os.environ.get("LISTING_CACHE_TTL", "10"))
+
+SORT_FIELDS = ("name", "size", "mtime")
+
+
+class DirectoryEntry:
+    __slots__ = ("name", "is_dir", "size", "mtime")
+
+    def __init__(self, name: str, is_dir: bool, size: int, mtime: float):
+        self.name = name
+        self.is_dir = is_dir
+        self.size = size
+        self.mtime = mtime
+
+
+class DirectoryListing:
+    """一次扫描的结果，按排序方式缓存排好序的条目"""
+
+    def __init__(self, mtime_ns: int, entries: list[DirectoryEntry]):
+        self.mtime_ns = mtime_ns
+        self.entries = entries
+        self.scanned_at = time.monotonic()
+        self._sorted: dict[tuple[str, bool], list[DirectoryEntry]] = {}
+
+    def sorted(self, sort: str, descending: bool) -> list[DirectoryEntry]:
+        """文件夹始终在前，文件夹和文件分别按 sort 排序，名称相同时按名称排序"""
+        key = (sort, descending)
+        result = self._sorted.get(key)
+        if result is None:
+            if sort == "size":
+                field = lambda entry: (entry.size, entry.name.lower())
+            elif sort == "mtime":
+                field = lambda entry: (entry.mtime, entry.name.lower())
+            else:
+                field = lambda entry: entry.name.lower()
+            folders = sorted((e for e in self.entries if e.is_dir), key=field, reverse=descending)
+            files = sorted((e for e in self.entries if not e.is_dir), key=field, reverse=descending)
+            result = self._sorted[key] = folders + files
+        return result
+
+
+def scan_directory(path: Path) -> list[DirectoryEntry]:
+    """扫描目录，跳过隐藏文件；scandir 在大多数平台上可以直接给出类型，无需每项再 stat 一次类型"""
+    entries = []
+    with os.scandir(path) as iterator:
+        for entry in iterator:
+            if entry.name.startswith("."):
+                continue
+            try:
+                is_dir = entry.is_dir()
+                stat = entry.stat()
+            except OSError:
+                # 扫描期间被删除或无效的符号链接
+                continue
+            entries.append(DirectoryEntry(entry.name, is_dir, stat.st_size, stat.st_mtime))
+    return entries
+
+
+_cache: OrderedDict[Path, DirectoryListing] = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def _load_listing(path: Path) -> DirectoryListing:
+    mtime_ns = os.stat(path).st_mtime_ns
+    with _cache_lock:
+        listing = _cache.get(path)
+        if (
+            listing is not None
+            and listing.mtime_ns == mtime_ns
+            and time.monotonic() - listing.scanned_at < LISTING_CACHE_TTL
+        ):
+            _cache.move_to_end(path)
+            return listing
+
+    listing = DirectoryListing(mtime_ns, scan_directory(path))
+    with _cache_lock:
+        _cache[path] = listing
+        _cache.move_to_end(path)
+        while len(_cache) > LISTING_CACHE_SIZE:
+            _cache.popitem(last=False)
+    return listing
+
+
+def _list_directory(path: Path, sort: str, descending: bool, name_filter: str | None,
+                    offset: int, limit: int) -> tuple[list[DirectoryEntry], int]:
+    entries = _load_listing(path).sorted(sort, descending)
+    if name_filter:
+        pattern = name_filter.lower()
+        if any(char in pattern for char in "*?["):
+            entries = [e for e in entries if fnmatch.fnmatchcase(e.name.lower(), pattern)]
+        else:
+            entries = [e for e in entries if pattern in e.name.lower()]
+    return entries[offset:offset + limit], len(entries)
+
+
+async def list_directory(path: Path, sort: str = "name", descending: bool = False,
+                         name_filter: str | None = None, offset: int = 0,
+                         limit: int = 200) -> tuple[list[DirectoryEntry], int]:
+    """返回 (当前页的条目, 过滤后的总数)。
+
+    name_filter 不区分大小写，包含 * ? [ 时按通配符匹配整个名称，否则按子串匹配。
+    """
+    return await asyncio.to_thread(_list_directory, path, sort, descending, name_filter, offset, limit)
+
+
+def invalidate(path: Path):
+    """目录内容由本服务修改后立即丢弃缓存"""
+    with _cache_lock:
+        _cache.pop(path, None)
@@ -3,7 +3,7 @@ from pydantic import BaseModel, Field, computed_field
 from typing import Optional
 
 class Log(BaseModel):
-    id: int
+    id: Optional[int] = None  # 写后模式下入队即返回时为空
     app_id: str
     package: str
     role_name: str
@@ -13,6 +13,24 @@ class Log(BaseModel):
     log_type: str
     log_stack: Optional[str] = None
     create_at: int
+    fingerprint: Optional[str] = None
+
+class LogRequest(BaseModel):
+    """日志写入请求模型，不包含服务端生成的字段"""
+    app_id: str
+    package: str
+    role_name: str
+    device: str
+    log_message: str
+    log_time: int
+    log_type: str
+    log_stack: Optional[str] = None
+
+class RetentionPolicy(BaseModel):
+    """数据保留策略，app_id 为空时适用于没有单独策略的所有应用"""
+    target: str = Field(..., pattern="^(logs|stats)$")
+    app_id: str = ""
+    days: int = Field(..., ge=1)
 
 class StatsRecordDB(BaseModel):
     """数据库使用的统计记录模型"""
@@ -88,7 +106,7 @@ class StatsInfoDB(BaseModel):
 
 class StatsInfoAPI(BaseModel):
     """API 使用的统计信息模型"""
-    id: int
+    id: Optional[int] = None  # 写后模式下入队即返回时为空
     login_id: int
     fps: int
     total_mem: int
@@ -166,7 +184,7 @@ class StatsRecord(BaseModel):
     """统计记录基础模型"""
 
     # 方法一，字段别名
-    id: int
+    id: Optional[int] = None  # 写后模式下入队即返回时为空
     login_id: int
     app_id: int
     package: str = Field(..., alias="package_name")
@@ -0,0 +1,69 @@
+import base64
+import json
+from fastapi import HTTPException
+
+
+def encode_cursor(direction: str, row_id: int) -> str:
+    """生成不透明的分页游标"""
+    raw = json.dumps({"d": direction, "id": row_id}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[str, int]:
+    """解析分页游标，返回 (方向, id)"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded))
+        direction, row_id = data["d"], int(data["id"])
+    except Exception:
+        raise HTTPException(
+            status_code=400,
+            detail="Invalid cursor"
+        )
+    if direction not in ("before", "after"):
+        raise HTTPException(
+            status_code=400,
+            detail="Invalid cursor"
+        )
+    return direction, row_id
+
+
+def resolve_keyset(
+    before_id: int | None,
+    after_id: int | None,
+    cursor: str | None
+) -> tuple[str | None, int | None]:
+    """合并 before_id / after_id / cursor 参数，返回 (方向, id)；都未提供时为页码模式"""
+    given = [value for value in (before_id, after_id, cursor) if value is not None]
+    if len(given) > 1:
+        raise HTTPException(
+            status_code=400,
+            detail="Only one of before_id, after_id and cursor can be used"
+        )
+    if cursor is not None:
+        return decode_cursor(cursor)
+    if before_id is not None:
+        return "before", before_id
+    if after_id is not None:
+        return "after", after_id
+    return None, None
+
+
+def page_cursors(rows: list, direction: str | None, has_more: bool, page: int = 1) -> tuple[str | None, str | None]:
+    """根据当前页（按 id 倒序）生成 (next_cursor, prev_cursor)。
+
+    next_cursor 指向更早的记录，prev_cursor 指向更新的记录。
+    """
+    if not rows:
+        return None, None
+
+    first_id, last_id = rows[0]["id"], rows[-1]["id"]
+    if direction == "after":
+        # 向较新方向翻页时，是否还有更新的记录由 has_more 决定
+        has_older, has_newer = True, has_more
+    else:
+        has_older, has_newer = has_more, direction == "before" or page > 1
+
+    next_cursor = encode_cursor("before", last_id) if has_older else None
+    prev_cursor = encode_cursor("after", first_id) if has_newer else None
+    return next_cursor, prev_cursor
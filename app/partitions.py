@@ -0,0 +1,387 @@
+"""按时间分区的日志归档。
+
+主库中的 logs 表始终是热分区，所有写入、触发器（全文索引、错误聚合、计数）都只作用于它。
+已经结束的时间段（天或周）会被分批搬到 db/partitions 下独立的 SQLite 文件中，
+查询时只按需 ATTACH 覆盖所请求时间范围的分区，过期时直接删除整个文件。
+"""
+
+import asyncio
+import logging
+import os
+from collections import Counter
+from contextlib import asynccontextmanager
+from datetime import date, datetime, timedelta
+
+import aiosqlite
+import anyio
+
+from app.database import DB_PATH, db_connection
+
+logger = logging.getLogger(__name__)
+
+# 分区粒度：空字符串表示关闭分区，可选 day / week
+PARTITION_MODE = os.environ.get("DB_PARTITION", "").lower()
+PARTITION_DIR = DB_PATH.parent / "partitions"
+# 搬迁时每批处理的 id 范围大小，以及两批之间让出的时间（毫秒）
+PARTITION_BATCH_SIZE = int(os.environ.get("DB_PARTITION_BATCH_SIZE", "2000"))
+PARTITION_PAUSE_MS = int(os.environ.get("DB_PARTITION_PAUSE_MS", "20"))
+# 检查是否有需要归档的时间段的间隔（秒）
+PARTITION_CHECK_INTERVAL = int(os.environ.get("DB_PARTITION_CHECK_INTERVAL", "300"))
+# 查询时分区在连接上的别名
+PARTITION_SCHEMA = "part"
+
+
+def partition_enabled() -> bool:
+    return PARTITION_MODE in ("day", "week")
+
+
+def _to_ms(day: date) -> int:
+    return int(datetime.combine(day, datetime.min.time()).timestamp() * 1000)
+
+
+def period_of(timestamp: int) -> tuple[str, int, int]:
+    """返回时间戳（毫秒）所在时间段的 (分区名, 起始时间, 结束时间)，按本地时间划分"""
+    day = datetime.fromtimestamp(timestamp / 1000).date()
+    if PARTITION_MODE == "week":
+        day -= timedelta(days=day.weekday())
+        name = f"logs_w{day:%Y%m%d}"
+        length = 7
+    else:
+        name = f"logs_{day:%Y%m%d}"
+        length = 1
+    return name, _to_ms(day), _to_ms(day + timedelta(days=length))
+
+
+def partition_path(name: str):
+    return PARTITION_DIR / f"{name}.db"
+
+
+async def create_partition_schema(db: aiosqlite.Connection, schema: str = PARTITION_SCHEMA):
+    """在已 ATTACH 的分区中创建日志表、索引和全文索引（触发器只作用于分区内部）"""
+    await db.execute(f"PRAGMA {schema}.journal_mode=WAL")
+    await db.execute(f"""
+        CREATE TABLE IF NOT EXISTS {schema}.logs (
+            id INTEGER PRIMARY KEY,
+            app_id TEXT,
+            package TEXT,
+            role_name TEXT,
+            device TEXT,
+            log_message TEXT,
+            log_time INTEGER,
+            log_type TEXT,
+            log_stack TEXT,
+            create_at INTEGER,
+            fingerprint TEXT
+        )
+    """)
+    await db.execute(f"CREATE INDEX IF NOT EXISTS {schema}.idx_logs_create_at ON logs(create_at)")
+    await db.execute(f"CREATE INDEX IF NOT EXISTS {schema}.idx_logs_fingerprint ON logs(fingerprint)")
+    try:
+        await db.execute(f"""
+            CREATE VIRTUAL TABLE IF NOT EXISTS {schema}.logs_fts USING fts5(
+                role_name,
+                log_message,
+                log_stack,
+                content='logs',
+                content_rowid='id',
+                prefix='2 3'
+            )
+        """)
+    except aiosqlite.OperationalError:
+        # SQLite 未编译 FTS5 时分区同样退回到 LIKE 搜索
+        return
+    await db.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS {schema}.logs_fts_insert AFTER INSERT ON logs BEGIN
+            INSERT INTO logs_fts(rowid, role_name, log_message, log_stack)
+            VALUES (new.id, new.role_name, new.log_message, new.log_stack);
+        END
+    """)
+    await db.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS {schema}.logs_fts_delete AFTER DELETE ON logs BEGIN
+            INSERT INTO logs_fts(logs_fts, rowid, role_name, log_message, log_stack)
+            VALUES ('delete', old.id, old.role_name, old.log_message, old.log_stack);
+        END
+    """)
+
+
+@asynccontextmanager
+async def attach_partition(db: aiosqlite.Connection, name: str, create: bool = False):
+    """在连接上临时 ATTACH 分区，结束后 DETACH；分区文件不存在且不创建时返回 None"""
+    path = partition_path(name)
+    if not create and not path.exists():
+        yield None
+        return
+    PARTITION_DIR.mkdir(parents=True, exist_ok=True)
+    await db.execute(f"ATTACH DATABASE ? AS {PARTITION_SCHEMA}", (str(path),))
+    try:
+        if create:
+            await create_partition_schema(db)
+        yield PARTITION_SCHEMA
+    finally:
+        # 客户端断开时这里运行在已取消的范围内，不屏蔽的话 DETACH 会被取消，
+        # 分区一直挂在归还到连接池的连接上
+        with anyio.CancelScope(shield=True):
+            if db.in_transaction:
+                await db.rollback()
+            await db.execute(f"DETACH DATABASE {PARTITION_SCHEMA}")
+
+
+async def update_partition_catalog(db: aiosqlite.Connection, name: str, schema: str = PARTITION_SCHEMA):
+    """按分区的当前内容更新目录中的行数和 id 范围，调用方负责提交"""
+    await db.execute(
+        f"""
+        UPDATE log_partitions SET (rows, min_id, max_id) =
+            (SELECT COUNT(*), MIN(id), MAX(id) FROM {schema}.logs)
+        WHERE name = ?
+        """,
+        (name,)
+    )
+
+
+async def overlapping_partitions(db: aiosqlite.Connection, start: int | None = None,
+                                 end: int | None = None) -> list[dict]:
+    """覆盖 [start, end) 的分区，按时间从新到旧排列"""
+    async with db.execute(
+        """
+        SELECT name, start, end, rows, min_id, max_id FROM log_partitions
+        WHERE (? IS NULL OR end > ?) AND (? IS NULL OR start < ?)
+        ORDER BY start DESC
+        """,
+        (start, start, end, end)
+    ) as cursor:
+        return [dict(row) for row in await cursor.fetchall()]
+
+
+async def _move_period(name: str, start: int, end: int, pause: float):
+    """把主库中 [start, end) 的日志分批搬到分区文件"""
+    async with db_connection() as db:
+        async with db.execute("PRAGMA main.table_info(logs)") as cursor:
+            columns = ", ".join(row[1] for row in await cursor.fetchall())
+        async with db.execute(
+            "SELECT MIN(id), MAX(id) FROM logs WHERE create_at >= ? AND create_at < ?",
+            (start, end)
+        ) as cursor:
+            low, high = await cursor.fetchone()
+    if low is None:
+        return
+
+    async with db_connection() as db:
+        async with attach_partition(db, name, create=True) as schema:
+            await db.execute(
+                """
+                INSERT INTO log_partitions (name, start, end, rows) VALUES (?, ?, ?, 0)
+                ON CONFLICT(name) DO NOTHING
+                """,
+                (name, start, end)
+            )
+            await db.commit()
+
+            batch_start = low
+            while batch_start <= high:
+                batch_end = batch_start + PARTITION_BATCH_SIZE
+                condition = "id >= ? AND id < ? AND create_at >= ? AND create_at < ?"
+                params = (batch_start, batch_end, start, end)
+                # 分区与主库的提交不是原子的，INSERT OR IGNORE 保证中断后重跑不会重复
+                await db.execute(
+                    f"INSERT OR IGNORE INTO {schema}.logs ({columns}) "
+                    f"SELECT {columns} FROM main.logs WHERE {condition}",
+                    params
+                )
+                # 搬走的日志仍然存在，错误聚合的计数保持不变
+                await db.execute("UPDATE log_archiving SET active = 1")
+                await db.execute(f"DELETE FROM main.logs WHERE {condition}", params)
+                await db.execute("UPDATE log_archiving SET active = 0")
+                await db.commit()
+                batch_start = batch_end
+                await asyncio.sleep(pause)
+
+            await update_partition_catalog(db, name, schema)
+            await db.commit()
+
+
+async def seal_partitions(pause_ms: int = PARTITION_PAUSE_MS) -> list[str]:
+    """把当前时间段之前的日志全部归档到各自的分区，返回处理过的分区名"""
+    _, current_start, _ = period_of(int(datetime.now().timestamp() * 1000))
+    sealed = []
+    while True:
+        async with db_connection() as db:
+            async with db.execute(
+                "SELECT MIN(create_at) FROM logs WHERE create_at < ?",
+                (current_start,)
+            ) as cursor:
+                oldest = (await cursor.fetchone())[0]
+        if oldest is None:
+            return sealed
+        name, start, end = period_of(oldest)
+        await _move_period(name, start, end, pause_ms / 1000)
+        sealed.append(name)
+
+
+async def _unlink_partitions(names: list[str]):
+    def unlink_all():
+        for name in names:
+            path = partition_path(name)
+            for suffix in ("", "-wal", "-shm"):
+                path.with_name(path.name + suffix).unlink(missing_ok=True)
+
+    if names:
+        await asyncio.to_thread(unlink_all)
+
+
+async def _release_issues(db: aiosqlite.Connection, counts):
+    """从错误聚合中减去被删除的归档日志，counts 为 (指纹, 小时, 条数)。
+
+    分区中的删除不会触发主库 logs 上的删除触发器，需要在同一个事务中自行扣减。
+    """
+    counts = [(count, hour, fingerprint) for fingerprint, hour, count in counts if fingerprint is not None]
+    if not counts:
+        return
+    totals = Counter()
+    for count, _, fingerprint in counts:
+        totals[fingerprint] += count
+    await db.executemany(
+        "UPDATE issue_hourly SET count = count - ? WHERE hour = ? AND fingerprint = ?",
+        counts
+    )
+    await db.executemany(
+        "DELETE FROM issue_hourly WHERE hour = ? AND fingerprint = ? AND count <= 0",
+        [(hour, fingerprint) for _, hour, fingerprint in counts]
+    )
+    await db.executemany(
+        "UPDATE issues SET count = count - ? WHERE fingerprint = ?",
+        [(count, fingerprint) for fingerprint, count in totals.items()]
+    )
+    for table in ("issue_devices", "issue_apps"):
+        await db.execute(
+            f"DELETE FROM {table} WHERE fingerprint IN (SELECT fingerprint FROM issues WHERE count <= 0)"
+        )
+    await db.execute("DELETE FROM issues WHERE count <= 0")
+
+
+async def drop_partitions(cutoff: int) -> list[str]:
+    """删除结束时间不晚于 cutoff 的整个分区文件，返回删除的分区名"""
+    async with db_connection() as db:
+        async with db.execute(
+            "SELECT name FROM log_partitions WHERE end <= ? ORDER BY start",
+            (cutoff,)
+        ) as cursor:
+            names = [row[0] for row in await cursor.fetchall()]
+
+    for name in names:
+        async with db_connection() as db:
+            async with attach_partition(db, name) as schema:
+                if schema is not None:
+                    async with db.execute(
+                        f"""
+                        SELECT fingerprint, create_at / 3600000, COUNT(*) FROM {schema}.logs
+                        GROUP BY fingerprint, create_at / 3600000
+                        """
+                    ) as cursor:
+                        await _release_issues(db, await cursor.fetchall())
+                await db.execute("DELETE FROM log_partitions WHERE name = ?", (name,))
+                await db.commit()
+    await _unlink_partitions(names)
+    return names
+
+
+async def purge_partitions(cutoff: int, where: str, params: list, batch_size: int = PARTITION_BATCH_SIZE,
+                           pause: float = PARTITION_PAUSE_MS / 1000) -> tuple[int, list[str]]:
+    """在起始时间早于 cutoff 的分区中按 id 区间分批删除满足 where 的日志。
+
+    用于按应用清理或分区只有一部分过期的情况；删空的分区连同文件一起删除。
+    返回 (删除的行数, 删除的分区名)。
+    """
+    async with db_connection() as db:
+        async with db.execute(
+            "SELECT name FROM log_partitions WHERE start < ? ORDER BY start",
+            (cutoff,)
+        ) as cursor:
+            names = [row[0] for row in await cursor.fetchall()]
+    if not names:
+        return 0, []
+
+    deleted = 0
+    for name in names:
+        async with db_connection() as db:
+            async with attach_partition(db, name) as schema:
+                if schema is None:
+                    continue
+                async with db.execute(
+                    f"SELECT MIN(id), MAX(id) FROM {schema}.logs WHERE create_at < ?",
+                    (cutoff,)
+                ) as cursor:
+                    low, high = await cursor.fetchone()
+                if low is None:
+                    continue
+                start = low
+                while start <= high:
+                    end = start + batch_size
+                    async with db.execute(
+                        f"DELETE FROM {schema}.logs WHERE id >= ? AND id < ? AND {where} "
+                        f"RETURNING fingerprint, create_at / 3600000",
+                        (start, end, *params)
+                    ) as cursor:
+                        removed = Counter(tuple(row) for row in await cursor.fetchall())
+                    deleted += sum(removed.values())
+                    await _release_issues(db, [(*key, count) for key, count in removed.items()])
+                    await db.commit()
+                    start = end
+                    await asyncio.sleep(pause)
+                await update_partition_catalog(db, name, schema)
+                await db.commit()
+
+    async with db_connection() as db:
+        async with db.execute(
+            f"DELETE FROM log_partitions WHERE rows = 0 AND name IN ({', '.join('?' * len(names))}) RETURNING name",
+            names
+        ) as cursor:
+            emptied = [row[0] for row in await cursor.fetchall()]
+        await db.commit()
+    await _unlink_partitions(emptied)
+    return deleted, emptied
+
+
+class PartitionArchiver:
+    """定期把已结束时间段的日志归档到分区文件"""
+
+    def __init__(self, interval: int = PARTITION_CHECK_INTERVAL):
+        self.interval = interval
+        self._task: asyncio.Task | None = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                sealed = await seal_partitions()
+                if sealed:
+                    logger.info("Archived logs into partitions: %s", ", ".join(sealed))
+            except Exception:
+                logger.exception("Failed to archive log partitions")
+            await asyncio.sleep(self.interval)
+
+
+archiver: PartitionArchiver | None = None
+
+
+async def start_partitions():
+    global archiver
+    if not partition_enabled():
+        return None
+    archiver = PartitionArchiver()
+    archiver.start()
+    return archiver
+
+
+async def stop_partitions():
+    global archiver
+    if archiver is not None:
+        await archiver.stop()
+        archiver = None
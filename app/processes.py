@@ -0,0 +1,85 @@
+"""子进程的流式执行：逐行读取输出，提前结束时清理整个进程组"""
+
+import asyncio
+import os
+import signal
+from typing import AsyncIterator
+
+# 流式输出时缓存的最大行数，队列满时暂停读取管道，子进程会在写满管道后阻塞
+SHELL_STREAM_BUFFER = int(os.environ.get("SHELL_STREAM_BUFFER", "1000"))
+# 单行的最大长度，超过时按该长度切分
+SHELL_LINE_LIMIT = 64 * 1024
+
+
+async def _read_lines(reader: asyncio.StreamReader, name: str, queue: asyncio.Queue):
+    """逐行读取管道并放入队列，队列满时等待（背压）"""
+    while True:
+        try:
+            line = await reader.readuntil(b"\n")
+        except asyncio.IncompleteReadError as e:
+            # 管道关闭，最后一行可能没有换行符
+            if e.partial:
+                await queue.put((name, e.partial))
+            break
+        except asyncio.LimitOverrunError as e:
+            line = await reader.read(e.consumed or SHELL_LINE_LIMIT)
+        await queue.put((name, line))
+    await queue.put((name, None))
+
+
+def kill_process(process: asyncio.subprocess.Process):
+    """结束子进程；POSIX 下结束整个进程组"""
+    try:
+        if os.name == "posix":
+            os.killpg(process.pid, signal.SIGKILL)
+        else:
+            process.kill()
+    except ProcessLookupError:
+        pass
+
+
+async def stream_shell_command(
+    command: str,
+    working_dir: str | None = None,
+    env: dict | None = None
+) -> AsyncIterator[tuple[str, str | int]]:
+    """执行shell命令并逐行产生输出：("stdout" | "stderr", 行内容)，最后是 ("exit", 退出码)。
+
+    调用方停止迭代（例如客户端断开）时会结束子进程。
+    """
+    # 合并环境变量
+    process_env = os.environ.copy()
+    if env:
+        process_env.update(env)
+
+    # 创建子进程
+    process = await asyncio.create_subprocess_shell(
+        command,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+        cwd=working_dir,
+        env=process_env,
+        limit=SHELL_LINE_LIMIT,
+        # 放入独立的进程组，提前结束时连同 shell 启动的子进程一起结束
+        start_new_session=os.name == "posix"
+    )
+    queue = asyncio.Queue(SHELL_STREAM_BUFFER)
+    readers = [
+        asyncio.create_task(_read_lines(process.stdout, "stdout", queue)),
+        asyncio.create_task(_read_lines(process.stderr, "stderr", queue)),
+    ]
+    try:
+        open_streams = len(readers)
+        while open_streams:
+            name, line = await queue.get()
+            if line is None:
+                open_streams -= 1
+                continue
+            yield name, line.decode(errors="replace").rstrip("\r\n")
+        yield "exit", await process.wait()
+    finally:
+        for reader in readers:
+            reader.cancel()
+        if process.returncode is None:
+            kill_process(process)
+            await process.wait()
@@ -0,0 +1,101 @@
+"""进程内的发布/订阅，用于把新写入的日志和统计数据实时推送给订阅者"""
+
+import asyncio
+import logging
+import os
+from typing import Any, Callable
+
+logger = logging.getLogger(__name__)
+
+# 每个订阅者最多缓存的消息数，超过后该订阅者会被断开
+SUBSCRIBER_BUFFER_SIZE = int(os.environ.get("TAIL_BUFFER_SIZE", "1000"))
+
+
+class SubscriberDropped(Exception):
+    """订阅者消费过慢、缓冲区已满而被断开"""
+
+
+class Subscription:
+    """单个订阅者：有界队列加上可选的过滤函数"""
+
+    def __init__(self, broker: "Broker", topic: str, match: Callable[[Any], bool] | None,
+                 maxsize: int):
+        self.broker = broker
+        self.topic = topic
+        self.match = match
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize)
+        self.dropped = False
+        self.delivered = 0
+
+    def offer(self, message: Any) -> bool:
+        """非阻塞投递；缓冲区已满时标记为断开并返回 False"""
+        if self.match is not None and not self.match(message):
+            return True
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            # 队列已满说明消费者没有在等待，下次读取时才会发现被断开
+            self.dropped = True
+            return False
+        return True
+
+    async def get(self, timeout: float | None = None) -> Any:
+        """取下一条消息；超时返回 None，订阅者已被断开时抛出 SubscriberDropped"""
+        if self.dropped:
+            raise SubscriberDropped()
+        try:
+            message = await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+        self.delivered += 1
+        return message
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class Broker:
+    """按主题分发消息，发布方永远不会因为订阅者而阻塞"""
+
+    def __init__(self, buffer_size: int = SUBSCRIBER_BUFFER_SIZE):
+        self.buffer_size = buffer_size
+        self._topics: dict[str, set[Subscription]] = {}
+        self.published = 0
+        self.dropped = 0
+
+    def subscribe(self, topic: str, match: Callable[[Any], bool] | None = None) -> Subscription:
+        subscription = Subscription(self, topic, match, self.buffer_size)
+        self._topics.setdefault(topic, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        subscribers = self._topics.get(subscription.topic)
+        if subscribers is not None:
+            subscribers.discard(subscription)
+
+    def has_subscribers(self, topic: str) -> bool:
+        """没有订阅者时发布方可以跳过构造消息"""
+        return bool(self._topics.get(topic))
+
+    def publish(self, topic: str, message: Any):
+        subscribers = self._topics.get(topic)
+        if not subscribers:
+            return
+        self.published += 1
+        for subscription in list(subscribers):
+            if not subscription.offer(message):
+                subscribers.discard(subscription)
+                self.dropped += 1
+                logger.warning("Dropped slow %s subscriber after %d messages",
+                               topic, subscription.delivered)
+
+    def metrics(self) -> dict:
+        return {
+            "subscribers": {topic: len(subs) for topic, subs in self._topics.items()},
+            "buffer_size": self.buffer_size,
+            "published": self.published,
+            "dropped": self.dropped,
+        }
+
+
+broker = Broker()
@@ -0,0 +1,53 @@
+import json
+from typing import Any
+
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+try:
+    import orjson
+except ImportError:  # orjson 为可选依赖，未安装时退回标准库 json
+    orjson = None
+
+
+def dumps(content: Any) -> bytes:
+    """序列化为紧凑的 UTF-8 JSON"""
+    if orjson is not None:
+        return orjson.dumps(content)
+    return json.dumps(
+        content,
+        ensure_ascii=False,
+        allow_nan=False,
+        indent=None,
+        separators=(",", ":"),
+    ).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """使用 orjson 序列化的 JSON 响应。
+
+    直接返回此响应时 FastAPI 不再执行 jsonable_encoder 和 response_model 校验，
+    只适用于内容已经是基础类型（例如数据库行）的场景。
+    """
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def field_aliases(model: type[BaseModel]) -> dict[str, str]:
+    """模型字段名到对外输出名（别名）的映射"""
+    return {
+        name: field.alias or name
+        for name, field in model.model_fields.items()
+    }
+
+
+def rows_to_dicts(rows: list, aliases: dict[str, str] | None = None) -> list[dict]:
+    """把数据库行直接转换为输出字典，按别名映射重命名列，不构造模型"""
+    if not rows:
+        return []
+    keys = [
+        aliases.get(key, key) if aliases else key
+        for key in rows[0].keys()
+    ]
+    return [dict(zip(keys, row)) for row in rows]
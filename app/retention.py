@@ -0,0 +1,328 @@
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+
+from app.database import ROLLUP_RESOLUTIONS, db_connection
+from app.partitions import drop_partitions, purge_partitions
+from app.screenshots import collect_screenshots
+
+logger = logging.getLogger(__name__)
+
+# 每批删除的 id 范围大小，以及两批之间让出的时间（毫秒）
+RETENTION_BATCH_SIZE = int(os.environ.get("RETENTION_BATCH_SIZE", "2000"))
+RETENTION_PAUSE_MS = int(os.environ.get("RETENTION_PAUSE_MS", "50"))
+# 按策略自动清理的间隔（秒），0 表示关闭定时清理
+RETENTION_INTERVAL = int(os.environ.get("RETENTION_INTERVAL", "3600"))
+# 内存中保留的任务记录数量
+MAX_JOB_HISTORY = 100
+
+# 清理目标：依次处理的 (表名, 时间列, 按应用过滤的条件模板)
+RETENTION_TARGETS = {
+    "logs": [
+        ("logs", "create_at", "app_id IN ({})"),
+    ],
+    # stats_infos 没有 app_id，需要先于 stats_records 删除以便按 login_id 关联
+    "stats": [
+        ("stats_infos", "created_at", "login_id IN (SELECT login_id FROM stats_records WHERE app_id IN ({}))"),
+        ("stats_records", "created_at", "app_id IN ({})"),
+    ],
+}
+# stats_infos 的聚合表，整个桶都早于 cutoff 时删除；按会话关联应用，需要先于 stats_records 清理
+ROLLUP_APP_FILTER = "login_id IN (SELECT login_id FROM stats_records WHERE app_id IN ({}))"
+
+
+class RetentionJob:
+    """一次后台清理任务：删除 target 中时间早于 cutoff 的数据"""
+
+    def __init__(self, job_id: int, target: str, cutoff: int, app_ids=None,
+                 exclude_app_ids=None, source: str = "manual"):
+        self.id = job_id
+        self.target = target
+        self.cutoff = cutoff
+        self.app_ids = list(app_ids or [])
+        self.exclude_app_ids = list(exclude_app_ids or [])
+        self.source = source
+        self.status = "pending"
+        self.deleted = {table: 0 for table, _, _ in RETENTION_TARGETS[target]}
+        if target == "stats":
+            self.deleted["stats_rollups"] = 0
+        self.batches = 0
+        self.dropped_partitions = []
+        self.progress = 0.0
+        self.error = None
+        self.created_at = int(time.time() * 1000)
+        self.started_at = None
+        self.finished_at = None
+        self.task: asyncio.Task | None = None
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "target": self.target,
+            "cutoff": self.cutoff,
+            "app_ids": self.app_ids,
+            "exclude_app_ids": self.exclude_app_ids,
+            "source": self.source,
+            "status": self.status,
+            "deleted": self.deleted,
+            "batches": self.batches,
+            "dropped_partitions": self.dropped_partitions,
+            "progress": round(self.progress, 4),
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class RetentionManager:
+    """分批删除过期数据的后台任务管理器。
+
+    每批只删除一个 id 区间内的行并立即提交，批与批之间让出事件循环和写锁，
+    避免长时间阻塞写入。同一时间只运行一个清理任务，其余任务排队等待。
+    """
+
+    def __init__(self, batch_size: int = RETENTION_BATCH_SIZE, pause_ms: int = RETENTION_PAUSE_MS,
+                 interval: int = RETENTION_INTERVAL):
+        self.batch_size = batch_size
+        self.pause = pause_ms / 1000
+        self.interval = interval
+        self.jobs: OrderedDict[int, RetentionJob] = OrderedDict()
+        self._next_id = 1
+        self._lock = asyncio.Lock()
+        self._scheduler: asyncio.Task | None = None
+
+    def start(self):
+        if self.interval > 0:
+            self._scheduler = asyncio.create_task(self._schedule())
+
+    async def stop(self):
+        tasks = [job.task for job in self.jobs.values() if job.task is not None and not job.task.done()]
+        if self._scheduler is not None:
+            tasks.append(self._scheduler)
+            self._scheduler = None
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def submit(self, target: str, cutoff: int, app_ids=None, exclude_app_ids=None,
+               source: str = "manual") -> RetentionJob:
+        """提交清理任务，删除 target 中时间早于 cutoff（毫秒）的数据"""
+        if target not in RETENTION_TARGETS:
+            raise ValueError(f"Unknown retention target: {target}")
+        job = RetentionJob(self._next_id, target, cutoff, app_ids, exclude_app_ids, source)
+        self._next_id += 1
+        self.jobs[job.id] = job
+        while len(self.jobs) > MAX_JOB_HISTORY:
+            oldest = next(iter(self.jobs.values()))
+            if oldest.status in ("pending", "running"):
+                break
+            self.jobs.popitem(last=False)
+        job.task = asyncio.create_task(self._run(job))
+        return job
+
+    def get(self, job_id: int) -> RetentionJob | None:
+        return self.jobs.get(job_id)
+
+    def cancel(self, job_id: int) -> bool:
+        job = self.jobs.get(job_id)
+        if job is None or job.task is None or job.task.done():
+            return False
+        job.task.cancel()
+        return True
+
+    async def run_policies(self) -> list[RetentionJob]:
+        """按 retention_policies 表中的策略提交清理任务。
+
+        指定了 app_id 的策略只清理该应用；app_id 为空的默认策略清理其余所有应用。
+        """
+        async with db_connection() as db:
+            async with db.execute("SELECT target, app_id, days FROM retention_policies") as cursor:
+                policies = [tuple(row) for row in await cursor.fetchall()]
+
+        now = int(time.time() * 1000)
+        jobs = []
+        for target, app_id, days in policies:
+            if target not in RETENTION_TARGETS:
+                logger.warning("Skipping retention policy for unknown target %s", target)
+                continue
+            cutoff = now - days * 86400 * 1000
+            if app_id:
+                jobs.append(self.submit(target, cutoff, app_ids=[app_id], source="policy"))
+            else:
+                overridden = [other for t, other, _ in policies if t == target and other]
+                jobs.append(self.submit(target, cutoff, exclude_app_ids=overridden, source="policy"))
+        return jobs
+
+    async def _schedule(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.run_policies()
+            except Exception:
+                logger.exception("Failed to run retention policies")
+
+    async def _run(self, job: RetentionJob):
+        try:
+            async with self._lock:
+                job.status = "running"
+                job.started_at = int(time.time() * 1000)
+                if job.target == "logs":
+                    await self._purge_partitions(job)
+                for table, time_column, app_filter in RETENTION_TARGETS[job.target]:
+                    if table == "stats_records":
+                        await self._purge_rollups(job)
+                    await self._purge(job, table, time_column, app_filter)
+                if job.target == "stats":
+                    async with db_connection() as db:
+                        await collect_screenshots(db)
+                job.status = "done"
+                job.progress = 1.0
+        except asyncio.CancelledError:
+            job.status = "cancelled"
+            raise
+        except Exception as e:
+            logger.exception("Retention job %d failed", job.id)
+            job.status = "failed"
+            job.error = str(e)
+        finally:
+            job.finished_at = int(time.time() * 1000)
+
+    async def _purge_partitions(self, job: RetentionJob):
+        """清理已归档的日志分区。
+
+        没有应用过滤时，整体过期的分区直接删除文件；其余起始时间早于 cutoff 的分区
+        逐个 ATTACH 后按同样的条件分批删除，删空的分区同样删除文件。
+        """
+        if not job.app_ids and not job.exclude_app_ids:
+            job.dropped_partitions = await drop_partitions(job.cutoff)
+        _, time_column, app_filter = RETENTION_TARGETS["logs"][0]
+        where, params = self._conditions(job, time_column, app_filter)
+        deleted, emptied = await purge_partitions(job.cutoff, where, params, self.batch_size, self.pause)
+        job.deleted["logs"] += deleted
+        job.dropped_partitions.extend(emptied)
+
+    @staticmethod
+    def _stages(job: RetentionJob) -> list[str]:
+        """按执行顺序列出任务会清理的表，用于计算进度"""
+        stages = [table for table, _, _ in RETENTION_TARGETS[job.target]]
+        if "stats_records" in stages:
+            stages.insert(stages.index("stats_records"), "stats_rollups")
+        return stages
+
+    def _set_progress(self, job: RetentionJob, stage: str, fraction: float):
+        stages = self._stages(job)
+        job.progress = (stages.index(stage) + min(max(fraction, 0.0), 1.0)) / len(stages)
+
+    async def _purge_rollups(self, job: RetentionJob):
+        """删除已经完全过期的聚合桶。
+
+        每个粒度单独换算 bucket 的上限，使用以 bucket 开头的索引；
+        stats_rollups 没有 rowid，按 (bucket, login_id) 游标选出一批桶后按主键删除，
+        不会在每批重新扫描已经跳过的行。
+        """
+        where, params = self._conditions(job, "bucket", ROLLUP_APP_FILTER)
+        where += " AND resolution = ? AND (bucket, login_id) > (?, ?)"
+        resolutions = list(ROLLUP_RESOLUTIONS.values())
+        for index, resolution in enumerate(resolutions):
+            # 桶的最后一毫秒早于 cutoff，即整个桶都已过期
+            limit = job.cutoff - resolution + 1
+            async with db_connection() as db:
+                async with db.execute(
+                    "SELECT MIN(bucket) FROM stats_rollups WHERE bucket < ? AND resolution = ?",
+                    (limit, resolution)
+                ) as cursor:
+                    low = (await cursor.fetchone())[0]
+            if low is None:
+                continue
+
+            last = (low - 1, -2**63)
+            while True:
+                async with db_connection() as db:
+                    async with db.execute(
+                        f"""
+                        SELECT login_id, bucket FROM stats_rollups WHERE {where}
+                        ORDER BY bucket, login_id LIMIT ?
+                        """,
+                        (limit, *params[1:], resolution, *last, self.batch_size)
+                    ) as cursor:
+                        keys = await cursor.fetchall()
+                    if keys:
+                        await db.executemany(
+                            "DELETE FROM stats_rollups WHERE login_id = ? AND resolution = ? AND bucket = ?",
+                            [(login_id, resolution, bucket) for login_id, bucket in keys]
+                        )
+                        await db.commit()
+                job.deleted["stats_rollups"] += len(keys)
+                job.batches += 1
+                if len(keys) < self.batch_size:
+                    break
+                last = (keys[-1][1], keys[-1][0])
+                self._set_progress(job, "stats_rollups", (index + (last[0] - low + 1) / (limit - low)) / len(resolutions))
+                await asyncio.sleep(self.pause)
+            self._set_progress(job, "stats_rollups", (index + 1) / len(resolutions))
+
+    @staticmethod
+    def _conditions(job: RetentionJob, time_column: str, app_filter: str) -> tuple[str, list]:
+        conditions = [f"{time_column} < ?"]
+        params = [job.cutoff]
+        if job.app_ids:
+            conditions.append(app_filter.format(", ".join("?" * len(job.app_ids))))
+            params.extend(job.app_ids)
+        if job.exclude_app_ids:
+            # app_id 为 NULL 时 IN 的结果为 NULL，同样视为不在排除列表中
+            conditions.append(
+                f"NOT coalesce({app_filter.format(', '.join('?' * len(job.exclude_app_ids)))}, 0)"
+            )
+            params.extend(job.exclude_app_ids)
+        return " AND ".join(conditions), params
+
+    async def _purge(self, job: RetentionJob, table: str, time_column: str, app_filter: str):
+        where, params = self._conditions(job, time_column, app_filter)
+
+        # 只查询一次 id 范围，之后按主键区间分批删除
+        async with db_connection() as db:
+            async with db.execute(f"SELECT MIN(id), MAX(id) FROM {table} WHERE {time_column} < ?",
+                                  (job.cutoff,)) as cursor:
+                low, high = await cursor.fetchone()
+        if low is None:
+            return
+
+        start = low
+        while start <= high:
+            end = start + self.batch_size
+            async with db_connection() as db:
+                async with db.execute(
+                    f"DELETE FROM {table} WHERE id >= ? AND id < ? AND {where}",
+                    (start, end, *params)
+                ) as cursor:
+                    deleted = cursor.rowcount
+                await db.commit()
+            job.deleted[table] += max(deleted, 0)
+            job.batches += 1
+            start = end
+            self._set_progress(job, table, (start - low) / (high - low + 1))
+            await asyncio.sleep(self.pause)
+
+
+manager: RetentionManager | None = None
+
+
+def get_retention() -> RetentionManager:
+    global manager
+    if manager is None:
+        manager = RetentionManager()
+    return manager
+
+
+async def start_retention():
+    get_retention().start()
+
+
+async def stop_retention():
+    global manager
+    if manager is not None:
+        await manager.stop()
+        manager = None
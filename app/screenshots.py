@@ -0,0 +1,186 @@
+import asyncio
+import base64
+import hashlib
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import aiosqlite
+
+logger = logging.getLogger(__name__)
+
+# 截图目录，按内容哈希分两级子目录存放
+UPLOAD_DIR = Path("public/uploads")
+SCREENSHOT_WORKERS = int(os.environ.get("SCREENSHOT_WORKERS", "2"))
+# 引用数归零后保留的时间（毫秒），避免与尚未提交的写入（如写后队列）冲突
+SCREENSHOT_GC_GRACE = int(os.environ.get("SCREENSHOT_GC_GRACE", str(3600 * 1000)))
+# 流式上传的单张截图大小上限（字节）
+MAX_SCREENSHOT_SIZE = int(os.environ.get("MAX_SCREENSHOT_SIZE", str(20 * 1024 * 1024)))
+
+REGISTER_SCREENSHOT_SQL = """
+    INSERT INTO screenshots (path, hash, size, refs, created_at)
+    VALUES (?, ?, ?, 0, ?)
+    ON CONFLICT(path) DO UPDATE SET created_at = excluded.created_at
+"""
+
+_executor = ThreadPoolExecutor(max_workers=SCREENSHOT_WORKERS, thread_name_prefix="screenshot")
+# 落盘与回收删除文件互斥，回收时据此判断文件是否刚被重新写入
+_files_lock = threading.Lock()
+
+
+def screenshot_path(digest: str) -> str:
+    """内容哈希对应的相对路径（相对 public 目录）"""
+    return f"uploads/{digest[:2]}/{digest[2:4]}/{digest}.jpg"
+
+
+def _temp_path(directory: Path, name: str) -> Path:
+    return directory / f".{name}.{os.getpid()}.{time.monotonic_ns()}.tmp"
+
+
+def _touch(target: Path) -> bool:
+    """文件已存在时刷新修改时间并返回 True，回收任务据此不会删除刚被再次使用的截图。
+
+    调用方需持有 _files_lock。
+    """
+    try:
+        os.utime(target)
+        return True
+    except FileNotFoundError:
+        return False
+
+
+def _place(tmp: Path, digest: str) -> str:
+    """把写好的临时文件移动到内容哈希对应的位置，已存在相同内容时丢弃临时文件"""
+    relative_path = screenshot_path(digest)
+    target = UPLOAD_DIR.parent / relative_path
+    target.parent.mkdir(parents=True, exist_ok=True)
+    with _files_lock:
+        if _touch(target):
+            tmp.unlink()
+        else:
+            os.replace(tmp, target)
+    return relative_path
+
+
+def save_screenshot_bytes(data: bytes) -> tuple[str, str, int]:
+    """按内容哈希保存图片，相同内容只写一次，返回 (相对路径, 哈希, 大小)"""
+    digest = hashlib.sha256(data).hexdigest()
+    relative_path = screenshot_path(digest)
+    with _files_lock:
+        if _touch(UPLOAD_DIR.parent / relative_path):
+            return relative_path, digest, len(data)
+    # 先写临时文件再原子替换，避免读到写了一半的图片
+    UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
+    tmp = _temp_path(UPLOAD_DIR, digest)
+    with open(tmp, "wb") as f:
+        f.write(data)
+    return _place(tmp, digest), digest, len(data)
+
+
+def _decode_and_save(encoded: str) -> tuple[str, str, int]:
+    return save_screenshot_bytes(base64.b64decode(encoded))
+
+
+async def store_screenshot(encoded: str) -> tuple[str, tuple]:
+    """在线程池中解码并保存 base64 图片。
+
+    返回 (相对路径, 登记参数)，登记参数配合 REGISTER_SCREENSHOT_SQL 使用，
+    需要与引用它的 stats_infos 行在同一事务（或写后队列）中、且在其之前执行；
+    该事务失败时用 release_screenshot 单独登记，避免文件无人引用也无法回收。
+    """
+    loop = asyncio.get_running_loop()
+    relative_path, digest, size = await loop.run_in_executor(_executor, _decode_and_save, encoded)
+    params = (relative_path, digest, size, int(time.time() * 1000))
+    return relative_path, params
+
+
+class ScreenshotUpload:
+    """流式接收的截图：分块写入临时文件并同时计算哈希，结束后再按内容哈希落盘。
+
+    文件读写都在截图线程池中执行，整张图片不会驻留在内存里。
+    """
+
+    def __init__(self, max_size: int = MAX_SCREENSHOT_SIZE):
+        self.max_size = max_size
+        self.size = 0
+        self._hasher = hashlib.sha256()
+        self._tmp = _temp_path(UPLOAD_DIR, "upload")
+        self._file = None
+
+    def _write(self, data: bytes):
+        if self._file is None:
+            UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
+            self._file = open(self._tmp, "wb")
+        self._file.write(data)
+        self._hasher.update(data)
+
+    def _finish(self) -> tuple[str, str, int]:
+        if self._file is None:
+            self._write(b"")
+        self._file.close()
+        digest = self._hasher.hexdigest()
+        return _place(self._tmp, digest), digest, self.size
+
+    def _abort(self):
+        if self._file is not None:
+            self._file.close()
+            self._tmp.unlink(missing_ok=True)
+
+    async def write(self, data: bytes):
+        """追加一块数据，超过大小限制时抛出 ValueError"""
+        self.size += len(data)
+        if self.size > self.max_size:
+            raise ValueError(f"Screenshot is larger than {self.max_size} bytes")
+        await asyncio.get_running_loop().run_in_executor(_executor, self._write, data)
+
+    async def finish(self) -> tuple[str, tuple]:
+        """完成写入，返回值与 store_screenshot 相同"""
+        loop = asyncio.get_running_loop()
+        relative_path, digest, size = await loop.run_in_executor(_executor, self._finish)
+        return relative_path, (relative_path, digest, size, int(time.time() * 1000))
+
+    async def abort(self):
+        """放弃写入并删除临时文件"""
+        await asyncio.get_running_loop().run_in_executor(_executor, self._abort)
+
+
+async def release_screenshot(db: aiosqlite.Connection, params: tuple):
+    """引用截图的写入失败时单独登记截图（引用数为 0），由回收任务在保留期后删除文件。
+
+    相同内容的文件可能正被其他请求使用，所以不直接删除。
+    """
+    try:
+        await db.rollback()
+        await db.execute(REGISTER_SCREENSHOT_SQL, params)
+        await db.commit()
+    except Exception:
+        logger.exception("Failed to register unreferenced screenshot %s", params[0])
+
+
+async def collect_screenshots(db: aiosqlite.Connection) -> int:
+    """删除不再被引用且超过保留时间的截图文件，返回删除的数量"""
+    cutoff = int(time.time() * 1000) - SCREENSHOT_GC_GRACE
+    async with db.execute(
+        "DELETE FROM screenshots WHERE refs <= 0 AND created_at < ? RETURNING path",
+        (cutoff,)
+    ) as cursor:
+        paths = [row[0] for row in await cursor.fetchall()]
+    await db.commit()
+
+    def unlink_all():
+        for path in paths:
+            target = UPLOAD_DIR.parent / path
+            with _files_lock:
+                try:
+                    # 保留期内被重新写入的文件属于新的上传，它会重新登记
+                    if target.stat().st_mtime * 1000 < cutoff:
+                        target.unlink()
+                except FileNotFoundError:
+                    pass
+
+    if paths:
+        await asyncio.get_running_loop().run_in_executor(_executor, unlink_all)
+    return len(paths)
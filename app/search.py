@@ -0,0 +1,273 @@
+"""在文件中并行搜索字面量或正则表达式。
+
+bytes.find 和 re 在整个调用期间都持有 GIL，线程池无法并行，还会阻塞事件循环，
+所以搜索在进程池中进行。每个文件按 SEARCH_WINDOW 切成以行边界对齐的分段，
+每段是一个独立的任务：子进程用 mmap 映射文件，只搜索自己的分段，
+返回段内的换行数和匹配（行号相对于段的起点）。
+事件循环按文件内的顺序合并各段结果、换算行号后逐条输出。
+同时提交的分段数有上限，取消或达到结果上限后不再提交新的分段。
+"""
+
+import asyncio
+import fnmatch
+import mmap
+import multiprocessing
+import os
+import re
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import AsyncIterator, Callable
+
+# 搜索进程数
+SEARCH_WORKERS = int(os.environ.get("SEARCH_WORKERS", str(min(8, os.cpu_count() or 1))))
+# 每个分段的字节数
+SEARCH_WINDOW = 8 * 1024 * 1024
+# 每个搜索进程同时排队的分段数
+SEARCH_QUEUE_DEPTH = 2
+# 返回的单行最大字符数，超出时只保留匹配位置附近的内容
+SEARCH_MAX_LINE = 1000
+
+_executor: ProcessPoolExecutor | None = None
+
+
+def get_executor() -> ProcessPoolExecutor:
+    """按需创建进程池；使用 spawn，避免在多线程的服务进程中 fork"""
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(
+            max_workers=SEARCH_WORKERS,
+            mp_context=multiprocessing.get_context("spawn")
+        )
+    return _executor
+
+
+async def stop_search():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+def compile_pattern(query: str, regex: bool, ignore_case: bool) -> tuple[re.Pattern | None, bytes | None]:
+    """返回 (正则, 字面量)；区分大小写的字面量直接用 find 搜索，最快。正则不合法时抛出 re.error"""
+    if not regex and not ignore_case:
+        return None, query.encode("utf-8")
+    source = query.encode("utf-8") if regex else re.escape(query.encode("utf-8"))
+    flags = re.MULTILINE | (re.IGNORECASE if ignore_case else 0)
+    return re.compile(source, flags), None
+
+
+def _line_text(mm, start: int, end: int, position: int | None = None) -> str:
+    """解码一行，过长时截取 position 附近的 SEARCH_MAX_LINE 字节"""
+    if end - start > SEARCH_MAX_LINE:
+        if position is None:
+            position = start
+        start = max(start, position - SEARCH_MAX_LINE // 4)
+        end = min(end, start + SEARCH_MAX_LINE)
+    return mm[start:end].rstrip(b"\r").decode("utf-8", errors="replace")
+
+
+def _align(mm, position: int, size: int) -> int:
+    """position 处或之后的第一个行首；同一文件的相邻分段由此得到相同的边界"""
+    if position <= 0:
+        return 0
+    if position >= size:
+        return size
+    newline = mm.find(b"\n", position - 1, size)
+    return size if newline < 0 else newline + 1
+
+
+def search_window(path: str, start: int, end: int, pattern: re.Pattern | None, literal: bytes | None,
+                  context: int, limit: int) -> tuple[int, list[tuple]]:
+    """在子进程中搜索文件的一个分段，包含行首位于 [start, end) 的所有行。
+
+    返回 (分段内的换行数, [(段内行号, 行内容, 前文, 后文), ...])，最多 limit 条匹配。
+    """
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            return 0, []
+        with mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ) as mm:
+            start = _align(mm, start, size)
+            end = _align(mm, end, size)
+            matches = []
+            line_number = 0
+            counted = start
+            position = start
+            while position < end and len(matches) < limit:
+                if literal is not None:
+                    found = mm.find(literal, position, end)
+                else:
+                    match = pattern.search(mm, position, end)
+                    found = match.start() if match else -1
+                if found < 0:
+                    break
+
+                line_start = mm.rfind(b"\n", 0, found) + 1
+                line_end = mm.find(b"\n", found, size)
+                line_end = size if line_end < 0 else line_end
+                line_number += mm[counted:line_start].count(b"\n")
+                counted = line_start
+
+                before = []
+                previous_end = line_start
+                for _ in range(context):
+                    if previous_end == 0:
+                        break
+                    previous = mm.rfind(b"\n", 0, previous_end - 1) + 1
+                    before.insert(0, _line_text(mm, previous, previous_end - 1))
+                    previous_end = previous
+                after = []
+                next_start = line_end
+                for _ in range(context):
+                    if next_start >= size:
+                        break
+                    following = mm.find(b"\n", next_start + 1, size)
+                    following = size if following < 0 else following
+                    after.append(_line_text(mm, next_start + 1, following))
+                    next_start = following
+
+                matches.append((line_number, _line_text(mm, line_start, line_end, found), before, after))
+                # 每行只报告一次
+                position = line_end + 1
+
+            return mm[start:end].count(b"\n"), matches
+
+
+def _inside(path: Path, base: Path) -> bool:
+    return path == base or base in path.parents
+
+
+def collect_files(root: Path, accept: Callable[[str], bool], name_filter: str | None = None,
+                  base: Path | None = None) -> list[tuple[Path, int]]:
+    """递归列出 root 下需要搜索的 (文件, 大小)，跳过隐藏文件和目录。
+
+    符号链接解析后不在 base（默认为 root）之内的文件和目录会被跳过，指向同一目录的链接只遍历一次。
+    """
+    base = (base or root).resolve()
+    visited = set()
+    files = []
+    for directory, dirnames, filenames in os.walk(root, followlinks=True):
+        real = Path(directory).resolve()
+        if real in visited or not _inside(real, base):
+            dirnames[:] = []
+            continue
+        visited.add(real)
+        dirnames[:] = [name for name in dirnames if not name.startswith(".")]
+        for name in filenames:
+            if name.startswith(".") or not accept(name):
+                continue
+            if name_filter and not fnmatch.fnmatch(name.lower(), name_filter.lower()):
+                continue
+            path = Path(directory) / name
+            try:
+                if not _inside(path.resolve(strict=True), base):
+                    continue
+                size = path.stat().st_size
+            except OSError:
+                continue
+            files.append((path, size))
+    return files
+
+
+class _FileProgress:
+    """单个文件的分段结果，按顺序合并以换算行号"""
+
+    def __init__(self, relative: str, windows: int):
+        self.relative = relative
+        self.windows = windows
+        self.next_window = 0
+        self.lines_before = 0
+        self.results: dict[int, tuple[int, list]] = {}
+        self.failed = False
+
+
+async def search_files(root: Path, files: list[tuple[Path, int]], pattern: re.Pattern | None,
+                       literal: bytes | None, context: int = 0,
+                       max_results: int = 1000) -> AsyncIterator[dict]:
+    """在进程池中并行搜索 files，逐条产生匹配，最后产生一条 summary。
+
+    调用方停止迭代（例如客户端断开）时取消排队中的分段，不再提交新的分段。
+    """
+    executor = get_executor()
+    loop = asyncio.get_running_loop()
+    started = time.monotonic()
+
+    windows = deque()
+    for path, size in files:
+        progress = _FileProgress(path.relative_to(root).as_posix(), max(1, -(-size // SEARCH_WINDOW)))
+        for index in range(progress.windows):
+            windows.append((path, progress, index))
+
+    running: dict[asyncio.Future, tuple[_FileProgress, int]] = {}
+    matches = 0
+    truncated = False
+    files_searched = 0
+    files_failed = 0
+    try:
+        while (windows or running) and not truncated:
+            while windows and len(running) < SEARCH_WORKERS * SEARCH_QUEUE_DEPTH:
+                path, progress, index = windows.popleft()
+                if progress.failed:
+                    continue
+                future = loop.run_in_executor(
+                    executor, search_window, str(path), index * SEARCH_WINDOW,
+                    (index + 1) * SEARCH_WINDOW, pattern, literal, context, max_results - matches + 1
+                )
+                running[future] = (progress, index)
+            if not running:
+                break
+
+            done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+            for future in done:
+                progress, index = running.pop(future)
+                if progress.failed:
+                    continue
+                try:
+                    progress.results[index] = future.result()
+                except BrokenProcessPool:
+                    # 子进程异常退出后进程池不可再用，下次搜索时重新创建
+                    await stop_search()
+                    raise
+                except (OSError, ValueError):
+                    # 无法读取，或搜索期间文件被截断
+                    progress.failed = True
+                    files_failed += 1
+                    continue
+
+                # 按顺序输出前面的分段都已完成的结果
+                while not truncated and progress.next_window in progress.results:
+                    newlines, window_matches = progress.results.pop(progress.next_window)
+                    for line, text, before, after in window_matches:
+                        if matches >= max_results:
+                            truncated = True
+                            break
+                        matches += 1
+                        yield {
+                            "type": "match",
+                            "path": progress.relative,
+                            "line": progress.lines_before + line + 1,
+                            "text": text,
+                            "before": before,
+                            "after": after,
+                        }
+                    progress.lines_before += newlines
+                    progress.next_window += 1
+                    if progress.next_window == progress.windows:
+                        files_searched += 1
+
+        yield {
+            "type": "summary",
+            "files": len(files),
+            "files_searched": files_searched,
+            "files_failed": files_failed,
+            "matches": matches,
+            "truncated": truncated,
+            "elapsed": round(time.monotonic() - started, 3),
+        }
+    finally:
+        for future in running:
+            future.cancel()
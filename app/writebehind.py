@@ -0,0 +1,307 @@
+import asyncio
+import logging
+import os
+from itertools import groupby
+
+import aiosqlite
+
+from app.database import DB_PATH, configure_connection
+
+logger = logging.getLogger(__name__)
+
+# 写后队列配置，默认关闭，可通过环境变量开启
+WRITE_BEHIND = os.environ.get("DB_WRITE_BEHIND", "0").lower() in ("1", "true", "yes")
+QUEUE_SIZE = int(os.environ.get("DB_WRITE_BEHIND_QUEUE_SIZE", "10000"))
+BATCH_ROWS = int(os.environ.get("DB_WRITE_BEHIND_BATCH_ROWS", "500"))
+FLUSH_INTERVAL_MS = int(os.environ.get("DB_WRITE_BEHIND_INTERVAL_MS", "50"))
+# 持久性："enqueue" 入队即返回，"commit" 等待所在批次提交后再返回
+DURABILITY = os.environ.get("DB_WRITE_BEHIND_DURABILITY", "enqueue")
+# 写入连接的 PRAGMA synchronous：OFF / NORMAL / FULL
+SYNCHRONOUS = os.environ.get("DB_WRITE_BEHIND_SYNCHRONOUS", "NORMAL")
+FLUSH_ON_SHUTDOWN = os.environ.get("DB_WRITE_BEHIND_FLUSH_ON_SHUTDOWN", "1").lower() in ("1", "true", "yes")
+
+
+class WriteBehindQueue:
+    """有界的写后队列，由单个写入任务按行数或时间间隔分组提交"""
+
+    def __init__(
+        self,
+        path=DB_PATH,
+        maxsize: int = QUEUE_SIZE,
+        batch_rows: int = BATCH_ROWS,
+        interval_ms: int = FLUSH_INTERVAL_MS,
+        durability: str = DURABILITY,
+        synchronous: str = SYNCHRONOUS,
+    ):
+        if durability not in ("enqueue", "commit"):
+            raise ValueError(f"Unknown write-behind durability: {durability}")
+        self.path = path
+        self.batch_rows = batch_rows
+        self.interval = interval_ms / 1000
+        self.durability = durability
+        self.synchronous = synchronous
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize)
+        self._db: aiosqlite.Connection | None = None
+        self._task: asyncio.Task | None = None
+        # 统计指标
+        self.committed_rows = 0
+        self.batches = 0
+        self.failed_rows = 0
+        self.reconnects = 0
+
+    async def start(self):
+        await self._open()
+        self._task = asyncio.create_task(self._run())
+
+    async def _open(self):
+        self._db = await aiosqlite.connect(self.path)
+        await configure_connection(self._db)
+        await self._db.execute(f"PRAGMA synchronous={self.synchronous}")
+
+    async def _reopen(self):
+        """回滚失败时连接状态未知，关闭后重新打开写入连接"""
+        self.reconnects += 1
+        db, self._db = self._db, None
+        if db is not None:
+            try:
+                await db.close()
+            except Exception:
+                logger.exception("Failed to close write-behind connection")
+        try:
+            await self._open()
+        except Exception:
+            # 下一批写入时会再次失败并重试打开
+            logger.exception("Failed to reopen write-behind connection")
+
+    async def stop(self, flush: bool = FLUSH_ON_SHUTDOWN):
+        """停止写入任务；flush 为 True 时先把队列中剩余的行全部提交"""
+        if self._task is None:
+            return
+        if not flush:
+            dropped = 0
+            while not self._queue.empty():
+                _, future, _ = self._queue.get_nowait()
+                if future is not None and not future.done():
+                    future.cancel()
+                dropped += 1
+            if dropped:
+                logger.warning("Write-behind queue dropped %d pending rows on shutdown", dropped)
+
+        # 停止标记排在所有已入队的行之后
+        await self._queue.put((None, None, None))
+        await self._task
+        self._task = None
+        if self._db is not None:
+            await self._db.close()
+            self._db = None
+
+    async def submit(self, sql: str, params: tuple) -> int | None:
+        """把一行写入放入队列；队列满时等待（背压）。
+
+        durability 为 "commit" 时等待提交并返回 lastrowid，否则入队后立即返回 None。
+        """
+        return await self.submit_many([(sql, params)])
+
+    async def submit_many(self, statements: list[tuple[str, tuple]],
+                          fallback: list[tuple[str, tuple]] | None = None) -> int | None:
+        """把多条语句作为一项放入队列，它们在同一事务中提交，要么全部成功要么全部失败。
+
+        durability 为 "commit" 时只等待一次提交，返回最后一条语句的 lastrowid。
+        fallback 为该项失败后在单独事务中执行的语句，例如登记已落盘的文件以便回收。
+        """
+        if self._task is None:
+            raise RuntimeError("Write-behind queue is not running")
+        future = None
+        if self.durability == "commit":
+            future = asyncio.get_running_loop().create_future()
+        await self._queue.put((list(statements), future, fallback))
+        if future is not None:
+            return await future
+        return None
+
+    async def flush(self):
+        """等待当前已入队的所有行提交完成"""
+        if self._task is None:
+            return
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((None, future, None))
+        await future
+
+    def metrics(self) -> dict:
+        return {
+            "queued": self._queue.qsize(),
+            "max_queue_size": self._queue.maxsize,
+            "batch_rows": self.batch_rows,
+            "interval_ms": int(self.interval * 1000),
+            "durability": self.durability,
+            "synchronous": self.synchronous,
+            "committed_rows": self.committed_rows,
+            "batches": self.batches,
+            "failed_rows": self.failed_rows,
+            "reconnects": self.reconnects,
+        }
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            batch = []
+            flushes = []
+            item = await self._queue.get()
+            deadline = loop.time() + self.interval
+
+            while True:
+                statements, future, _ = item
+                if statements is not None:
+                    batch.append(item)
+                elif future is not None:
+                    flushes.append(future)
+                    break
+                else:
+                    stopping = True
+                    break
+
+                if len(batch) >= self.batch_rows:
+                    break
+                try:
+                    item = self._queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        item = await asyncio.wait_for(self._queue.get(), timeout)
+                    except asyncio.TimeoutError:
+                        break
+
+            if batch:
+                try:
+                    await self._commit(batch)
+                except Exception as e:
+                    # 写入任务不能退出，否则之后入队的行都不会再被处理
+                    logger.exception("Write-behind batch of %d rows failed", len(batch))
+                    self.failed_rows += len(batch)
+                    self._fail(batch, e)
+            for future in flushes:
+                if not future.done():
+                    future.set_result(None)
+
+    async def _commit(self, batch: list):
+        try:
+            results = await self._execute(batch)
+            await self._db.commit()
+        except Exception as e:
+            logger.exception("Write-behind batch of %d rows failed, retrying row by row", len(batch))
+            if not await self._rollback():
+                # 连接已不可用，整批失败并重新打开连接
+                self.failed_rows += len(batch)
+                self._fail(batch, e)
+                await self._reopen()
+                return
+            # 整批失败时逐行重试，避免一行坏数据拖垮整批
+            for index, item in enumerate(batch):
+                try:
+                    results = await self._execute([item])
+                    await self._db.commit()
+                except Exception as e:
+                    if not await self._rollback():
+                        self.failed_rows += len(batch) - index
+                        self._fail(batch[index:], e)
+                        await self._reopen()
+                        return
+                    self.failed_rows += 1
+                    self._fail([item], e)
+                    await self._run_fallback(item)
+                    continue
+                self.committed_rows += 1
+                self._resolve(results)
+            self.batches += 1
+            return
+
+        self.batches += 1
+        self.committed_rows += len(batch)
+        self._resolve(results)
+
+    async def _rollback(self) -> bool:
+        """回滚当前事务，失败时返回 False"""
+        try:
+            await self._db.rollback()
+            return True
+        except Exception:
+            logger.exception("Write-behind rollback failed")
+            return False
+
+    async def _run_fallback(self, item):
+        fallback = item[2]
+        if not fallback:
+            return
+        try:
+            for sql, params in fallback:
+                await self._db.execute(sql, params)
+            await self._db.commit()
+        except Exception:
+            logger.exception("Write-behind fallback statements failed")
+            await self._rollback()
+
+    @staticmethod
+    def _merge_key(item) -> str | None:
+        """只有一条语句、不需要返回 id 的项可以与相邻的同一 SQL 合并"""
+        statements, future, _ = item
+        if future is None and len(statements) == 1:
+            return statements[0][0]
+        return None
+
+    async def _execute(self, batch: list) -> list:
+        """执行一批写入，返回 (future, lastrowid) 列表，提交成功后再通知等待者"""
+        results = []
+        # 相邻且 SQL 相同、不需要返回 id 的行合并为 executemany
+        for sql, group in groupby(batch, key=self._merge_key):
+            group = list(group)
+            if sql is not None:
+                await self._db.executemany(sql, [statements[0][1] for statements, _, _ in group])
+                continue
+            for statements, future, _ in group:
+                rowid = None
+                for statement, params in statements:
+                    async with self._db.execute(statement, params) as cursor:
+                        rowid = cursor.lastrowid
+                if future is not None:
+                    results.append((future, rowid))
+        return results
+
+    @staticmethod
+    def _resolve(results: list):
+        for future, rowid in results:
+            if not future.done():
+                future.set_result(rowid)
+
+    @staticmethod
+    def _fail(batch: list, error: Exception):
+        for _, future, _ in batch:
+            if future is not None and not future.done():
+                future.set_exception(error)
+            else:
+                logger.error("Write-behind row dropped: %s", error)
+
+queue: WriteBehindQueue | None = None
+
+
+def get_writer() -> WriteBehindQueue | None:
+    """写后模式开启时返回写入队列，否则返回 None"""
+    return queue
+
+
+async def start_writer():
+    global queue
+    if not WRITE_BEHIND:
+        return None
+    queue = WriteBehindQueue()
+    await queue.start()
+    return queue
+
+
+async def stop_writer(flush: bool = FLUSH_ON_SHUTDOWN):
+    global queue
+    if queue is not None:
+        await queue.stop(flush)
+        queue = None
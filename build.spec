@@ -30,6 +30,7 @@ a = Analysis(
         'app.api.logs',
         'app.api.shell',
         'app.api.files',
+        'app.api.system',
     ],
     hookspath=[],
     hooksconfig={},
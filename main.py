@@ -1,3 +1,4 @@
+import multiprocessing
 import os
 import sys
 import uvicorn
@@ -13,6 +14,9 @@ def resource_path(relative_path):
 app = create_app()
 
 if __name__ == "__main__":
+    # 打包后的程序启动搜索子进程时需要
+    multiprocessing.freeze_support()
+
     # 设置工作目录
     if getattr(sys, 'frozen', False):
         os.chdir(os.path.dirname(sys.executable))
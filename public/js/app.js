@@ -47,6 +47,8 @@ function logSystem() {
         currentPointIndex: {},
         statsSearchQuery: '',
         statsSearchTimeout: null,
+        logStream: null,
+        logStreamQuery: '',
 
         init() {
             if (!this.isInitialized) {
@@ -493,6 +495,33 @@ function logSystem() {
             this.total = data.total;
             this.page = data.page;
             this.limit = data.limit;
+            this.watchLogs();
+        },
+
+        // 订阅新日志的实时推送，搜索条件变化时重新订阅
+        watchLogs() {
+            if (this.logStream && this.logStreamQuery === this.searchQuery) {
+                return;
+            }
+            if (this.logStream) {
+                this.logStream.close();
+            }
+            const params = new URLSearchParams();
+            if (this.searchQuery) {
+                params.set('search', this.searchQuery);
+            }
+            this.logStreamQuery = this.searchQuery;
+            this.logStream = new EventSource(`/api/logs/tail?${params}`);
+            this.logStream.addEventListener('log', (event) => {
+                this.total += 1;
+                // 只在第一页插入新日志，其他页只更新总数
+                if (this.page === 1) {
+                    this.logs.unshift(JSON.parse(event.data));
+                    if (this.logs.length > this.limit) {
+                        this.logs.pop();
+                    }
+                }
+            });
         },
 
         async deleteLogsBefore() {
@@ -507,7 +536,7 @@ function logSystem() {
                     });
                     const result = await response.json();
                     if (response.ok && result.code === 0) {
-                        this.showNotification(`成功删除 ${result.count} 条日志。`, 'success');
+                        this.showNotification(`已开始在后台删除日志（任务 ${result.job_id}）。`, 'success');
                         this.fetchLogs();
                     } else {
                         this.showNotification('删除日志失败: ' + result.error, 'error');
@@ -570,7 +599,7 @@ function logSystem() {
                     });
                     const result = await response.json();
                     if (response.ok && result.code === 0) {
-                        this.showNotification(`成功删除 ${result.count} 条记录。`, 'success');
+                        this.showNotification(`已开始在后台删除统计数据（任务 ${result.job_id}）。`, 'success');
                         this.fetchStats();
                     } else {
                         this.showNotification('删除统计数据失败: ' + result.error, 'error');
@@ -0,0 +1,68 @@
+import math
+import random
+
+import pytest
+
+from app import downsample
+from app.downsample import lttb_indices, lttb_indices_multi
+
+
+def python_indices(monkeypatch, x, series, threshold):
+    """强制使用纯 Python 实现"""
+    with monkeypatch.context() as m:
+        m.setattr(downsample, "np", None)
+        return lttb_indices_multi(x, series, threshold)
+
+
+def test_small_input_returns_all_points():
+    assert lttb_indices([1, 2, 3], [5, 6, 7], 10) == [0, 1, 2]
+    assert lttb_indices(list(range(10)), list(range(10)), 2) == list(range(10))
+
+
+@pytest.mark.parametrize("threshold", [3, 4, 10, 57, 100, 999])
+def test_returns_threshold_points_including_ends(threshold):
+    x = list(range(1000))
+    y = [math.sin(i / 20) for i in x]
+    indices = lttb_indices(x, y, threshold)
+    assert len(indices) == threshold
+    assert indices[0] == 0 and indices[-1] == len(x) - 1
+    assert indices == sorted(set(indices))
+
+
+def test_keeps_spike():
+    x = list(range(500))
+    y = [0.0] * 500
+    y[250] = 100.0
+    assert 250 in lttb_indices(x, y, 20)
+
+
+def test_constant_series_is_normalized_to_zero():
+    assert downsample._normalize([3, 3, 3]) == [0.0, 0.0, 0.0]
+    assert downsample._normalize([1, 2, 3]) == [0.0, 0.5, 1.0]
+
+
+@pytest.mark.skipif(downsample.np is None, reason="numpy is not installed")
+@pytest.mark.parametrize("seed", range(5))
+@pytest.mark.parametrize("threshold", [3, 5, 50, 333])
+def test_numpy_matches_python(monkeypatch, seed, threshold):
+    rng = random.Random(seed)
+    n = rng.randint(threshold + 1, 3000)
+    x = sorted(rng.sample(range(10 * n), n))
+    series = [
+        [rng.randint(0, 60) for _ in range(n)],
+        [rng.randint(0, 10**9) for _ in range(n)],
+        [rng.random() for _ in range(n)],
+    ]
+    assert lttb_indices_multi(x, series, threshold) == python_indices(monkeypatch, x, series, threshold)
+
+
+@pytest.mark.parametrize("use_numpy", [True, False])
+def test_constant_series_does_not_change_selection(monkeypatch, use_numpy):
+    if use_numpy and downsample.np is None:
+        pytest.skip("numpy is not installed")
+    if not use_numpy:
+        monkeypatch.setattr(downsample, "np", None)
+    rng = random.Random(1)
+    x = list(range(300))
+    y = [rng.random() for _ in x]
+    assert lttb_indices_multi(x, [[7] * 300, y], 40) == lttb_indices(x, y, 40)
@@ -0,0 +1,127 @@
+from email.utils import formatdate
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from starlette.requests import Request
+
+from app.api import files
+from app.api.files import file_etag, is_not_modified
+from app.search import collect_files
+
+CONTENT = bytes(range(256)) * 16
+
+
+def make_request(headers: dict) -> Request:
+    return Request({
+        "type": "http",
+        "method": "GET",
+        "path": "/",
+        "headers": [(key.lower().encode(), value.encode()) for key, value in headers.items()],
+    })
+
+
+@pytest.fixture
+def artifact(tmp_path, monkeypatch):
+    monkeypatch.setattr(files, "base_path", tmp_path)
+    path = tmp_path / "build.bin"
+    path.write_bytes(CONTENT)
+    return path
+
+
+@pytest.fixture
+def client(artifact):
+    app = FastAPI()
+    app.include_router(files.router, prefix="/api/files")
+    with TestClient(app) as client:
+        yield client
+
+
+def test_etag_changes_with_content(artifact):
+    etag = file_etag(artifact.stat())
+    assert etag.startswith('"') and etag.endswith('"')
+    assert file_etag(artifact.stat()) == etag
+
+    artifact.write_bytes(CONTENT + b"more")
+    assert file_etag(artifact.stat()) != etag
+
+
+def test_if_none_match(artifact):
+    stat = artifact.stat()
+    etag = file_etag(stat)
+    assert is_not_modified(make_request({"If-None-Match": etag}), etag, stat)
+    assert is_not_modified(make_request({"If-None-Match": f'"other", W/{etag}'}), etag, stat)
+    assert is_not_modified(make_request({"If-None-Match": "*"}), etag, stat)
+    assert not is_not_modified(make_request({"If-None-Match": '"other"'}), etag, stat)
+    # 有 If-None-Match 时忽略 If-Modified-Since
+    assert not is_not_modified(make_request({
+        "If-None-Match": '"other"',
+        "If-Modified-Since": formatdate(stat.st_mtime + 60, usegmt=True),
+    }), etag, stat)
+
+
+def test_if_modified_since(artifact):
+    stat = artifact.stat()
+    etag = file_etag(stat)
+    assert is_not_modified(make_request({"If-Modified-Since": formatdate(stat.st_mtime, usegmt=True)}), etag, stat)
+    assert not is_not_modified(make_request({"If-Modified-Since": formatdate(stat.st_mtime - 60, usegmt=True)}), etag, stat)
+    assert not is_not_modified(make_request({"If-Modified-Since": "garbage"}), etag, stat)
+    assert not is_not_modified(make_request({}), etag, stat)
+
+
+def test_download_conditional(client, artifact):
+    response = client.get("/api/files/download/build.bin")
+    assert response.status_code == 200
+    assert response.content == CONTENT
+    etag = response.headers["etag"]
+    assert etag == file_etag(artifact.stat())
+
+    response = client.get("/api/files/download/build.bin", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.content == b""
+
+
+def test_download_range(client, artifact):
+    response = client.get("/api/files/download/build.bin", headers={"Range": "bytes=100-199"})
+    assert response.status_code == 206
+    assert response.content == CONTENT[100:200]
+    assert response.headers["content-range"] == f"bytes 100-199/{len(CONTENT)}"
+
+    response = client.get("/api/files/download/build.bin", headers={"Range": "bytes=-10"})
+    assert response.status_code == 206
+    assert response.content == CONTENT[-10:]
+
+
+def test_download_if_range(client, artifact):
+    etag = file_etag(artifact.stat())
+    response = client.get("/api/files/download/build.bin", headers={"Range": "bytes=0-9", "If-Range": etag})
+    assert response.status_code == 206
+    assert response.content == CONTENT[:10]
+
+    # 文件已变化：忽略 Range，返回完整内容
+    response = client.get("/api/files/download/build.bin", headers={"Range": "bytes=0-9", "If-Range": '"stale"'})
+    assert response.status_code == 200
+    assert response.content == CONTENT
+
+
+def test_download_outside_base_path(client):
+    assert client.get("/api/files/download/..%2Fsecret").status_code == 403
+    assert client.get("/api/files/download/missing.bin").status_code == 404
+
+
+def test_search_skips_symlinks_outside_base(tmp_path):
+    base = tmp_path / "output"
+    outside = tmp_path / "secret"
+    (base / "logs").mkdir(parents=True)
+    outside.mkdir()
+    (outside / "passwd.txt").write_text("Error outside\n")
+    (base / "logs" / "a.txt").write_text("Error inside\n")
+    (base / "link.txt").symlink_to(outside / "passwd.txt")
+    (base / "linked_dir").symlink_to(outside, target_is_directory=True)
+    (base / "logs_again").symlink_to(base / "logs", target_is_directory=True)
+    (base / "logs" / "loop").symlink_to(base, target_is_directory=True)
+
+    found = collect_files(base / "logs", files.is_text_file, base=base)
+    assert [path.name for path, _ in found] == ["a.txt"]
+    found = collect_files(base, files.is_text_file, base=base)
+    assert sorted(path.resolve() for path, _ in found) == [(base / "logs" / "a.txt").resolve()]
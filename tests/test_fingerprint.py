@@ -0,0 +1,29 @@
+from app.fingerprint import log_fingerprint, normalize
+
+
+def test_normalize_variable_parts():
+    assert normalize(None) == ""
+    assert normalize("at 0x7f3a2c10 +0x1a") == "at 0x? +0x?"
+    assert normalize("id 3f2504e0-4f89-11d3-9a0c-0305e82c3301 done") == "id <guid> done"
+    assert normalize("hash deadbeefcafe") == "hash <hex>"
+    assert normalize("line 42,  frame\t7 \n") == "line 0, frame 0"
+
+
+def test_same_error_same_fingerprint():
+    first = log_fingerprint(
+        "NullReferenceException at 0x0001f3a0",
+        "Player.Update () (at Assets/Player.cs:120)\nGame.Tick () (at Assets/Game.cs:33)"
+    )
+    second = log_fingerprint(
+        "NullReferenceException at 0x00ab0010",
+        "Player.Update () (at Assets/Player.cs:121)\n  Game.Tick () (at Assets/Game.cs:35)"
+    )
+    assert first == second
+    assert len(first) == 40
+
+
+def test_different_errors_differ():
+    assert log_fingerprint("Timeout", "A.B ()") != log_fingerprint("Timeout", "A.C ()")
+    # 消息和堆栈之间有分隔，内容不会互相串位
+    assert log_fingerprint("a b", "") != log_fingerprint("a", "b")
+    assert log_fingerprint(None, None) == log_fingerprint("", "")
@@ -0,0 +1,70 @@
+import asyncio
+
+import pytest
+
+from app.ingest import iter_multipart
+
+BOUNDARY = "----wefast-test"
+CONTENT_TYPE = f"multipart/form-data; boundary={BOUNDARY}"
+
+
+def build_body(parts):
+    body = b""
+    for headers, data in parts:
+        body += f"--{BOUNDARY}\r\n".encode()
+        for name, value in headers.items():
+            body += f"{name}: {value}\r\n".encode()
+        body += b"\r\n" + data + b"\r\n"
+    return body + f"--{BOUNDARY}--\r\n".encode()
+
+
+def parse(body, chunk_size, content_type=CONTENT_TYPE):
+    """按 chunk_size 切块喂给解析器，把 data 事件合并成每个部分的完整内容"""
+    async def chunks():
+        for offset in range(0, len(body), chunk_size):
+            yield body[offset:offset + chunk_size]
+
+    async def collect():
+        parts = []
+        async for kind, value in iter_multipart(chunks(), content_type):
+            if kind == "part":
+                parts.append([value, b"", False])
+            elif kind == "data":
+                parts[-1][1] += value
+            else:
+                parts[-1][2] = True
+        return parts
+
+    return asyncio.run(collect())
+
+
+PARTS = [
+    ({"Content-Disposition": 'form-data; name="data"', "Content-Type": "application/json"},
+     b'{"login_id": 1, "fps": 60}'),
+    ({"Content-Disposition": 'form-data; name="pic"; filename="shot.jpg"', "Content-Type": "image/jpeg"},
+     bytes(range(256)) * 40 + b"\r\n--not-a-boundary\r\n"),
+    ({"Content-Disposition": 'form-data; name="note"'}, b""),
+]
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 64, 1 << 20])
+def test_parses_parts_across_chunk_boundaries(chunk_size):
+    parts = parse(build_body(PARTS), chunk_size)
+    assert [info for info, _, _ in parts] == [
+        {"name": "data", "filename": None, "content_type": "application/json"},
+        {"name": "pic", "filename": "shot.jpg", "content_type": "image/jpeg"},
+        {"name": "note", "filename": None, "content_type": None},
+    ]
+    assert [data for _, data, _ in parts] == [data for _, data in PARTS]
+    assert all(ended for _, _, ended in parts)
+
+
+def test_missing_boundary():
+    with pytest.raises(ValueError):
+        parse(build_body(PARTS), 64, content_type="multipart/form-data")
+
+
+def test_truncated_body():
+    body = build_body(PARTS)
+    with pytest.raises(ValueError):
+        parse(body[:len(body) // 2], 64)
@@ -0,0 +1,99 @@
+import pytest
+
+from app import lineindex
+from app.lineindex import read_lines
+
+
+@pytest.fixture(autouse=True)
+def index_dir(tmp_path, monkeypatch):
+    """索引文件写到临时目录，并使用很小的检查点间隔以覆盖多个块"""
+    monkeypatch.setattr(lineindex, "LINE_INDEX_DIR", tmp_path / "line_index")
+    monkeypatch.setattr(lineindex, "LINE_INDEX_BLOCK", 64)
+    monkeypatch.setattr(lineindex, "_cache", type(lineindex._cache)())
+    return tmp_path / "line_index"
+
+
+def make_lines(start, count):
+    return [f"line {i} " + "x" * (i % 17) for i in range(start, start + count)]
+
+
+def test_reads_pages(tmp_path):
+    path = tmp_path / "a.log"
+    lines = make_lines(0, 500)
+    path.write_text("\n".join(lines) + "\n")
+
+    page = read_lines(path, 0, 10)
+    assert page["lines"] == lines[:10]
+    assert page["total_lines"] == 500
+    assert read_lines(path, 123, 7)["lines"] == lines[123:130]
+    assert read_lines(path, 495, 10)["lines"] == lines[495:]
+    assert read_lines(path, 600, 10)["lines"] == []
+
+
+def test_incremental_refresh_on_append(tmp_path):
+    path = tmp_path / "a.log"
+    lines = make_lines(0, 200)
+    path.write_text("\n".join(lines) + "\n")
+    assert read_lines(path, 0, 1)["total_lines"] == 200
+    indexed = lineindex._cache[path].indexed_size
+
+    # 追加一个未完成的行，随后补全
+    more = make_lines(200, 100)
+    with open(path, "a") as f:
+        f.write("\n".join(more))
+    page = read_lines(path, 290, 20)
+    assert page["total_lines"] == 300
+    assert page["lines"] == more[90:]
+    assert lineindex._cache[path].indexed_size > indexed
+
+    with open(path, "a") as f:
+        f.write(" done\nlast\n")
+    page = read_lines(path, 299, 5)
+    assert page["lines"] == [more[-1] + " done", "last"]
+    assert page["total_lines"] == 301
+
+
+def test_rebuilds_after_rewrite(tmp_path):
+    path = tmp_path / "a.log"
+    path.write_text("\n".join(make_lines(0, 300)) + "\n")
+    read_lines(path, 0, 1)
+
+    lines = ["rewritten " + line for line in make_lines(0, 50)]
+    path.write_text("\n".join(lines) + "\n")
+    page = read_lines(path, 40, 20)
+    assert page["total_lines"] == 50
+    assert page["lines"] == lines[40:]
+
+
+def test_saved_index_is_reused(tmp_path, index_dir):
+    path = tmp_path / "a.log"
+    lines = make_lines(0, 300)
+    path.write_text("\n".join(lines) + "\n")
+    read_lines(path, 0, 1)
+    assert any(index_dir.iterdir())
+
+    lineindex._cache.clear()
+    loaded = lineindex.LineIndex.load(path)
+    assert loaded.line_count == 300
+    assert read_lines(path, 250, 3)["lines"] == lines[250:253]
+
+
+def test_empty_file(tmp_path):
+    path = tmp_path / "empty.log"
+    path.write_bytes(b"")
+    assert read_lines(path, 0, 10) == {
+        "lines": [], "total_lines": 0, "size": 0, "clipped": 0, "truncated": False
+    }
+
+
+def test_clips_long_lines_and_caps_page(tmp_path, monkeypatch):
+    monkeypatch.setattr(lineindex, "LINE_MAX_BYTES", 100)
+    monkeypatch.setattr(lineindex, "PAGE_MAX_BYTES", 250)
+    path = tmp_path / "long.log"
+    path.write_text("short\n" + "y" * 1000 + "\n" + "z" * 90 + "\n" + "w" * 90 + "\nend\n")
+
+    page = read_lines(path, 0, 10)
+    assert page["lines"] == ["short", "y" * 100, "z" * 90, "w" * 90]
+    assert page["clipped"] == 1
+    assert page["truncated"] is True
+    assert read_lines(path, 4, 10)["lines"] == ["end"]
@@ -0,0 +1,68 @@
+import pytest
+from fastapi import HTTPException
+
+from app.pagination import decode_cursor, encode_cursor, page_cursors, resolve_keyset
+
+
+@pytest.mark.parametrize("direction", ["before", "after"])
+@pytest.mark.parametrize("row_id", [0, 1, 42, 2**53])
+def test_cursor_round_trip(direction, row_id):
+    cursor = encode_cursor(direction, row_id)
+    assert "=" not in cursor
+    assert decode_cursor(cursor) == (direction, row_id)
+
+
+@pytest.mark.parametrize("cursor", [
+    "",
+    "not base64!",
+    encode_cursor("sideways", 1),
+    "eyJkIjoiYmVmb3JlIn0",  # {"d":"before"}，缺少 id
+])
+def test_invalid_cursor(cursor):
+    with pytest.raises(HTTPException) as e:
+        decode_cursor(cursor)
+    assert e.value.status_code == 400
+
+
+def test_resolve_keyset():
+    assert resolve_keyset(None, None, None) == (None, None)
+    assert resolve_keyset(5, None, None) == ("before", 5)
+    assert resolve_keyset(None, 7, None) == ("after", 7)
+    assert resolve_keyset(None, None, encode_cursor("after", 9)) == ("after", 9)
+    with pytest.raises(HTTPException):
+        resolve_keyset(1, 2, None)
+    with pytest.raises(HTTPException):
+        resolve_keyset(1, None, encode_cursor("before", 3))
+
+
+def rows(*ids):
+    return [{"id": row_id} for row_id in ids]
+
+
+def test_page_cursors_first_page():
+    next_cursor, prev_cursor = page_cursors(rows(10, 9, 8), None, True)
+    assert decode_cursor(next_cursor) == ("before", 8)
+    assert prev_cursor is None
+
+    assert page_cursors(rows(3, 2, 1), None, False) == (None, None)
+    assert page_cursors([], None, True) == (None, None)
+
+
+def test_page_cursors_offset_page_has_newer():
+    _, prev_cursor = page_cursors(rows(5, 4), None, False, page=2)
+    assert decode_cursor(prev_cursor) == ("after", 5)
+
+
+def test_page_cursors_before():
+    next_cursor, prev_cursor = page_cursors(rows(7, 6), "before", False)
+    assert next_cursor is None
+    assert decode_cursor(prev_cursor) == ("after", 7)
+
+
+def test_page_cursors_after():
+    next_cursor, prev_cursor = page_cursors(rows(12, 11), "after", False)
+    assert decode_cursor(next_cursor) == ("before", 11)
+    assert prev_cursor is None
+
+    _, prev_cursor = page_cursors(rows(12, 11), "after", True)
+    assert decode_cursor(prev_cursor) == ("after", 12)